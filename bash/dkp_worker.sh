@@ -0,0 +1,3 @@
+#!/bin/bash
+
+python3 "${XL_IDP_ROOT_DKP}/scripts/dkp_worker.py" "$@"
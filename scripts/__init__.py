@@ -1,11 +1,16 @@
 import os
+import json
+import time
+import smtplib
 import requests
 from requests import Response
 from dotenv import load_dotenv
-from notifiers import get_notifier
+from email.message import EmailMessage
+from notifications import get_dispatcher
 from clickhouse_connect import get_client
 from clickhouse_connect.driver import Client
 from clickhouse_connect.driver.query import Sequence
+from typing import Optional
 
 os.environ['XL_IDP_ROOT_DKP'] = "."
 
@@ -103,41 +108,203 @@ class MissingEnvironmentVariable(Exception):
     pass
 
 
-client: Client = get_client(
-    host=get_my_env_var('HOST'),
-    database=get_my_env_var('DATABASE'),
-    username=get_my_env_var('USERNAME_DB'),
-    password=get_my_env_var('PASSWORD')
-)
-reference_dkp: Sequence = client.query("SELECT * FROM reference_dkp").result_rows
+class MissingReferenceSnapshot(Exception):
+    pass
 
-SHEETS_NAME: list = [column[2] for column in reference_dkp if column[0] == "Наименования листов"]
-DKP_NAMES: dict = {column[2]: column[3] for column in reference_dkp if column[0] == "Наименования в файле"}
 
-COLUMN_NAMES: dict = group_columns(
-    reference=reference_dkp,
-    group_index=3,
-    column_index=2,
-    filter_key=0,
-    filter_value="Наименования столбцов"
+REFERENCE_CACHE_PATH: str = os.environ.get(
+    'DKP_REFERENCE_CACHE', f"{os.environ.get('XL_IDP_ROOT_DKP')}/cache/reference_dkp.json"
 )
+REFERENCE_CACHE_TTL: int = int(os.environ.get('DKP_REFERENCE_TTL', 3600))
+OFFLINE: bool = os.environ.get('DKP_OFFLINE', '').lower() in {'1', 'true', 'yes'}
 
-BLOCK_NAMES: dict = group_columns(
-    reference=reference_dkp,
-    group_index=3,
-    column_index=2,
-    filter_key=0,
-    filter_value="Наименования блоков"
-)
+_client: Optional[Client] = None
+
+
+def get_clickhouse_client() -> Client:
+    """
+    Returns the ClickHouse client, creating it on the first call.
+
+    :return: The ClickHouse client.
+    """
+    global _client
+    if _client is None:
+        _client = get_client(
+            host=get_my_env_var('HOST'),
+            database=get_my_env_var('DATABASE'),
+            username=get_my_env_var('USERNAME_DB'),
+            password=get_my_env_var('PASSWORD')
+        )
+    return _client
+
+
+def reset_clickhouse_client() -> None:
+    """
+    Forgets the ClickHouse client, so the next call of get_clickhouse_client creates a new one.
+
+    A forked process must not share the connections of its parent, so this is called in every worker process.
+    :return: None
+    """
+    global _client
+    _client = None
+
+
+def get_reference_version(client: Client) -> list:
+    """
+    Returns a cheap fingerprint of the reference_dkp table: the number of rows and the sum of the row hashes.
+
+    :param client: The ClickHouse client.
+    :return: A list of the row count and the checksum.
+    """
+    return [int(value) for value in client.query(
+        "SELECT count(), sum(cityHash64(*)) FROM reference_dkp"
+    ).result_rows[0]]
+
+
+def read_reference_snapshot() -> Optional[dict]:
+    """
+    Reads the local snapshot of the reference_dkp table.
+
+    :return: A dictionary with the keys `version`, `saved_at` and `rows`, or None if there is no snapshot.
+    """
+    try:
+        with open(REFERENCE_CACHE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_reference_snapshot(version: list, rows: Sequence) -> dict:
+    """
+    Writes the local snapshot of the reference_dkp table.
+
+    The snapshot is written to a temporary file first and then renamed,
+    so parallel processes never read a half-written snapshot.
+
+    :param version: The fingerprint of the table from get_reference_version.
+    :param rows: The rows of the table.
+    :return: The written snapshot.
+    """
+    snapshot: dict = {'version': version, 'saved_at': time.time(), 'rows': [list(row) for row in rows]}
+    os.makedirs(os.path.dirname(REFERENCE_CACHE_PATH) or '.', exist_ok=True)
+    tmp_path: str = f"{REFERENCE_CACHE_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, ensure_ascii=False)
+    os.replace(tmp_path, REFERENCE_CACHE_PATH)
+    return snapshot
+
+
+def load_reference_snapshot() -> dict:
+    """
+    Loads the reference_dkp table, using the local snapshot whenever it is still valid.
+
+    The snapshot is used as is while it is younger than DKP_REFERENCE_TTL seconds.
+    After that, only the fingerprint of the table is queried, and the full table is downloaded
+    only if the fingerprint has changed. In offline mode (DKP_OFFLINE=1) ClickHouse is never queried.
+    If ClickHouse is unavailable, an existing snapshot is used regardless of its age.
+
+    :return: A dictionary with the keys `version`, `saved_at` and `rows`.
+    :raises MissingReferenceSnapshot: If there is no snapshot and ClickHouse cannot be used.
+    """
+    snapshot: Optional[dict] = read_reference_snapshot()
+    if OFFLINE:
+        if snapshot is None:
+            raise MissingReferenceSnapshot(f"Offline mode, but {REFERENCE_CACHE_PATH} does not exist")
+        return snapshot
+    if snapshot is not None and time.time() - snapshot['saved_at'] < REFERENCE_CACHE_TTL:
+        return snapshot
+    try:
+        client: Client = get_clickhouse_client()
+        version: list = get_reference_version(client)
+        if snapshot is not None and snapshot['version'] == version:
+            return write_reference_snapshot(version, snapshot['rows'])
+        return write_reference_snapshot(version, client.query("SELECT * FROM reference_dkp").result_rows)
+    except Exception as exception:
+        if snapshot is None:
+            raise MissingReferenceSnapshot(f"Can't load reference_dkp: {exception}") from exception
+        print(f"Ошибка при загрузке reference_dkp, используется локальная копия: {exception}")
+        return snapshot
+
+
+def build_references(snapshot: dict) -> dict:
+    """
+    Builds all names that depend on the reference_dkp table.
+
+    :param snapshot: The snapshot from load_reference_snapshot.
+    :return: A dictionary where the keys are the names (SHEETS_NAME, COLUMN_NAMES, ...) and the values are the tables.
+    """
+    reference: list = [tuple(row) for row in snapshot['rows']]
+    return dict(
+        reference_dkp=reference,
+        REFERENCE_VERSION=":".join(map(str, snapshot['version'])),
+        SHEETS_NAME=[column[2] for column in reference if column[0] == "Наименования листов"],
+        DKP_NAMES={column[2]: column[3] for column in reference if column[0] == "Наименования в файле"},
+        COLUMN_NAMES=group_columns(
+            reference=reference,
+            group_index=3,
+            column_index=2,
+            filter_key=0,
+            filter_value="Наименования столбцов"
+        ),
+        BLOCK_NAMES=group_columns(
+            reference=reference,
+            group_index=3,
+            column_index=2,
+            filter_key=0,
+            filter_value="Наименования блоков"
+        ),
+        BLOCK_TABLE_COLUMNS=group_nested_columns(
+            reference=reference,
+            block_index=0,
+            group_index=3,
+            column_index=2,
+            filter_key=1,
+            filter_value="Столбцы таблиц в блоках",
+        ),
+        COLUMN_TYPES={column[3]: column[2] for column in reference if column[0] == "Типы столбцов"}
+    )
+
+
+class References(object):
+    """
+    The tables built from reference_dkp (see build_references), loaded on the first use.
+
+    The tables are kept in the process and loaded again with load_reference_snapshot every DKP_REFERENCE_TTL
+    seconds, so a resident process sees the changes of reference_dkp without a restart. They are rebuilt
+    only if the version of the table has changed.
+    """
+    def __init__(self, ttl: float):
+        self.ttl: float = ttl
+        self.tables: Optional[dict] = None
+        self.loaded_at: float = 0.0
+
+    def get(self, name: str):
+        """
+        Returns a table built from reference_dkp, loading it first if it is not loaded or older than the TTL.
+
+        :param name: The name of the table: reference_dkp, REFERENCE_VERSION, SHEETS_NAME, DKP_NAMES,
+                     COLUMN_NAMES, BLOCK_NAMES, BLOCK_TABLE_COLUMNS or COLUMN_TYPES.
+        :return: The table.
+        :raises MissingReferenceSnapshot: If there is no snapshot and ClickHouse cannot be used.
+        """
+        if self.tables is None or time.monotonic() - self.loaded_at >= self.ttl:
+            self.refresh()
+        return self.tables[name]
+
+    def refresh(self) -> None:
+        """
+        Loads the reference_dkp table and rebuilds the tables if its version has changed.
+        :return: None
+        """
+        snapshot: dict = load_reference_snapshot()
+        version: str = ":".join(map(str, snapshot['version']))
+        if self.tables is None or self.tables['REFERENCE_VERSION'] != version:
+            self.tables = build_references(snapshot)
+        self.loaded_at = time.monotonic()
+
+
+references: References = References(REFERENCE_CACHE_TTL)
 
-BLOCK_TABLE_COLUMNS: dict = group_nested_columns(
-    reference=reference_dkp,
-    block_index=0,
-    group_index=3,
-    column_index=2,
-    filter_key=1,
-    filter_value="Столбцы таблиц в блоках",
-)
 
 DATE_FORMATS: list = [
     "%m/%d/%y",
@@ -150,34 +317,68 @@ DATE_FORMATS: list = [
 
 MONTH_NAMES: list = ["янв", "фев", "мар", "апр", "май", "июн", "июл", "авг", "сен", "окт", "ноя", "дек"]
 
-def send_email_notifiers(message: str, subject: str = "Уведомление от системы экспорта"):
+TELEGRAM_API_URL: str = os.environ.get('TELEGRAM_API_URL', "https://api.telegram.org")
+EMAIL_HOST: str = os.environ.get('EMAIL_HOST', "smtp.mail.ru")
+EMAIL_PORT: int = int(os.environ.get('EMAIL_PORT', 587))
+NOTIFY_TIMEOUT: float = float(os.environ.get('DKP_NOTIFY_TIMEOUT', 10))
+OUTBOX_PATH: str = os.environ.get('DKP_OUTBOX', f"{os.environ.get('XL_IDP_ROOT_DKP')}/outbox")
+METRICS_PATH: str = os.environ.get('DKP_METRICS_DIR', f"{os.environ.get('XL_IDP_ROOT_DKP')}/metrics")
+METRICS_KEEP_FILES: int = int(os.environ.get('DKP_METRICS_KEEP_FILES', 200))
+DEDUP_INDEX_PATH: str = os.environ.get(
+    'DKP_DEDUP_INDEX', f"{os.environ.get('XL_IDP_ROOT_DKP')}/cache/converted_files.json"
+)
+DEDUP_STORE_PATH: str = os.environ.get('DKP_DEDUP_STORE', f"{os.environ.get('XL_IDP_ROOT_DKP')}/cache/outputs")
+DEDUP_KEEP_ENTRIES: int = int(os.environ.get('DKP_DEDUP_KEEP', 1000))
+SNAPSHOT_PATH: str = os.environ.get('DKP_SNAPSHOT_DIR', f"{os.environ.get('XL_IDP_ROOT_DKP')}/cache/snapshots")
+# The cache of the layouts of the tables is off by default, DKP_LAYOUT_CACHE_KEEP > 0 turns it on
+LAYOUT_CACHE_KEEP_ENTRIES: int = int(os.environ.get('DKP_LAYOUT_CACHE_KEEP', 0))
+ERROR_REPORT_PATH: str = os.environ.get('DKP_ERROR_REPORTS', f"{os.environ.get('XL_IDP_ROOT_DKP')}/errors")
+
+
+def send_email_notifiers(message: str, subject: str = "Уведомление от системы экспорта") -> None:
     """
     Отправка email через Mail.ru
     """
-    try:
-        email = get_notifier('email')
-        email.notify(
-            to=get_my_env_var('RECIPIENT_EMAIL'),
-            subject=subject,
-            message=message,
-            from_=get_my_env_var('EMAIL_USER'),
-            host='smtp.mail.ru',
-            port=587,
-            username=get_my_env_var('EMAIL_USER'),
-            password=get_my_env_var('EMAIL_PASSWORD'),
-            tls=True
-        )
-        print(f"Email успешно отправлен на {get_my_env_var('RECIPIENT_EMAIL')}")
-    except Exception as e:
-        print(f"Ошибка при отправке email: {e}")
+    email: EmailMessage = EmailMessage()
+    email['Subject'] = subject
+    email['From'] = get_my_env_var('EMAIL_USER')
+    email['To'] = get_my_env_var('RECIPIENT_EMAIL')
+    email.set_content(message)
+    with smtplib.SMTP(EMAIL_HOST, EMAIL_PORT, timeout=NOTIFY_TIMEOUT) as smtp:
+        smtp.starttls()
+        smtp.login(get_my_env_var('EMAIL_USER'), get_my_env_var('EMAIL_PASSWORD'))
+        smtp.send_message(email)
+    print(f"Email успешно отправлен на {get_my_env_var('RECIPIENT_EMAIL')}")
 
-def telegram(message) -> int:
-    url: str = f"https://api.telegram.org/bot{get_my_env_var('TOKEN_TELEGRAM')}/sendMessage"
+
+def send_telegram(message: str) -> int:
+    """
+    Sends a message to the Telegram topic, raising an exception if Telegram does not accept it.
+
+    :param message: The text of the message.
+    :return: The status code of the response.
+    """
+    url: str = f"{TELEGRAM_API_URL}/bot{get_my_env_var('TOKEN_TELEGRAM')}/sendMessage"
     params: dict = {
         "chat_id": f"{get_my_env_var('CHAT_ID')}/{get_my_env_var('TOPIC')}",
         "text": message,
         "reply_to_message_id": get_my_env_var('ID')
     }
-    response: Response = requests.get(url, params=params)
-    send_email_notifiers(params.get('text'))
+    response: Response = requests.get(url, params=params, timeout=NOTIFY_TIMEOUT)
+    response.raise_for_status()
     return response.status_code
+
+
+def telegram(message) -> None:
+    """
+    Sends a notification to Telegram and by email without waiting for them.
+
+    The message is put into the outbox of the notification dispatcher, which sends it in the background.
+
+    :param message: The text of the notification.
+    :return: None
+    """
+    get_dispatcher(OUTBOX_PATH, {"telegram": send_telegram, "email": send_email_notifiers}).notify(message)
+
+
+__all__: list = [name for name in globals() if not name.startswith('_')]
@@ -1,41 +1,174 @@
 import os
+import fcntl
+import queue
+import atexit
 import logging
+import multiprocessing.util
+import itertools
+from typing import Dict, Optional
+from logging.handlers import QueueHandler, QueueListener, WatchedFileHandler
 
 _log_format: str = "[%(asctime)s] %(levelname)s [%(name)s.%(funcName)s:%(lineno)d] %(message)s"
 _dateftm: str = "%d/%B/%Y %H:%M:%S"
 
+TRACE_ROWS: bool = os.environ.get('DKP_TRACE_ROWS', '').lower() in ('1', 'true', 'yes')
+TRACE_SAMPLE: int = max(int(os.environ.get('DKP_TRACE_SAMPLE', 100)), 1)
+LOG_MAX_BYTES: int = int(os.environ.get('DKP_LOG_MAX_BYTES', 50 * 1024 * 1024))
+LOG_BACKUP_COUNT: int = int(os.environ.get('DKP_LOG_BACKUP_COUNT', 5))
 
-def get_file_handler(name: str) -> logging.FileHandler:
+_listeners: Dict[str, QueueListener] = {}
+_handlers: Dict[str, QueueHandler] = {}
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Puts records into the queue as they are.
+
+    The standard QueueHandler formats the message before putting the record into the queue, so the caller still
+    pays for the formatting. The records never leave the process here, so the message is formatted
+    by the listener thread instead.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """
+    Lets through only every `rate`-th record.
+    """
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate: int = rate
+        self.counter: itertools.count = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return next(self.counter) % self.rate == 0
+
+
+class SharedRotatingFileHandler(WatchedFileHandler):
+    """
+    Rotates the log file by size, while several processes append to it.
+
+    The same file is written by the listener of every process (the batch workers, the sheet workers,
+    the runs of the bash loop), so the size is checked and the file is rotated under an exclusive lock
+    of `<file>.lock`, and a process reopens the file when another one has rotated it, as WatchedFileHandler does.
+    """
+    def __init__(self, filename: str, max_bytes: int, backup_count: int, encoding: Optional[str] = None):
+        super().__init__(filename, encoding=encoding)
+        self.max_bytes: int = max_bytes
+        self.backup_count: int = backup_count
+        self.lock_file = open(f"{self.baseFilename}.lock", "a")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            try:
+                self.reopenIfNeeded()
+                if 0 < self.max_bytes <= os.fstat(self.stream.fileno()).st_size:
+                    self.rotate()
+                logging.FileHandler.emit(self, record)
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        except Exception:
+            self.handleError(record)
+
+    def rotate(self) -> None:
+        """
+        Moves `<file>` to `<file>.1`, `<file>.1` to `<file>.2` and so on, dropping the oldest one,
+        and opens a new file.
+        :return: None
+        """
+        self.stream.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.baseFilename}.{index}"):
+                os.replace(f"{self.baseFilename}.{index}", f"{self.baseFilename}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.baseFilename, f"{self.baseFilename}.1")
+        else:
+            os.remove(self.baseFilename)
+        self.stream = self._open()
+        self._statstream()
+
+    def close(self) -> None:
+        super().close()
+        self.lock_file.close()
+
+
+def get_file_handler(name: str) -> SharedRotatingFileHandler:
     """
     Creates a file handler for logging.
 
     Creates a file handler for logging, named after the given name, and returns it.
     The file handler is configured to write to a file in the "logging" directory
-    under the XL_IDP_ROOT_DKP environment variable. The file handler is set to
-    log INFO and above, and is configured to use the _log_format and _dateftm
-    variables for formatting.
+    under the XL_IDP_ROOT_DKP environment variable. The file is rotated when it grows
+    beyond DKP_LOG_MAX_BYTES, keeping DKP_LOG_BACKUP_COUNT old files (see SharedRotatingFileHandler).
+    The file handler is configured to use the _log_format and _dateftm variables for formatting.
 
     :param name: The name to give to the file handler, which will also be the
                  base name of the log file.
-    :return: A logging.FileHandler object.
+    :return: A SharedRotatingFileHandler object.
     """
     log_dir_name: str = f"{os.environ.get('XL_IDP_ROOT_DKP')}/logging"
-    if not os.path.exists(log_dir_name):
-        os.mkdir(log_dir_name)
-    file_handler: logging.FileHandler = logging.FileHandler(f"{log_dir_name}/{name}.log")
-    file_handler.setLevel(logging.INFO)
+    os.makedirs(log_dir_name, exist_ok=True)
+    file_handler: SharedRotatingFileHandler = SharedRotatingFileHandler(
+        f"{log_dir_name}/{name}.log", LOG_MAX_BYTES, LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(logging.Formatter(_log_format, datefmt=_dateftm))
     return file_handler
 
 
+def get_queue_handler(name: str) -> QueueHandler:
+    """
+    Creates a handler that passes records to a background thread writing them to the log file.
+
+    The caller only puts the record into a queue; formatting and writing to the file are done by
+    a QueueListener, one per log file. The listeners are stopped (and the queues flushed) when the process exits.
+
+    :param name: The base name of the log file.
+    :return: A logging.handlers.QueueHandler object.
+    """
+    if name not in _handlers:
+        _start_listener(name)
+        _handlers[name] = _QueueHandler(_listeners[name].queue)
+    return _handlers[name]
+
+
+def _start_listener(name: str) -> None:
+    listener: QueueListener = QueueListener(queue.Queue(), get_file_handler(name), respect_handler_level=True)
+    listener.start()
+    _listeners[name] = listener
+
+
+def stop_listeners() -> None:
+    """
+    Writes the queued records and stops the background threads.
+    :return: None
+    """
+    while _listeners:
+        _listeners.popitem()[1].stop()
+
+
+def _set_up_in_child() -> None:
+    # Only the forking thread survives in a child process, so the listeners of the parent are not running there,
+    # and their queues may be locked by them. The child gets its own queues and listeners, and the handlers
+    # of its loggers are pointed to the new queues; the records still in the old queues are written by the parent.
+    _listeners.clear()
+    for name, handler in _handlers.items():
+        _start_listener(name)
+        handler.queue = _listeners[name].queue
+    # multiprocessing children leave with os._exit and skip atexit, but run its finalizers
+    multiprocessing.util.Finalize(None, stop_listeners, exitpriority=0)
+
+
 def get_logger(name: str) -> logging.getLogger:
     """
     Creates a logger with the given name.
 
     Creates a logger with the given name, and returns it. The logger is
     configured to log INFO and above, and is configured to use the
-    get_file_handler to write to a file in the "logging" directory under the
-    XL_IDP_ROOT_DKP environment variable.
+    get_queue_handler to write to a file in the "logging" directory under the
+    XL_IDP_ROOT_DKP environment variable without blocking the caller.
 
     :param name: The name to give to the logger.
     :return: A logging.getLogger object.
@@ -44,5 +177,35 @@ def get_logger(name: str) -> logging.getLogger:
     if logger.hasHandlers():
         logger.handlers.clear()
     logger.setLevel(logging.INFO)
-    logger.addHandler(get_file_handler(name))
+    logger.addHandler(get_queue_handler(name))
     return logger
+
+
+def get_trace_logger(name: str) -> logging.getLogger:
+    """
+    Creates a logger for tracing single rows, separate from the main log.
+
+    Tracing is off by default: the logger is disabled unless DKP_TRACE_ROWS is set, so
+    `logger.isEnabledFor(logging.DEBUG)` is a cheap check on the hot path. When it is on, only every
+    DKP_TRACE_SAMPLE-th record is written to `<name>.rows.log`.
+
+    :param name: The name of the main logger.
+    :return: A logging.getLogger object.
+    """
+    logger: logging.getLogger = logging.getLogger(f"{name}.rows")
+    logger.propagate = False
+    if logger.hasHandlers():
+        logger.handlers.clear()
+    logger.filters.clear()
+    if not TRACE_ROWS:
+        logger.setLevel(logging.CRITICAL + 1)
+        return logger
+    logger.setLevel(logging.DEBUG)
+    logger.addFilter(SampleFilter(TRACE_SAMPLE))
+    logger.addHandler(get_queue_handler(f"{name}.rows"))
+    return logger
+
+
+atexit.register(stop_listeners)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_set_up_in_child)
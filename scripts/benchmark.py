@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import argparse
+import importlib.util
+import resource
+import tempfile
+import subprocess
+import metrics
+import synthetic_workbook
+from typing import Dict, List, Optional
+
+
+def measure(filename: str, folder: str, options: dict) -> dict:
+    """
+    Converts one workbook with DKP and measures the conversion.
+
+    Runs in a separate process (see run_case): DKP is imported here, after the environment points
+    the reference tables to the local snapshot, and the peak RSS of the process belongs to this conversion only.
+    Telegram is replaced by a list, so the errors are reported in the result instead.
+    The time of the stages and the counts are taken from the metrics DKP collects itself (see metrics.FileMetrics).
+
+    :param filename: The path to the workbook.
+    :param folder: The folder to write the output to.
+    :param options: The output options of DKP.
+    :return: A dictionary with the exit code, the counts, the time and the peak RSS.
+    """
+    import dkp
+
+    notifications: list = []
+    dkp.telegram = notifications.append
+    converter: dkp.DKP = dkp.DKP(os.path.abspath(filename), folder, **options)
+    exit_code: int = 0
+    try:
+        converter.main()
+    except SystemExit as exception:
+        exit_code = exception.code if isinstance(exception.code, int) else 1
+    file_metrics: dict = converter.metrics.to_dict(exit_code)
+    counters: dict = file_metrics["counters"]
+    return {
+        "exit_code": exit_code,
+        "rows": counters["table_rows"],
+        "records": counters["records"],
+        "seconds": file_metrics["seconds"],
+        "rows_per_second": counters["table_rows"] / file_metrics["seconds"],
+        "records_per_second": counters["records"] / file_metrics["seconds"],
+        "output_bytes": counters["output_bytes"],
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "stages": file_metrics["stages"],
+        "notifications": notifications
+    }
+
+
+def prepare_environment(workdir: str) -> Dict[str, str]:
+    """
+    Writes a snapshot of the synthetic reference_dkp table and returns the environment that makes DKP use it.
+
+    DKP runs in offline mode, so neither ClickHouse nor Telegram is needed.
+
+    :param workdir: The working directory of the benchmark.
+    :return: The environment of the measuring processes.
+    """
+    environment: Dict[str, str] = dict(
+        os.environ,
+        DKP_OFFLINE="1",
+        DKP_REFERENCE_CACHE=os.path.join(workdir, "reference_dkp.json"),
+        DKP_OUTBOX=os.path.join(workdir, "outbox")
+    )
+    with open(environment["DKP_REFERENCE_CACHE"], 'w', encoding='utf-8') as f:
+        json.dump(
+            {"version": [0, 0], "saved_at": time.time(), "rows": synthetic_workbook.get_reference_rows()},
+            f,
+            ensure_ascii=False
+        )
+    return environment
+
+
+def run_case(filename: str, workdir: str, environment: Dict[str, str], options: dict) -> dict:
+    """
+    Measures one conversion of the workbook in a new process.
+
+    :param filename: The path to the workbook.
+    :param workdir: The working directory of the benchmark.
+    :param environment: The environment from prepare_environment.
+    :param options: The output options of DKP.
+    :return: The result of measure.
+    """
+    folder: str = tempfile.mkdtemp(dir=workdir, prefix="output_")
+    process: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--measure", filename, folder, json.dumps(options)],
+        env=environment,
+        cwd=workdir,
+        stdout=subprocess.PIPE,
+        check=True
+    )
+    for name in os.listdir(folder):
+        os.remove(os.path.join(folder, name))
+    os.rmdir(folder)
+    return json.loads(process.stdout.decode("utf-8").splitlines()[-1])
+
+
+def print_results(results: List[dict]) -> None:
+    stages: tuple = metrics.STAGES
+    print(
+        f"{'format':<7}{'rows':>9}{'records':>10}{'seconds':>9}{'rows/s':>10}{'records/s':>11}{'RSS MB':>8}  " +
+        "".join(f"{stage:>9}" for stage in stages)
+    )
+    for result in results:
+        print(
+            f"{result['format']:<7}{result['rows']:>9}{result['records']:>10}{result['seconds']:>9.2f}"
+            f"{result['rows_per_second']:>10.0f}{result['records_per_second']:>11.0f}{result['peak_rss_mb']:>8.0f}  " +
+            "".join(f"{result['stages'].get(stage, 0.0):>9.2f}" for stage in stages) +
+            ("" if result["exit_code"] == 0 else f"  exit code {result['exit_code']}")
+        )
+
+
+def run(arguments: argparse.Namespace) -> List[dict]:
+    """
+    Generates the workbooks and measures every combination of format and size.
+
+    Every case is run `repeat` times, the fastest run is reported.
+
+    :param arguments: The arguments of the command line.
+    :return: A list of results.
+    """
+    workdir: str = arguments.workdir or tempfile.mkdtemp(prefix="dkp_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    environment: Dict[str, str] = prepare_environment(workdir)
+    options: dict = {
+        "output_format": arguments.format,
+        "compress": arguments.gzip,
+        "chunk_rows": arguments.chunk_rows,
+        "stream": arguments.stream,
+        "memory_budget_mb": arguments.memory_budget
+    }
+    results: list = []
+    for file_format in arguments.formats:
+        for rows in arguments.rows:
+            filename: str = os.path.join(workdir, f"{synthetic_workbook.DEPARTMENT[0]}_2024_{rows}.{file_format}")
+            if not os.path.exists(filename):
+                synthetic_workbook.generate_workbook(workdir, rows, file_format, arguments.preamble_rows)
+            runs: list = [run_case(filename, workdir, environment, options) for _ in range(arguments.repeat)]
+            result: dict = min(runs, key=lambda item: item["seconds"])
+            result.update(format=file_format, file_bytes=os.path.getsize(filename))
+            results.append(result)
+    return results
+
+
+def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measures the throughput of DKP on synthetic workbooks")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000], help="Rows of the table per workbook")
+    parser.add_argument(
+        "--formats", nargs="+", choices=synthetic_workbook.FORMATS, default=["xlsx"], help="Formats of the workbooks"
+    )
+    parser.add_argument("--preamble-rows", type=int, default=5, help="Rows before the header")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per workbook, the fastest is reported")
+    parser.add_argument("--format", choices=["json", "ndjson"], default="json", help="Output format")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output")
+    parser.add_argument("--stream", action="store_true", help="Read .xlsx sheets row by row")
+    parser.add_argument("--memory-budget", type=float, help="Memory budget of DKP in MB")
+    parser.add_argument("--chunk-rows", type=int, default=1000, help="Rows of the table per written chunk")
+    parser.add_argument("--workdir", help="Folder for the workbooks; they are reused if they exist")
+    parser.add_argument("--report", help="Write the results to this JSON file")
+    arguments: argparse.Namespace = parser.parse_args(args)
+    if "xls" in arguments.formats and importlib.util.find_spec("xlwt") is None:
+        parser.error("the xls format needs the xlwt package, install it with pip install -r requirements-dev.txt")
+    return arguments
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--measure"]:
+        print(json.dumps(measure(sys.argv[2], sys.argv[3], json.loads(sys.argv[4])), ensure_ascii=False))
+        sys.exit(0)
+    benchmark_arguments: argparse.Namespace = parse_args()
+    benchmark_results: List[dict] = run(benchmark_arguments)
+    print_results(benchmark_results)
+    if benchmark_arguments.report:
+        with open(benchmark_arguments.report, 'w', encoding='utf-8') as report:
+            json.dump(benchmark_results, report, ensure_ascii=False, indent=4)
@@ -0,0 +1,42 @@
+from typing import Dict, Iterable, Optional
+
+TEXT: str = "text"
+NUMERIC: str = "numeric"
+BOOLEAN: str = "boolean"
+DATE: str = "date"
+AUTO: str = "auto"
+TYPES: tuple = (TEXT, NUMERIC, BOOLEAN, DATE, AUTO)
+
+TEXT_COLUMNS: tuple = ("client", "description", "project", "cargo", "direction", "bay", "owner")
+RATE_BLOCKS: tuple = (
+    "co_executor_rate_per_unite", "unit_margin_income", "service", "co_executor", "reimbursable_sign_76"
+)
+NUMERIC_RATE_COLUMNS: tuple = (
+    "marine", "port", "terminal1", "terminal2", "other_terminal", "avto1", "avto2", "avto3", "rzhd1", "rzhd2",
+    "custom", "demurrage", "storage", "other1", "other2", "fee", "value_money"
+)
+
+# The columns that are not listed (container_size, *_separation, *_tax) keep the old conversion
+# that guesses the type of every cell, as both numbers and text are written there.
+DEFAULT_COLUMN_TYPES: Dict[str, str] = dict(
+    {column: TEXT for column in TEXT_COLUMNS},
+    **{f"{block}_{column}": NUMERIC for block in RATE_BLOCKS for column in NUMERIC_RATE_COLUMNS}
+)
+
+
+def get_column_types(
+    numeric_columns: Iterable[Optional[str]] = (),
+    overrides: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Returns the type of every column with a known type.
+
+    :param numeric_columns: Additional numeric columns, e.g. the columns of the months in the natural indicators.
+    :param overrides: The types from the reference_dkp table, they take precedence over the defaults.
+    :return: A dictionary where the keys are the English names of the columns and the values are from TYPES.
+             The columns that are not in the dictionary are of the type `auto`.
+    """
+    column_types: Dict[str, str] = dict(DEFAULT_COLUMN_TYPES)
+    column_types.update((column, NUMERIC) for column in numeric_columns if column)
+    column_types.update(overrides or {})
+    return column_types
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+from typing import Dict, Optional
+
+_converter_version: Optional[str] = None
+
+
+def get_file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Calculates the SHA-256 of the content of a file, reading it in chunks.
+
+    :param path: The path to the file.
+    :param chunk_size: The size of a chunk in bytes.
+    :return: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_converter_version() -> str:
+    """
+    Returns the version of the converter: the hash of the source files of the scripts directory.
+
+    Any change of the code that converts the files (a fix of a converter, a new column type) gives a new version,
+    so the outputs converted by the old code are never reused. It is calculated once per process.
+
+    :return: The hex digest.
+    """
+    global _converter_version
+    if _converter_version is None:
+        folder: str = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(folder)):
+            if name.endswith(".py"):
+                digest.update(name.encode())
+                digest.update(b"\0")
+                with open(os.path.join(folder, name), 'rb') as f:
+                    digest.update(f.read())
+        _converter_version = digest.hexdigest()
+    return _converter_version
+
+
+def link_or_copy(source: str, destination: str) -> None:
+    """
+    Makes `destination` a hard link to `source`, or a copy of it if linking is not possible.
+
+    The destination is replaced atomically, so a reader never sees a half-written file.
+
+    :param source: The path to the existing file.
+    :param destination: The path to the new file.
+    :return: None
+    """
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        return  # rename() does nothing for two links to the same file, so the temporary link would stay
+    tmp_path: str = os.path.join(
+        os.path.dirname(destination), f".{os.path.basename(destination)}.{os.getpid()}.tmp"
+    )
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+class ConversionIndex(object):
+    """
+    A persistent index of the converted files, so a file dropped again is not converted again.
+
+    The key of a conversion is built from the hash of the content of the file, its name (the name gets into
+    the records), the version of the reference_dkp table, the version of the converter (see get_converter_version)
+    and the output options. The outputs of the indexed
+    conversions are kept in the store directory as hard links (or copies), so they can be given out again even
+    if the loader has already taken the original output away. The index keeps the last `keep_entries`
+    conversions; it is a JSON file changed under a lock, as several processes may convert files at once.
+    """
+    def __init__(self, index_path: str, store_path: str, keep_entries: int = 1000):
+        self.index_path: str = index_path
+        self.store_path: str = store_path
+        self.keep_entries: int = keep_entries
+
+    @staticmethod
+    def get_key(file_hash: str, filename: str, reference_version: str, converter_version: str, options: str) -> str:
+        return hashlib.sha256(
+            "\0".join([file_hash, filename, reference_version, converter_version, options]).encode()
+        ).hexdigest()
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, entries: Dict[str, dict]) -> None:
+        tmp_path: str = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _lock(self):
+        os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+        lock = open(f"{self.index_path}.lock", 'w')
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def reuse(self, key: str, output_path: str) -> Optional[dict]:
+        """
+        Gives out the stored output of an earlier conversion with the same key and records the reuse.
+
+        :param key: The key of the conversion from get_key.
+        :param output_path: The path the output should appear at.
+        :return: The entry of the index, or None if there was no such conversion or its output is lost.
+        """
+        with self._lock():
+            entries: Dict[str, dict] = self._read()
+            entry: Optional[dict] = entries.get(key)
+            if entry is None or not os.path.isfile(entry["stored_output"]):
+                return None
+            link_or_copy(entry["stored_output"], output_path)
+            entry["hits"] = entry.get("hits", 0) + 1
+            entry["last_hit_at"] = time.time()
+            self._write(entries)
+            return entry
+
+    def add(self, key: str, filename: str, output_path: str) -> None:
+        """
+        Stores the output of a conversion and adds it to the index, removing the oldest entries over the limit.
+
+        :param key: The key of the conversion from get_key.
+        :param filename: The name of the converted file.
+        :param output_path: The path to the output of the conversion.
+        :return: None
+        """
+        os.makedirs(self.store_path, exist_ok=True)
+        stored_output: str = os.path.join(self.store_path, f"{key}{os.path.splitext(output_path)[1]}")
+        link_or_copy(output_path, stored_output)
+        with self._lock():
+            entries: Dict[str, dict] = self._read()
+            entries[key] = {
+                "file": filename,
+                "stored_output": stored_output,
+                "converted_at": time.time(),
+                "hits": 0
+            }
+            ordered: list = sorted(entries.items(), key=lambda item: item[1]["converted_at"])
+            for _, entry in ordered[:-self.keep_entries]:
+                if os.path.isfile(entry["stored_output"]):
+                    os.remove(entry["stored_output"])
+            self._write(dict(ordered[-self.keep_entries:]))
@@ -0,0 +1,150 @@
+import os
+import json
+import gzip
+import fcntl
+import hashlib
+from writers import RecordWriter, JsonEncoder
+from typing import IO, Dict, Iterable, Optional, Tuple
+
+KEY_FIELDS: tuple = ("client", "project", "direction", "bay", "owner", "container_size", "month")
+VOLATILE_FIELDS: tuple = ("original_file_name", "original_file_parsed_on")
+
+
+def get_snapshot_path(snapshot_folder: str, department: str, year: int) -> str:
+    """
+    Returns the path to the snapshot of the last converted version of the file of a department and a year.
+
+    :param snapshot_folder: The folder of the snapshots.
+    :param department: The department from the name of the file.
+    :param year: The year from the name of the file.
+    :return: The path to the snapshot.
+    """
+    name: str = f"{department}_{year}".replace(os.sep, "_")
+    return os.path.join(snapshot_folder, f"{name}.ndjson.gz")
+
+
+def get_record_hash(record: dict) -> str:
+    """
+    Returns a hash of the values of a record, without the fields that change on every conversion.
+
+    :param record: The record.
+    :return: The hex digest.
+    """
+    values: list = [value for field, value in record.items() if field not in VOLATILE_FIELDS]
+    return hashlib.blake2b(
+        json.dumps(values, ensure_ascii=False, cls=JsonEncoder).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+class DeltaWriter(RecordWriter):
+    """
+    Writes only the records that differ from the previous version of the file of the same department and year.
+
+    A record is identified by KEY_FIELDS and the ordinal of the record among the records with the same fields
+    (a client may have several rows with the same project, direction, ...), written as `occurrence`.
+    Compared with the snapshot of the previous version, every record is either new (`operation` "insert"),
+    changed ("update") or the same (not written). The records of the previous version that are not in the file
+    any more are written at the end with the key fields only ("delete").
+
+    The records themselves are written by the given writer. The snapshot of this version (the key and the hash
+    of every record) is written next to the previous one and replaces it in close(), so the next version is
+    compared with this one. The snapshot is locked from the first record until close() or abort(), so two
+    versions of the same file are never compared with the same snapshot.
+    """
+    def __init__(self, writer: RecordWriter, snapshot_path: str, constants: dict):
+        self.writer: RecordWriter = writer
+        self.snapshot_path: str = snapshot_path
+        self.tmp_path: str = f"{snapshot_path}.{os.getpid()}.tmp"
+        self.constants: dict = constants
+        self.count: int = 0
+        self.stats: Dict[str, int] = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        self.previous: Optional[Dict[tuple, str]] = None
+        self.occurrences: Dict[tuple, int] = {}
+        self.lock: Optional[IO] = None
+        self.snapshot: Optional[IO] = None
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.snapshot_path) or '.', exist_ok=True)
+        self.lock = open(f"{self.snapshot_path}.lock", 'w')
+        fcntl.flock(self.lock, fcntl.LOCK_EX)
+        self.previous = dict(self.read_snapshot(self.snapshot_path))
+        self.snapshot = gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+
+    @staticmethod
+    def read_snapshot(path: str) -> Iterable[Tuple[tuple, str]]:
+        """
+        Reads the keys and the hashes of the records of a snapshot.
+
+        :param path: The path to the snapshot.
+        :return: An iterator of tuples of the key and the hash of a record; nothing if there is no snapshot.
+        """
+        if not os.path.exists(path):
+            return
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                key, record_hash = json.loads(line)
+                yield tuple(key), record_hash
+
+    def write(self, records: Iterable[dict]) -> None:
+        """
+        Compares the given records with the previous version and writes the new and the changed ones.
+
+        :param records: The records of the file.
+        :return: None
+        """
+        if self.snapshot is None:
+            self._open()
+        changed: list = []
+        for record in records:
+            fields: tuple = tuple(record.get(field) for field in KEY_FIELDS)
+            ordinal: int = self.occurrences.get(fields, 0)
+            self.occurrences[fields] = ordinal + 1
+            key: tuple = fields + (ordinal,)
+            record_hash: str = get_record_hash(record)
+            self.snapshot.write(json.dumps([key, record_hash], ensure_ascii=False, cls=JsonEncoder))
+            self.snapshot.write("\n")
+            self.count += 1
+            previous_hash: Optional[str] = self.previous.pop(key, None)
+            if previous_hash == record_hash:
+                self.stats["unchanged"] += 1
+                continue
+            operation: str = "insert" if previous_hash is None else "update"
+            self.stats["inserted" if previous_hash is None else "updated"] += 1
+            changed.append(dict(record, occurrence=ordinal, operation=operation))
+        self.writer.write(changed)
+
+    def close(self) -> str:
+        """
+        Writes the deleted records, finishes the output and replaces the snapshot of the previous version.
+        :return: The path to the output.
+        """
+        if self.snapshot is None:
+            self._open()
+        self.writer.write(
+            dict(self.constants, **dict(zip(KEY_FIELDS, key)), occurrence=key[-1], operation="delete")
+            for key in self.previous
+        )
+        self.stats["deleted"] = len(self.previous)
+        output_path: str = self.writer.close()
+        self.snapshot.close()
+        self.snapshot = None
+        os.replace(self.tmp_path, self.snapshot_path)
+        self._unlock()
+        return output_path
+
+    def abort(self) -> None:
+        """
+        Discards the output and the snapshot of this version, the previous snapshot stays.
+        :return: None
+        """
+        self.writer.abort()
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+            os.remove(self.tmp_path)
+        self._unlock()
+
+    def _unlock(self) -> None:
+        if self.lock is not None:
+            self.lock.close()
+            self.lock = None
@@ -1,29 +1,87 @@
 import re
 import sys
 import json
+import time
+import tempfile
+import multiprocessing
+import logging
+import fnmatch
+import argparse
+import xlrd
 import app_logger
+import header_index
 import numpy as np
 import pandas as pd
 from re import Match
 from __init__ import *
 from datetime import datetime
-from typing import List, Dict, Optional, Union, Hashable
+from sheet_reader import Row, iter_dataframe_rows, iter_worksheet_rows
+from metrics import FileMetrics, get_rss_bytes, reset_peak_rss, write_atomically
+from dedup import ConversionIndex, get_converter_version, get_file_hash
+from delta import DeltaWriter, get_snapshot_path
+from record_batch import RecordBatch
+from notifications import stop_dispatcher
+from writers import WRITERS, RecordWriter, ClickHouseWriter, JsonEncoder, SpoolWriter, read_spool
+from layout_cache import LayoutCache, get_layout_cache
+from column_schema import TYPES, get_column_types
+from value_parser import TableParser
+from unpivot import get_month_columns, unpivot_months
+from header_index import HeaderIndex, get_header_index
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional, Union, Hashable
 
 logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", ""))
+row_logger: app_logger = app_logger.get_trace_logger(os.path.basename(__file__).replace(".py", ""))
 
-
-class JsonEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if hasattr(obj, '__dict__'):
-            return obj.__dict__
-        return json.JSONEncoder.default(self, obj)
+XLS_SIGNATURE: bytes = b"\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1"
 
 
 class DKP(object):
-    def __init__(self, filename: str, folder: str):
+    def __init__(
+        self,
+        filename: str,
+        folder: str,
+        output_format: str = "json",
+        compress: bool = False,
+        chunk_rows: int = 1000,
+        clickhouse_table: str = "dkp",
+        stream: bool = False,
+        dedup: bool = False,
+        incremental: bool = False,
+        sheet_workers: Optional[int] = None,
+        memory_budget_mb: Optional[float] = None,
+        notify: bool = True,
+        collect_errors: bool = False,
+        quarantine: bool = False,
+        strict_types: bool = False
+    ):
         self.filename: str = filename
         self.basename_filename: str = os.path.basename(filename)
         self.folder: str = folder
+        self.output_format: str = output_format
+        self.compress: bool = compress
+        self.chunk_rows: int = chunk_rows
+        self.clickhouse_table: str = clickhouse_table
+        # Only a sheet that is read lazily can be kept within a memory budget
+        self.stream: bool = stream or bool(memory_budget_mb)
+        self.memory_budget: Optional[int] = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb else None
+        self.dedup: bool = dedup
+        self.incremental: bool = incremental
+        self.sheet_workers: Optional[int] = sheet_workers
+        self.is_notifying: bool = notify
+        # Quarantining the rows with errors needs all of them, so it implies collecting them
+        self.quarantine: bool = quarantine
+        self.collect_errors: bool = collect_errors or quarantine
+        # A value that doesn't match the type of its column is written as empty, unless the types are strict
+        self.strict_types: bool = strict_types
+        self.errors: List[str] = []
+        self.row_errors: List[dict] = []
+        self.current_sheet: Optional[str] = None
+        self.output_path: Optional[str] = None
+        self.parsed_on: Optional[str] = None
+        self.metrics: FileMetrics = FileMetrics(self.basename_filename)
+        self.header_index: HeaderIndex = get_header_index()
+        self.layout_cache: Optional[LayoutCache] = get_layout_cache(LAYOUT_CACHE_KEEP_ENTRIES)
         self.floating_columns: list = [
             "description",
             "co_executor_rate_per_unite_separation",
@@ -166,48 +224,24 @@ class DKP(object):
             "reimbursable_sign_76": None,
             "natural_indicators_teus": None
         }
+        self.row_columns: List[str] = [
+            "client", "description", "project", "cargo", "direction", "bay", "owner", "container_size"
+        ]
+        self.rate_columns: List[str] = [
+            column for column in self.dict_columns_position if column not in self.row_columns
+        ]
+        self.month_columns: Dict[str, List[Optional[str]]] = {}
+        self.column_types: Dict[str, str] = {}
+        self.type_violations: Dict[str, int] = {}
+        self.type_violation_cells: List[dict] = []
 
-    @staticmethod
-    def _is_digit(x: str) -> bool:
-        """
-        Checks if a given string can be converted to a float.
-        :param x: The string to check.
-        :return: True if x can be converted to a float, False otherwise.
-        """
-        try:
-            float(re.sub(r'(?<=\d) (?=\d)', '', x))
-            return True
-        except ValueError:
-            return False
-
-    @staticmethod
-    def _merge_two_dicts(x: Dict, y: Dict) -> dict:
-        """
-        Merge two dictionaries, x and y, into a new dictionary, z.
-        The values in y will overwrite the values in x if there are any keys in common.
-
-        :param x: The first dictionary to merge.
-        :param y: The second dictionary to merge.
-        :return: A new dictionary with the merged values.
-        """
-        z: Dict = x.copy()  # start with keys and values of x
-        z.update(y)  # modifies z with keys and values of y
-        return z
-
-    @staticmethod
-    def _get_list_columns() -> List[str]:
+    def reset_layout(self) -> None:
         """
-        Returns a list of all possible column names.
-
-        This function takes all the values from COLUMN_NAMES (which is a dictionary of lists)
-        and flattens them into a single list. This list is then returned.
-
-        :return: A list of column names.
+        Forgets the positions of the blocks and the columns found in the previous sheet.
+        :return: None
         """
-        list_columns: list = []
-        for keys in list(COLUMN_NAMES.values()):
-            list_columns.extend(iter(keys))
-        return list_columns
+        self.dict_columns_position = dict.fromkeys(self.row_columns + self.rate_columns)
+        self.dict_block_position = dict.fromkeys(self.dict_block_position)
 
     @staticmethod
     def _remove_symbols_in_columns(row: Optional[str]) -> str:
@@ -225,50 +259,45 @@ class DKP(object):
             row: str = re.sub(r"\n", " ", row).strip()
         return row
 
-    def _get_probability_of_header(self, row: list, list_columns: list) -> int:
+    def _get_probability_of_header(self, row: list) -> int:
         """
         Calculates the probability that a given row is a header.
 
-        This method takes a row (a list of strings) and a list of column names,
+        This method takes a row (a list of strings),
         removes any extra spaces and newline characters from the strings in the row,
-        and then counts how many of the strings in the row are in the list of column names.
+        and then counts how many of the strings in the row are column names from the header index.
         The count is then divided by the length of the row, and the result is multiplied by 100
         to get a percentage. The percentage is then returned as an integer.
 
         :param row: The row to calculate the probability for.
-        :param list_columns: The list of column names.
         :return: The probability that the given row is a header, as an integer between 0 and 100.
         """
-        row: list = list(map(self._remove_symbols_in_columns, row))
-        count: int = sum(element in list_columns for element in row)
+        count: int = sum(
+            self.header_index.is_column_name(self._remove_symbols_in_columns(element)) for element in row
+        )
         return int(count / len(row) * 100)
 
-    def get_columns_position(self, row: list, block_position: list, headers: dict, dict_columns_position) -> None:
+    def get_columns_position(self, row: list, block_position: list, group: str, dict_columns_position) -> None:
         """
         Finds the position of all columns in a row.
 
-        This method takes a row, a range of columns (block_position), a dictionary of headers,
+        This method takes a row, a range of columns (block_position), a group of headers from the header index,
         and a dictionary to store the positions of the columns.
-        It removes any extra spaces and newline characters from the strings in the row,
-        and then iterates over the strings in the row.
-        For each string, it checks if it matches any of the strings in the headers dictionary,
-        and if it does, it stores the index of the string in the row in the dict_columns_position dictionary.
-        The index is stored with the English name of the column as the key.
+        It removes any extra spaces and newline characters from the strings in the block,
+        and looks each string up in the header index.
+        If the string is a header of the group, it stores the index of the string in the row
+        in the dict_columns_position dictionary. The index is stored with the English name of the column as the key.
 
         :param row: The row to find the columns in.
         :param block_position: A list containing the start and end index of the block of columns to search in.
-        :param headers: A dictionary of headers, where the keys are the English names of the columns,
-                        and the values are lists of strings that may appear in the row as the header.
+        :param group: The group of headers (header_index.COLUMNS, header_index.BLOCKS or the name of a block).
         :param dict_columns_position: A dictionary to store the positions of the columns in.
         :return: None
         """
         start_index, end_index = block_position
-        row: list = list(map(self._remove_symbols_in_columns, row))
-        for index, col in enumerate(row):
-            for eng_column, columns in headers.items():
-                for column_eng in columns:
-                    if col == column_eng and start_index <= index < end_index:
-                        dict_columns_position[eng_column] = index
+        for index in range(start_index, min(end_index, len(row))):
+            for eng_column in self.header_index.lookup(self._remove_symbols_in_columns(row[index]), group):
+                dict_columns_position[eng_column] = index
 
     def check_errors_in_columns(self, dict_columns: dict, message: str) -> None:
         """
@@ -288,7 +317,7 @@ class DKP(object):
         if empty_columns := [key for key, value in dict_columns.items() if value is None]:
             logger.error(f"{message}. Empty columns - {empty_columns}")
             print("2", file=sys.stderr)
-            telegram(
+            self.send_notification(
                 f"Error code 2: {message}! Не были найдены следующие поля - {empty_columns}! "
                 f"Файл: {self.basename_filename}"
             )
@@ -315,7 +344,7 @@ class DKP(object):
             dict_columns=self.dict_block_position,
             message="Блоки текста отсутствуют в файле или изменены"
         )
-        self.get_columns_position(row, [0, len(row)], COLUMN_NAMES, self.dict_columns_position)
+        self.get_columns_position(row, [0, len(row)], header_index.COLUMNS, self.dict_columns_position)
 
         items: list = list(self.dict_block_position.items())
         dict_block_position_ranges = {
@@ -324,9 +353,16 @@ class DKP(object):
         }
 
         for col, block_position in dict_block_position_ranges.items():
-            if repeated_column := BLOCK_TABLE_COLUMNS.get(col):
-                self.get_columns_position(row, block_position, repeated_column, self.dict_columns_position)
+            if references.get("BLOCK_TABLE_COLUMNS").get(col):
+                self.get_columns_position(row, block_position, col, self.dict_columns_position)
 
+        self.check_errors_in_layout()
+
+    def check_errors_in_layout(self) -> None:
+        """
+        Checks if all required columns have a position, exits with the error code 2 if they don't.
+        :return: None
+        """
         dict_columns_position: dict = self.dict_columns_position.copy()
         for delete_column in self.floating_columns:
             del dict_columns_position[delete_column]
@@ -336,6 +372,40 @@ class DKP(object):
             message="Столбцы отсутствуют в файле или изменены"
         )
 
+    def resolve_header(self, row: list) -> None:
+        """
+        Sets the positions of the columns from the header row, using the cache of the known layouts.
+
+        The first header of a sheet is looked up in the layout cache by the positions of the blocks,
+        the texts of the header and the version of reference_dkp. If the layout is known, the positions
+        of the columns are taken from the cache and only checked; otherwise they are found with
+        check_errors_in_header and the layout is added to the cache. The next headers of the sheet
+        depend on the positions found before them, so they are always resolved with check_errors_in_header.
+
+        :param row: The header row.
+        :return: None
+        """
+        if self.layout_cache is None or any(position is not None for position in self.dict_columns_position.values()):
+            self.check_errors_in_header(row)
+            return
+        fingerprint: tuple = LayoutCache.get_fingerprint(
+            references.get("REFERENCE_VERSION"),
+            self.dict_block_position,
+            [self._remove_symbols_in_columns(element) for element in row]
+        )
+        cached: Optional[Dict[str, Optional[int]]] = self.layout_cache.get(fingerprint)
+        if cached is not None and set(self.dict_columns_position) <= set(cached):
+            self.check_errors_in_columns(
+                dict_columns=self.dict_block_position,
+                message="Блоки текста отсутствуют в файле или изменены"
+            )
+            self.dict_columns_position = dict(self.dict_columns_position, **cached)
+            self.metrics.count("layout_cache_hits")
+            self.check_errors_in_layout()
+            return
+        self.check_errors_in_header(row)
+        self.layout_cache.add(fingerprint, self.dict_columns_position)
+
     def _is_table_starting(self, row: list) -> bool:
         """
         Checks if the table is starting in the given row.
@@ -353,213 +423,266 @@ class DKP(object):
         except TypeError:
             return False
 
-    def write_to_json(self, list_data: List[dict]) -> None:
+    def get_writer(self, metadata: Optional[dict] = None) -> RecordWriter:
+        """
+        Creates the writer of the output file in the chosen format.
+
+        The output file has the name of the Excel file with the extension of the format
+        (`.json`, `.ndjson`, plus `.gz` if compressed, or `.parquet`) and is written to the given folder.
+        With the `clickhouse` format the records are inserted into the table `clickhouse_table` instead.
+        In the incremental mode only the difference with the previous version of the file of the same
+        department and year is written, to `<name>.delta.json` (see delta.DeltaWriter).
+
+        :param metadata: The metadata extracted from the filename, needed in the incremental mode.
+        :return: The writer of the output file.
+        """
+        if self.output_format == "clickhouse":
+            if self.incremental:
+                raise ValueError("The incremental mode writes a delta file and does not work with ClickHouse")
+            # Within a memory budget the chunks are sized to fit it, so every chunk is inserted as it is written
+            return ClickHouseWriter(
+                get_clickhouse_client(),
+                self.clickhouse_table,
+                self.basename_filename,
+                batch_size=0 if self.memory_budget else 100000
+            )
+        if not self.incremental:
+            return self.get_file_writer(self.basename_filename)
+        return DeltaWriter(
+            self.get_file_writer(f"{self.basename_filename}.delta"),
+            get_snapshot_path(SNAPSHOT_PATH, metadata['department'], metadata['year']),
+            dict(metadata, original_file_name=self.basename_filename, original_file_parsed_on=self.parsed_on)
+        )
+
+    def get_file_writer(self, basename: str) -> RecordWriter:
         """
-        Writes the given list of dictionaries to a JSON file.
+        Creates the writer of the output file of the chosen format.
 
-        This method takes a list of dictionaries and writes them to a JSON file.
-        The file is written to the same folder as the given Excel file.
-        The filename is the same as the Excel file, but with a `.json` extension instead of `.xls`.
-        If the list of dictionaries is empty, it logs an error message with the error code 4,
+        :param basename: The name of the output file without the extension.
+        :return: The writer.
+        """
+        if self.output_format == "parquet":
+            return WRITERS["parquet"](self.folder, basename, compress=self.compress, column_types=self.column_types)
+        return WRITERS[self.output_format](self.folder, basename, compress=self.compress)
+
+    def fit_chunk_to_memory_budget(self, baseline: int, chunk_size: int, min_chunk_rows: int = 10) -> None:
+        """
+        Sets the number of rows of the table per chunk, so a chunk fits into the memory budget.
+
+        It is called after the first chunk of a sheet: the memory the process has grown by since `baseline`
+        gives the memory per row, and the rest of the budget over the baseline gives the number of rows.
+        The number of rows is never raised over `chunk_rows`.
+
+        :param baseline: The RSS of the process before the first chunk.
+        :param chunk_size: The number of rows of the table in the first chunk.
+        :param min_chunk_rows: The smallest number of rows per chunk.
+        :return: None
+        """
+        rss: int = get_rss_bytes()
+        bytes_per_row: float = max(rss - baseline, 1) / max(chunk_size, 1)
+        fitting_rows: int = int((self.memory_budget - baseline) / bytes_per_row)
+        self.chunk_rows = max(min_chunk_rows, min(self.chunk_rows, fitting_rows))
+        if fitting_rows < min_chunk_rows:
+            logger.warning(
+                f"File - {self.basename_filename}. The process uses {baseline / 1024 / 1024:.0f} MB "
+                f"before the table, the budget of {self.memory_budget / 1024 / 1024:.0f} MB can't be met"
+            )
+        logger.info(
+            f"File - {self.basename_filename}. About {bytes_per_row / 1024:.0f} KB per row of the table, "
+            f"{self.chunk_rows} rows per chunk"
+        )
+
+    def write_output(self, writer: RecordWriter) -> None:
+        """
+        Finishes the output file.
+
+        If no records were written, it logs an error message with the error code 4,
         prints the error code to stderr, sends a message to Telegram with the error code and the name of the file,
-        and then exits with the error code.
+        and then exits with the error code. The output file is not created in this case.
 
-        :param list_data: The list of dictionaries to write to the JSON file.
+        :param writer: The writer of the output file.
         :return: None
         """
-        if not list_data:
-            logger.error("Error code 4: length list equals 0!")
-            print("4", file=sys.stderr)
-            telegram(f"Error code 4: В Файле отсутствуют данные! Файл: {self.basename_filename}")
-            sys.exit(4)
-        output_file_path = os.path.join(self.folder, f'{self.basename_filename}.json')
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            json.dump(list_data, f, ensure_ascii=False, indent=4, cls=JsonEncoder)
+        if not writer.count:
+            self.send_empty_file_error()
+        with self.metrics.stage("write"):
+            output_file_path: str = writer.close()
+        self.output_path = output_file_path
+        self.metrics.count("records", writer.count)
+        if isinstance(writer, DeltaWriter):
+            for operation, count in writer.stats.items():
+                self.metrics.count(f"delta_{operation}", count)
+            logger.info(f"File - {self.basename_filename}. Difference with the previous version: {writer.stats}")
+        if os.path.isfile(output_file_path):
+            self.metrics.count("output_bytes", os.path.getsize(output_file_path))
+        if self.type_violations:
+            logger.warning(
+                f"File - {self.basename_filename}. Values that don't match the type of the column: "
+                f"{self.type_violations}"
+            )
+        logger.info(
+            f"File - {self.basename_filename}. {self.metrics.counters['table_rows']} rows of the table, "
+            f"{writer.count} records are written to {output_file_path}"
+        )
 
-    def get_content_in_table(
+    def get_content_in_rows(
         self,
-        index: Union[int, Hashable],
-        index_month: int,
-        month_string,
-        row: list,
-        metadata: dict
-    ) -> dict:
-        """
-        Extracts and processes data from a row in a table, returning a dictionary of parsed values.
-
-        This function takes a row from a table and extracts various data points such as client details,
-        project information, and financial metrics. It uses a helper function `parse_value` to clean and
-        convert the data appropriately. The parsed data is returned as a dictionary along with additional
-        metadata.
-
-        :param index: The index of the current row.
-        :param index_month: The numeric representation of the month.
-        :param month_string: The string representation of the month.
-        :param row: The list of values in the current row.
-        :param metadata: Additional metadata extracted earlier in the process.
-        :return: A dictionary containing parsed and processed data from the row.
+        table_rows: List[Tuple[Union[int, Hashable], list]],
+        metadata: dict,
+        sheet_name: Optional[str] = None
+    ) -> RecordBatch:
         """
+        Converts the rows of a table to records, twelve records (one per month) per row.
 
-        def parse_value(rows: list, column: str) -> Union[str, float, int, bool, None]:
-            if self.dict_columns_position[column] is None:
-                return None
-
-            value: Optional[str] = rows[self.dict_columns_position[column]]
-            if not value:
-                return None
+        All rows are converted column by column with value_parser.TableParser, every column by the converter
+        of its type from column_schema; the cells that don't match the type are None and are reported
+        with report_type_violations. If that fails, the rows are converted one by one with parse_rows_one_by_one.
+        The converted table is then unpivoted by months with unpivot.unpivot_months: the fields of the row
+        are repeated for every month, and the number of containers and TEU are taken from the column of the month.
+        The records are returned as a column-oriented RecordBatch, where the metadata, the name of the file
+        and the time of parsing are stored once.
 
-            stripped_value: str = value.strip()
+        :param table_rows: A list of tuples of the row index and the list of values in the row.
+        :param metadata: Additional metadata extracted earlier in the process.
+        :param sheet_name: The name of the sheet, written as `sheet_name` if the workbook has several DKP sheets.
+        :return: A batch of records.
+        """
+        fields: list = list(metadata) + self.row_columns + ["month", "month_string", "date"] \
+            + list(self.month_columns) + self.rate_columns + ["original_file_name", "original_file_parsed_on"]
+        constants: dict = dict(
+            metadata,
+            original_file_name=self.basename_filename,
+            original_file_parsed_on=self.parsed_on
+        )
+        if sheet_name is not None:
+            fields.append("sheet_name")
+            constants["sheet_name"] = sheet_name
+        if not table_rows:
+            return RecordBatch(fields, {}, constants)
+        parser: TableParser = TableParser(self.dict_columns_position, self.column_types, DATE_FORMATS)
+        try:
+            columns: Dict[str, np.ndarray] = parser.parse([row for _, row in table_rows])
+            self.report_type_violations(parser.violations, table_rows)
+            columns = self.skip_rows_with_type_violations(columns, parser.violations, table_rows)
+        except (IndexError, KeyError, ValueError, TypeError) as exception:
+            logger.warning(f"Failed to convert the table in bulk: {exception}. Converting row by row")
+            columns = self.parse_rows_one_by_one(parser, table_rows)
+        long_columns: Dict[str, np.ndarray] = unpivot_months(
+            columns=columns,
+            static_columns=self.row_columns + self.rate_columns,
+            month_columns=self.month_columns,
+            month_names=MONTH_NAMES,
+            year=metadata['year']
+        )
+        return RecordBatch(fields, long_columns, constants)
 
-            # Приведение к булевому значению
-            lower_value: str = stripped_value.lower()
-            if lower_value in {"да", "yes"}:
-                return True
-            elif lower_value in {"нет", "no"}:
-                return False
+    def parse_rows_one_by_one(
+        self,
+        parser: TableParser,
+        table_rows: List[Tuple[Union[int, Hashable], list]]
+    ) -> Dict[str, np.ndarray]:
+        """
+        Converts the rows one by one with the same converters as the whole table, to find the rows with errors.
 
-            # Проверка, является ли значение числом
-            if not self._is_digit(stripped_value):
-                return stripped_value
+        A row with an error is reported with the error code 5 (see send_row_error). With `collect_errors`
+        it is skipped and kept in `row_errors` instead (see add_row_error), so the other rows are converted.
 
+        :param parser: The parser of the table.
+        :param table_rows: A list of tuples of the row index and the list of values in the row.
+        :return: A dictionary where the keys are the English names of the columns and the values are
+                 arrays with the converted values of the rows without errors.
+        """
+        parsed_rows: List[Dict[str, np.ndarray]] = []
+        valid_rows: List[Tuple[Union[int, Hashable], list]] = []
+        violations: Dict[str, List[Tuple[int, str]]] = {}
+        for index, row in table_rows:
             try:
-                return float(stripped_value) if '.' in stripped_value else int(stripped_value)
-            except (ValueError, TypeError) as e:
-                logger.warning(
-                    f"Failed to convert value '{stripped_value}' to number: {str(e)}. "
-                    f"Returning original stripped string."
-                )
-                return stripped_value
-
-        logger.info(f'row {index} is {row}')
-        parsed_record: dict = {
-            "client": parse_value(row, "client"),
-            "description": parse_value(row, "description"),
-            "project": parse_value(row, "project"),
-            "cargo": parse_value(row, "cargo"),
-            "direction": parse_value(row, "direction"),
-            "bay": parse_value(row, "bay"),
-            "owner": parse_value(row, "owner"),
-            "container_size": parse_value(row, "container_size"),
-            "month": index_month,
-            "month_string": month_string,
-            "date": f"{metadata['year']}-{index_month:02d}-01",
-
-            "container_count": next((
-                parse_value(row, key)
-                for key, val in BLOCK_TABLE_COLUMNS["natural_indicators_ktk"].items()
-                if month_string in val
-            ), None),
-            "teu": next((
-                parse_value(row, key)
-                for key, val in BLOCK_TABLE_COLUMNS["natural_indicators_teus"].items()
-                if month_string in val
-            ), None),
-
-            "co_executor_rate_per_unite_marine": parse_value(row, "co_executor_rate_per_unite_marine"),
-            "co_executor_rate_per_unite_port": parse_value(row, "co_executor_rate_per_unite_port"),
-            "co_executor_rate_per_unite_terminal1": parse_value(row, "co_executor_rate_per_unite_terminal1"),
-            "co_executor_rate_per_unite_terminal2": parse_value(row, "co_executor_rate_per_unite_terminal2"),
-            "co_executor_rate_per_unite_other_terminal": parse_value(row, "co_executor_rate_per_unite_other_terminal"),
-            "co_executor_rate_per_unite_avto1": parse_value(row, "co_executor_rate_per_unite_avto1"),
-            "co_executor_rate_per_unite_avto2": parse_value(row, "co_executor_rate_per_unite_avto2"),
-            "co_executor_rate_per_unite_avto3": parse_value(row, "co_executor_rate_per_unite_avto3"),
-            "co_executor_rate_per_unite_rzhd1": parse_value(row, "co_executor_rate_per_unite_rzhd1"),
-            "co_executor_rate_per_unite_rzhd2": parse_value(row, "co_executor_rate_per_unite_rzhd2"),
-            "co_executor_rate_per_unite_custom": parse_value(row, "co_executor_rate_per_unite_custom"),
-            "co_executor_rate_per_unite_demurrage": parse_value(row, "co_executor_rate_per_unite_demurrage"),
-            "co_executor_rate_per_unite_storage": parse_value(row, "co_executor_rate_per_unite_storage"),
-            "co_executor_rate_per_unite_other1": parse_value(row, "co_executor_rate_per_unite_other1"),
-            "co_executor_rate_per_unite_other2": parse_value(row, "co_executor_rate_per_unite_other2"),
-            "co_executor_rate_per_unite_separation": parse_value(row, "co_executor_rate_per_unite_separation"),
-            "co_executor_rate_per_unite_fee": parse_value(row, "co_executor_rate_per_unite_fee"),
-            "co_executor_rate_per_unite_value_money": parse_value(row, "co_executor_rate_per_unite_value_money"),
-            "co_executor_rate_per_unite_tax": parse_value(row, "co_executor_rate_per_unite_tax"),
-
-            "unit_margin_income_marine": parse_value(row, "unit_margin_income_marine"),
-            "unit_margin_income_port": parse_value(row, "unit_margin_income_port"),
-            "unit_margin_income_terminal1": parse_value(row, "unit_margin_income_terminal1"),
-            "unit_margin_income_terminal2": parse_value(row, "unit_margin_income_terminal2"),
-            "unit_margin_income_other_terminal": parse_value(row, "unit_margin_income_other_terminal"),
-            "unit_margin_income_avto1": parse_value(row, "unit_margin_income_avto1"),
-            "unit_margin_income_avto2": parse_value(row, "unit_margin_income_avto2"),
-            "unit_margin_income_avto3": parse_value(row, "unit_margin_income_avto3"),
-            "unit_margin_income_rzhd1": parse_value(row, "unit_margin_income_rzhd1"),
-            "unit_margin_income_rzhd2": parse_value(row, "unit_margin_income_rzhd2"),
-            "unit_margin_income_custom": parse_value(row, "unit_margin_income_custom"),
-            "unit_margin_income_demurrage": parse_value(row, "unit_margin_income_demurrage"),
-            "unit_margin_income_storage": parse_value(row, "unit_margin_income_storage"),
-            "unit_margin_income_other1": parse_value(row, "unit_margin_income_other1"),
-            "unit_margin_income_other2": parse_value(row, "unit_margin_income_other2"),
-            "unit_margin_income_separation": parse_value(row, "unit_margin_income_separation"),
-            "unit_margin_income_fee": parse_value(row, "unit_margin_income_fee"),
-            "unit_margin_income_value_money": parse_value(row, "unit_margin_income_value_money"),
-            "unit_margin_income_tax": parse_value(row, "unit_margin_income_tax"),
-
-            "service_marine": parse_value(row, "service_marine"),
-            "service_port": parse_value(row, "service_port"),
-            "service_terminal1": parse_value(row, "service_terminal1"),
-            "service_terminal2": parse_value(row, "service_terminal2"),
-            "service_other_terminal": parse_value(row, "service_other_terminal"),
-            "service_avto1": parse_value(row, "service_avto1"),
-            "service_avto2": parse_value(row, "service_avto2"),
-            "service_avto3": parse_value(row, "service_avto3"),
-            "service_rzhd1": parse_value(row, "service_rzhd1"),
-            "service_rzhd2": parse_value(row, "service_rzhd2"),
-            "service_custom": parse_value(row, "service_custom"),
-            "service_demurrage": parse_value(row, "service_demurrage"),
-            "service_storage": parse_value(row, "service_storage"),
-            "service_other1": parse_value(row, "service_other1"),
-            "service_other2": parse_value(row, "service_other2"),
-            "service_separation": parse_value(row, "service_separation"),
-            "service_fee": parse_value(row, "service_fee"),
-            "service_value_money": parse_value(row, "service_value_money"),
-            "service_tax": parse_value(row, "service_tax"),
-
-            "co_executor_marine": parse_value(row, "co_executor_marine"),
-            "co_executor_port": parse_value(row, "co_executor_port"),
-            "co_executor_terminal1": parse_value(row, "co_executor_terminal1"),
-            "co_executor_terminal2": parse_value(row, "co_executor_terminal2"),
-            "co_executor_other_terminal": parse_value(row, "co_executor_other_terminal"),
-            "co_executor_avto1": parse_value(row, "co_executor_avto1"),
-            "co_executor_avto2": parse_value(row, "co_executor_avto2"),
-            "co_executor_avto3": parse_value(row, "co_executor_avto3"),
-            "co_executor_rzhd1": parse_value(row, "co_executor_rzhd1"),
-            "co_executor_rzhd2": parse_value(row, "co_executor_rzhd2"),
-            "co_executor_custom": parse_value(row, "co_executor_custom"),
-            "co_executor_demurrage": parse_value(row, "co_executor_demurrage"),
-            "co_executor_storage": parse_value(row, "co_executor_storage"),
-            "co_executor_other1": parse_value(row, "co_executor_other1"),
-            "co_executor_other2": parse_value(row, "co_executor_other2"),
-            "co_executor_separation": parse_value(row, "co_executor_separation"),
-            "co_executor_fee": parse_value(row, "co_executor_fee"),
-            "co_executor_value_money": parse_value(row, "co_executor_value_money"),
-            "co_executor_tax": parse_value(row, "co_executor_tax"),
-
-            "reimbursable_sign_76_marine": parse_value(row, "reimbursable_sign_76_marine"),
-            "reimbursable_sign_76_port": parse_value(row, "reimbursable_sign_76_port"),
-            "reimbursable_sign_76_terminal1": parse_value(row, "reimbursable_sign_76_terminal1"),
-            "reimbursable_sign_76_terminal2": parse_value(row, "reimbursable_sign_76_terminal2"),
-            "reimbursable_sign_76_other_terminal": parse_value(row, "reimbursable_sign_76_other_terminal"),
-            "reimbursable_sign_76_avto1": parse_value(row, "reimbursable_sign_76_avto1"),
-            "reimbursable_sign_76_avto2": parse_value(row, "reimbursable_sign_76_avto2"),
-            "reimbursable_sign_76_avto3": parse_value(row, "reimbursable_sign_76_avto3"),
-            "reimbursable_sign_76_rzhd1": parse_value(row, "reimbursable_sign_76_rzhd1"),
-            "reimbursable_sign_76_rzhd2": parse_value(row, "reimbursable_sign_76_rzhd2"),
-            "reimbursable_sign_76_custom": parse_value(row, "reimbursable_sign_76_custom"),
-            "reimbursable_sign_76_demurrage": parse_value(row, "reimbursable_sign_76_demurrage"),
-            "reimbursable_sign_76_storage": parse_value(row, "reimbursable_sign_76_storage"),
-            "reimbursable_sign_76_other1": parse_value(row, "reimbursable_sign_76_other1"),
-            "reimbursable_sign_76_other2": parse_value(row, "reimbursable_sign_76_other2"),
-            "reimbursable_sign_76_separation": parse_value(row, "reimbursable_sign_76_separation"),
-            "reimbursable_sign_76_fee": parse_value(row, "reimbursable_sign_76_fee"),
-            "reimbursable_sign_76_value_money": parse_value(row, "reimbursable_sign_76_value_money"),
-            "reimbursable_sign_76_tax": parse_value(row, "reimbursable_sign_76_tax"),
-
-            "original_file_name": self.basename_filename,
-            "original_file_parsed_on": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                parsed_rows.append(parser.parse([row]))
+            except (IndexError, KeyError, ValueError, TypeError) as row_exception:
+                if not self.collect_errors:
+                    self.send_row_error(index, row_exception)
+                self.add_row_error(index, row, type(row_exception).__name__, str(row_exception))
+                continue
+            for column, cells in parser.violations.items():
+                violations.setdefault(column, []).extend((len(valid_rows), value) for _, value in cells)
+            valid_rows.append((index, row))
+        self.report_type_violations(violations, valid_rows)
+        columns: Dict[str, np.ndarray] = {
+            column: np.concatenate([parsed[column] for parsed in parsed_rows]) if parsed_rows
+            else np.empty(0, dtype=object)
+            for column in self.dict_columns_position
         }
+        return self.skip_rows_with_type_violations(columns, violations, valid_rows)
 
-        return self._merge_two_dicts(metadata, parsed_record)
+    def skip_rows_with_type_violations(
+        self,
+        columns: Dict[str, np.ndarray],
+        violations: Dict[str, List[Tuple[int, str]]],
+        table_rows: List[Tuple[Union[int, Hashable], list]]
+    ) -> Dict[str, np.ndarray]:
+        """
+        With `strict_types`, the rows with cells that don't match the type of their column are rows with errors:
+        the first one is reported with the error code 5 (see send_row_error), or, with `collect_errors`,
+        they are removed from the converted table and kept in `row_errors` (see add_row_error).
+        Without `strict_types` these cells are written as empty and the table is returned as is.
+
+        :param columns: The converted columns of the table.
+        :param violations: The violations from TableParser, the offsets of the rows and the values per column.
+        :param table_rows: A list of tuples of the row index and the list of values in the row.
+        :return: The converted columns without the rows with violations.
+        """
+        if not self.strict_types or not violations:
+            return columns
+        messages: Dict[int, List[str]] = {}
+        for column, cells in violations.items():
+            for offset, value in cells:
+                messages.setdefault(offset, []).append(f"{column}: {value!r} is not {self.column_types[column]}")
+        for offset in sorted(messages):
+            index, row = table_rows[offset]
+            if not self.collect_errors:
+                self.send_row_error(index, ValueError("; ".join(messages[offset])))
+            self.add_row_error(index, row, "TypeViolation", "; ".join(messages[offset]))
+        keep: np.ndarray = np.ones(len(table_rows), dtype=bool)
+        keep[list(messages)] = False
+        return {column: values[keep] for column, values in columns.items()}
+
+    def report_type_violations(
+        self,
+        violations: Dict[str, List[Tuple[int, str]]],
+        table_rows: List[Tuple[Union[int, Hashable], list]],
+        max_examples: int = 3
+    ) -> None:
+        """
+        Logs the cells that don't match the type of their column, counts them and keeps every cell
+        for the report of the errors of the file (see report_errors).
+
+        The total per column is logged once for the file in write_output.
+
+        :param violations: The violations from TableParser, the offsets of the rows and the values per column.
+        :param table_rows: A list of tuples of the row index and the list of values in the row.
+        :param max_examples: The number of the cells logged per column.
+        :return: None
+        """
+        for column, cells in violations.items():
+            self.type_violations[column] = self.type_violations.get(column, 0) + len(cells)
+            self.metrics.count("type_violations", len(cells))
+            self.type_violation_cells.extend(
+                {
+                    "sheet": self.current_sheet,
+                    "row": table_rows[offset][0] + 1,
+                    "column": column,
+                    "type": self.column_types[column],
+                    "value": value
+                }
+                for offset, value in cells
+            )
+            examples: str = ", ".join(
+                f"row {table_rows[offset][0] + 1}: {value!r}" for offset, value in cells[:max_examples]
+            )
+            logger.warning(
+                f"File - {self.basename_filename}. {len(cells)} values of the column {column} "
+                f"are not {self.column_types[column]}, they are written as empty ({examples})"
+            )
 
     def extract_metadata_from_filename(self) -> dict:
         """
@@ -575,13 +698,14 @@ class DKP(object):
         """
         logger.info(f'File - {self.basename_filename}. Datetime - {datetime.now()}')
         # Match department
-        dkp_pattern: str = '|'.join(map(re.escape, DKP_NAMES.keys()))
+        dkp_names: Dict[str, str] = references.get("DKP_NAMES")
+        dkp_pattern: str = '|'.join(map(re.escape, dkp_names.keys()))
         department_match: Match = re.search(rf'{dkp_pattern}', self.basename_filename)
         if not department_match:
             self.send_error(
                 message='Error code 10: Department не указан в файле! Файл:', error_code=10
             )
-        metadata: dict = {'department': DKP_NAMES[f"{department_match.group(0)}"]}
+        metadata: dict = {'department': dkp_names[f"{department_match.group(0)}"]}
         # Match year
         year_match: Match = re.search(r'\d{4}', self.basename_filename)
         if not year_match:
@@ -605,83 +729,808 @@ class DKP(object):
         """
         error_message: str = f"{message} {self.basename_filename}"
         logger.error(error_message)
-        telegram(error_message)
+        self.send_notification(error_message)
         sys.exit(error_code)
 
-    def parse_sheet(self, df: pd.DataFrame, coefficient_of_header: int = 3) -> None:
+    def send_notification(self, message: str) -> None:
+        """
+        Sends a message to Telegram and by email, unless the notifications are turned off.
+        The message is kept in `errors` either way.
+
+        :param message: The text of the message.
+        :return: None
+        """
+        self.errors.append(message)
+        if self.is_notifying:
+            telegram(message)
+
+    def send_empty_file_error(self) -> None:
+        """
+        Reports a file without the data of the table and exits with the error code 4.
+        :return: None
+        """
+        logger.error("Error code 4: length list equals 0!")
+        print("4", file=sys.stderr)
+        self.send_notification(f"Error code 4: В Файле отсутствуют данные! Файл: {self.basename_filename}")
+        sys.exit(4)
+
+    def send_file_error(self, exception: Exception) -> None:
+        """
+        Reports an unexpected error while reading the file and exits with the error code 6.
+
+        :param exception: The exception raised while processing the file.
+        :return: None
+        """
+        logger.error(f"Ошибка при чтении файла {self.basename_filename}: {exception}")
+        self.send_notification(
+            f'Error code 6: Ошибка при обработке файла! Файл: {self.basename_filename}! Ошибка: {exception}'
+        )
+        print("unknown", file=sys.stderr)
+        sys.exit(6)
+
+    def send_row_error(self, index: Union[int, Hashable], exception: Exception) -> None:
+        """
+        Reports an error in a row of the table and exits with the error code 5.
+
+        :param index: The index of the row in the sheet.
+        :param exception: The exception raised while processing the row.
+        :return: None
+        """
+        self.send_notification(
+            f"Error code 5: Ошибка возникла в строке {index + 1}! "
+            f"Файл: {self.basename_filename}. Exception - {exception}"
+        )
+        logger.error(f"Error code 5: error processing in row {index + 1}! Exception - {exception}")
+        print(f"5_in_row_{index + 1}", file=sys.stderr)
+        sys.exit(5)
+
+    def add_row_error(self, index: Union[int, Hashable], row: list, error: str, message: str) -> None:
+        """
+        Keeps an error in a row of the table for the report of the errors of the file (see report_errors).
+
+        :param index: The index of the row in the sheet.
+        :param row: The list of values in the row, kept for the quarantine file.
+        :param error: The kind of the error: the name of the exception or "TypeViolation".
+        :param message: The description of the error.
+        :return: None
+        """
+        logger.warning(f"File - {self.basename_filename}. Error in row {index + 1}, the row is skipped: {message}")
+        self.metrics.count("row_errors")
+        self.row_errors.append({
+            "sheet": self.current_sheet,
+            "row": index + 1,
+            "error": error,
+            "message": message,
+            "values": list(row)
+        })
+
+    def get_error_report_paths(self) -> Tuple[str, str]:
+        """
+        Returns the paths to the report of the errors of the file and to its quarantine file in ERROR_REPORT_PATH.
+        :return: A tuple of the path to the report and the path to the quarantine file.
+        """
+        return (
+            os.path.join(ERROR_REPORT_PATH, f"{self.basename_filename}.errors.json"),
+            os.path.join(ERROR_REPORT_PATH, f"{self.basename_filename}.quarantine.json")
+        )
+
+    def remove_error_report(self) -> None:
+        """
+        Removes the report of the errors and the quarantine file left by an earlier conversion of the file.
+        :return: None
+        """
+        for path in self.get_error_report_paths():
+            try:
+                os.remove(path)
+                logger.info(f"File - {self.basename_filename}. The report of an earlier conversion {path} is removed")
+            except FileNotFoundError:
+                pass
+
+    def write_error_report(self) -> Tuple[str, Optional[str]]:
+        """
+        Writes the report of the rows with errors and the cells that don't match the type of their column
+        to ERROR_REPORT_PATH and, with `quarantine`, the quarantine file with the values of the rows with errors,
+        so they can be fixed and converted again.
+
+        :return: A tuple of the path to the report and the path to the quarantine file (None without `quarantine`).
+        """
+        self.remove_error_report()
+        os.makedirs(ERROR_REPORT_PATH, exist_ok=True)
+        report_path, quarantine_path = self.get_error_report_paths()
+        report: dict = {
+            "file": self.basename_filename,
+            "parsed_on": self.parsed_on,
+            "count_rows": len(self.row_errors),
+            "quarantined": self.quarantine,
+            "errors": [
+                {field: value for field, value in error.items() if field != "values"} for error in self.row_errors
+            ],
+            "count_type_violations": self.type_violations,
+            "type_violations": self.type_violation_cells
+        }
+        write_atomically(report_path, json.dumps(report, ensure_ascii=False, indent=4, cls=JsonEncoder))
+        if not self.quarantine or not self.row_errors:
+            return report_path, None
+        write_atomically(quarantine_path, json.dumps(self.row_errors, ensure_ascii=False, indent=4, cls=JsonEncoder))
+        return report_path, quarantine_path
+
+    def report_errors(self) -> None:
+        """
+        Reports all rows with errors collected in one pass with `collect_errors`
+        and the cells that don't match the type of their column, in one message.
+
+        The rows and the cells are listed in the report written by write_error_report; if there is nothing
+        to report, the report of an earlier conversion of the file is removed. Without `quarantine`
+        the rows with errors make the file exit with the error code 5, as on the first row with an error
+        without `collect_errors`. With `quarantine` the other rows are written to the output and the file
+        is converted. The cells that don't match the type are written as empty and the file is converted.
+
+        :return: None
+        """
+        if not self.row_errors and not self.type_violation_cells:
+            self.remove_error_report()
+            return
+        report_path, quarantine_path = self.write_error_report()
+        if not self.row_errors:
+            self.send_notification(
+                f"{len(self.type_violation_cells)} значений не соответствуют типу столбца и записаны пустыми "
+                f"({self.type_violations}). Файл: {self.basename_filename}. Отчет - {report_path}"
+            )
+            return
+        rows: str = ", ".join(
+            str(error["row"]) if error["sheet"] is None else f"{error['sheet']}!{error['row']}"
+            for error in self.row_errors[:10]
+        )
+        if len(self.row_errors) > 10:
+            rows += ", ..."
+        if quarantine_path is None:
+            self.send_notification(
+                f"Error code 5: Ошибки возникли в {len(self.row_errors)} строках ({rows})! "
+                f"Файл: {self.basename_filename}. Отчет - {report_path}"
+            )
+            logger.error(f"Error code 5: errors in {len(self.row_errors)} rows, the report is {report_path}")
+            print(f"5_in_rows_{len(self.row_errors)}", file=sys.stderr)
+            sys.exit(5)
+        self.send_notification(
+            f"Строки с ошибками ({len(self.row_errors)}: {rows}) перенесены в карантин {quarantine_path}, "
+            f"остальные строки загружены. Файл: {self.basename_filename}. Отчет - {report_path}"
+        )
+        logger.warning(
+            f"File - {self.basename_filename}. {len(self.row_errors)} rows with errors are written "
+            f"to {quarantine_path}, the report is {report_path}"
+        )
+
+    def iter_table_chunks(self, rows: Iterable[Row], coefficient_of_header: int = 3) -> Iterator[List[Row]]:
+        """
+        Finds the header and the table in the rows of a sheet and yields the rows of the table in chunks.
+
+        The rows before the header are used to find the blocks, the header row sets the positions of the columns,
+        the rows with a client after it are the rows of the table. A chunk is yielded every `chunk_rows`
+        rows of the table and before a new header row is applied, so every chunk has one layout of columns.
+
+        :param rows: The rows of the sheet as tuples of the row index and the values of the row.
+        :param coefficient_of_header: The coefficient to determine if a row is a header or not.
+        :return: An iterator of lists of rows of the table.
+        """
+        table_rows: List[Row] = []
+        for index, row in rows:
+            self.metrics.count("sheet_rows")
+            if self._get_probability_of_header(row) > coefficient_of_header:
+                # The rows collected so far belong to the previous header
+                if table_rows:
+                    yield table_rows
+                table_rows = []
+                self.metrics.count("header_rows")
+                with self.metrics.stage("header"):
+                    self.resolve_header(row)
+            elif not self.dict_columns_position["client"]:
+                self.get_columns_position(row, [0, len(row)], header_index.BLOCKS, self.dict_block_position)
+            elif self._is_table_starting(row):
+                if row_logger.isEnabledFor(logging.DEBUG):
+                    row_logger.debug("File - %s. Row %s is %s", self.basename_filename, index, row)
+                table_rows.append((index, row))
+                self.metrics.count("table_rows")
+                if len(table_rows) >= self.chunk_rows:
+                    yield table_rows
+                    table_rows = []
+        if table_rows:
+            yield table_rows
+
+    def prepare_conversion(self) -> dict:
+        """
+        Extracts the metadata from the filename and sets up what is the same for every sheet of the file:
+        the time of parsing, the columns of the months and the types of the columns.
+
+        :return: The metadata from extract_metadata_from_filename.
+        """
+        metadata: dict = self.extract_metadata_from_filename()
+        self.parsed_on = self.parsed_on or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        block_table_columns: dict = references.get("BLOCK_TABLE_COLUMNS")
+        self.month_columns = {
+            "container_count": get_month_columns(block_table_columns["natural_indicators_ktk"], MONTH_NAMES),
+            "teu": get_month_columns(block_table_columns["natural_indicators_teus"], MONTH_NAMES)
+        }
+        column_types: Dict[str, str] = references.get("COLUMN_TYPES")
+        unknown_types: dict = {column: type_ for column, type_ in column_types.items() if type_ not in TYPES}
+        if unknown_types:
+            logger.warning(f"Unknown types of the columns in reference_dkp are ignored: {unknown_types}")
+        self.column_types = get_column_types(
+            numeric_columns=[column for columns in self.month_columns.values() for column in columns],
+            overrides={column: type_ for column, type_ in column_types.items() if type_ in TYPES}
+        )
+        return metadata
+
+    def parse_sheet(
+        self,
+        rows: Iterable[Row],
+        metadata: dict,
+        writer: RecordWriter,
+        sheet_name: Optional[str] = None,
+        coefficient_of_header: int = 3
+    ) -> None:
         """
         Parse a sheet of Excel file.
 
-        This method takes a pandas DataFrame, representing a sheet of the Excel file,
-        and parses it, extracting metadata from the filename,
+        This method takes the rows of a sheet of the Excel file and parses them as a pipeline of generators,
         identifying the header and the table, and extracting content from the table.
-        It then writes the extracted content to a JSON file.
+        The extracted content is given to the writer every `chunk_rows` rows of the table,
+        so the records of the whole sheet are never kept in memory. With a memory budget, the number of rows
+        per chunk is fitted to the budget after the first chunk (see fit_chunk_to_memory_budget).
+        Every sheet starts with no known positions of the blocks and the columns,
+        so the layout of one sheet never leaks into another.
 
         If an error occurs during processing, it logs an error message with the error code 5,
         sends a message to Telegram with the error code and the filename,
         and then exits with the error code 5.
 
-        :param df: The pandas DataFrame representing the sheet of the Excel file.
+        :param rows: The rows of the sheet as tuples of the row index and the values of the row.
+        :param metadata: The metadata from prepare_conversion.
+        :param writer: The writer of the records.
+        :param sheet_name: The name of the sheet to write with every record, or None not to write it.
         :param coefficient_of_header: The coefficient to determine if a row is a header or not.
         :return: None
         """
-        list_data: list = []
-        metadata: dict = self.extract_metadata_from_filename()
-        list_columns: List[str] = self._get_list_columns()
-        index: Union[int, Hashable]
-        for index, row in df.iterrows():
-            row = list(row.to_dict().values())
-            if self._get_probability_of_header(row, list_columns) > coefficient_of_header:
-                self.check_errors_in_header(row)
-            elif not self.dict_columns_position["client"]:
-                self.get_columns_position(row, [0, len(row)], BLOCK_NAMES, self.dict_block_position)
-            elif self._is_table_starting(row):
-                try:
-                    list_data.extend(
-                        self.get_content_in_table(index, index_month, month_string, row, metadata)
-                        for index_month, month_string in enumerate(MONTH_NAMES, start=1)
-                    )
-                except (IndexError, ValueError, TypeError) as exception:
-                    telegram(
-                        f"Error code 5: Ошибка возникла в строке {index + 1}! "
-                        f"Файл: {self.basename_filename}. Exception - {exception}"
+        self.reset_layout()
+        baseline: Optional[int] = get_rss_bytes() if self.memory_budget else None
+        for table_rows in self.metrics.iterate("layout", self.iter_table_chunks(rows, coefficient_of_header)):
+            with self.metrics.stage("convert"):
+                records: RecordBatch = self.get_content_in_rows(table_rows, metadata, sheet_name)
+            with self.metrics.stage("write"):
+                writer.write(records)
+            if baseline is not None:
+                self.fit_chunk_to_memory_budget(baseline, len(table_rows))
+                baseline = None
+
+    def convert_sheets(self, workbook: pd.ExcelFile, sheets: List[str]) -> None:
+        """
+        Parses the given sheets and writes the records of all of them to one output, sheet by sheet.
+
+        If the workbook has several DKP sheets, every record gets the name of its sheet as `sheet_name`,
+        and the sheets are parsed in parallel processes (see parse_sheets_in_parallel).
+        The rows with errors collected with `collect_errors` and the cells that don't match the type
+        of their column are reported once for all sheets.
+
+        :param workbook: The opened Excel file.
+        :param sheets: The names of the sheets to convert.
+        :return: None
+        """
+        metadata: dict = self.prepare_conversion()
+        writer: RecordWriter = self.get_writer(metadata)
+        try:
+            if len(sheets) > 1 and self.get_sheet_workers(len(sheets)) > 1:
+                self.parse_sheets_in_parallel(sheets, writer)
+            else:
+                for sheet in sheets:
+                    self.current_sheet = sheet
+                    with self.metrics.stage("read"):
+                        rows: Iterator[Row] = self.iter_sheet_rows(workbook, sheet)
+                    self.parse_sheet(
+                        self.metrics.iterate("read", rows), metadata, writer, sheet if len(sheets) > 1 else None
                     )
-                    logger.error(f"Error code 5: error processing in row {index + 1}! Exception - {exception}")
-                    print(f"5_in_row_{index + 1}", file=sys.stderr)
-                    sys.exit(5)
-        self.write_to_json(list_data)
+            self.report_errors()
+            self.write_output(writer)
+        finally:
+            writer.abort()
+
+    def get_sheet_workers(self, count_sheets: int) -> int:
+        """
+        Returns the number of processes to parse the sheets in.
+
+        A daemonic process (e.g. a worker of multiprocessing.Pool) can't start processes, so it parses
+        the sheets itself. The workers of convert_files are not daemonic, they get `sheet_workers` 1 instead,
+        so the processes of the batch are not multiplied by the number of the sheets.
+
+        :param count_sheets: The number of the sheets to parse.
+        :return: The number of processes, 1 to parse the sheets in this process.
+        """
+        if multiprocessing.current_process().daemon:
+            return 1
+        return max(1, min(count_sheets, self.sheet_workers or os.cpu_count() or 1))
+
+    def parse_sheets_in_parallel(self, sheets: List[str], writer: RecordWriter) -> None:
+        """
+        Parses every sheet in a process of a process pool and writes the records in the order of the sheets.
+
+        Every process opens the workbook itself and writes the records of its sheet to a temporary file
+        (see parse_sheet_part), which is then given to the writer here. The memory budget is shared
+        equally by the processes. The time of the stages and the counts
+        of the processes are added to the metrics of the file, so the stages show the time of all processes.
+        If a sheet fails, its error has already been reported by its process, and the file exits with its code.
+
+        :param sheets: The names of the sheets.
+        :param writer: The writer of the output.
+        :return: None
+        """
+        workers: int = self.get_sheet_workers(len(sheets))
+        options: dict = {
+            "stream": self.stream,
+            "chunk_rows": self.chunk_rows,
+            "collect_errors": self.collect_errors,
+            "strict_types": self.strict_types,
+            "memory_budget_mb": self.memory_budget / 1024 / 1024 / workers if self.memory_budget else None
+        }
+        logger.info(f"File - {self.basename_filename}. Parsing {len(sheets)} sheets in {workers} processes")
+        with tempfile.TemporaryDirectory(prefix="dkp_sheets_") as tmp_path, ProcessPoolExecutor(
+            max_workers=workers, initializer=reset_clickhouse_client
+        ) as executor:
+            futures: List[Future] = [
+                executor.submit(
+                    parse_sheet_part, self.filename, sheet, self.parsed_on,
+                    os.path.join(tmp_path, f"{index}.pickle"), options
+                )
+                for index, sheet in enumerate(sheets)
+            ]
+            for sheet, future in zip(sheets, futures):
+                result: dict = future.result()
+                self.metrics.merge(result["metrics"])
+                for column, count in result["type_violations"].items():
+                    self.type_violations[column] = self.type_violations.get(column, 0) + count
+                self.type_violation_cells.extend(result["type_violation_cells"])
+                self.row_errors.extend(result["row_errors"])
+                if result["exit_code"] != 0:
+                    logger.error(f"File - {self.basename_filename}. Sheet {sheet} failed, the file is not written")
+                    sys.exit(result["exit_code"])
+                for records in read_spool(result["path"]):
+                    with self.metrics.stage("write"):
+                        writer.write(records)
+
+    def find_header(self, rows: Iterable[Row], coefficient_of_header: int = 3) -> Optional[Union[int, Hashable]]:
+        """
+        Reads the rows of a sheet up to the first header and resolves the positions of the blocks and the columns,
+        exactly as iter_table_chunks does, but without reading the table.
+
+        :param rows: The rows of the sheet as tuples of the row index and the values of the row.
+        :param coefficient_of_header: The coefficient to determine if a row is a header or not.
+        :return: The index of the header row, or None if the sheet has no header.
+        """
+        for index, row in rows:
+            if self._get_probability_of_header(row) > coefficient_of_header:
+                self.resolve_header(row)
+                return index
+            self.get_columns_position(row, [0, len(row)], header_index.BLOCKS, self.dict_block_position)
+        return None
+
+    def validate(self) -> dict:
+        """
+        Checks the structure of the file without converting it.
+
+        The name of the file, the set of the sheets and the header of every DKP sheet are checked the same way
+        as in a conversion, with the same error codes and messages: only the names of the sheets and the rows
+        up to the first row of the table are read (.xlsx sheets are read lazily). The values of the table
+        are not checked.
+
+        :return: A dictionary with the verdict: `valid`, `exit_code`, the error messages, the metadata from the
+                 name of the file, the DKP sheets with the number of their header row, warnings and the time.
+        """
+        started_at: float = time.perf_counter()
+        verdict: dict = {"file": self.basename_filename, "valid": False, "exit_code": 0, "errors": self.errors}
+        header_rows: Dict[str, Optional[int]] = {}
+        tables: List[bool] = []
+        warnings: List[str] = []
+        self.stream = True
+        try:
+            try:
+                verdict.update(self.extract_metadata_from_filename())
+                with self.open_workbook() as workbook:
+                    sheets: List[str] = [
+                        sheet for sheet in workbook.sheet_names if sheet in references.get("SHEETS_NAME")
+                    ]
+                    if not sheets:
+                        warnings.append(f"Нет листов из SHEETS_NAME, листы файла: {workbook.sheet_names}")
+                    for sheet in sheets:
+                        self.reset_layout()
+                        rows: Iterator[Row] = iter(self.iter_sheet_rows(workbook, sheet))
+                        index: Optional[Union[int, Hashable]] = self.find_header(rows)
+                        has_table: bool = index is not None and any(self._is_table_starting(row) for _, row in rows)
+                        header_rows[sheet] = None if index is None else index + 1
+                        if not has_table:
+                            warnings.append(f"На листе {sheet} нет таблицы")
+                        tables.append(has_table)
+                if sheets and not any(tables):
+                    self.send_empty_file_error()
+            except Exception as exception:
+                self.send_file_error(exception)
+        except SystemExit as exception:
+            verdict["exit_code"] = exception.code if isinstance(exception.code, int) else 1
+        verdict.update(
+            valid=verdict["exit_code"] == 0,
+            sheets=header_rows,
+            warnings=warnings,
+            seconds=round(time.perf_counter() - started_at, 3)
+        )
+        return verdict
+
+    def open_workbook(self) -> pd.ExcelFile:
+        """
+        Opens the Excel file without reading its sheets.
+
+        The workbook is opened once, and the names of the sheets are read from its metadata only.
+        A sheet is read when it is parsed: for .xlsx and .xlsb files pandas already loads sheets lazily,
+        for the old .xls format the workbook is opened by xlrd with `on_demand=True` for the same reason.
+
+        :return: The opened Excel file.
+        """
+        with open(self.filename, 'rb') as f:
+            is_xls: bool = f.read(len(XLS_SIGNATURE)) == XLS_SIGNATURE
+        if is_xls:
+            return pd.ExcelFile(xlrd.open_workbook(self.filename, on_demand=True))
+        return pd.ExcelFile(self.filename)
+
+    def iter_sheet_rows(self, workbook: pd.ExcelFile, sheet: str) -> Iterator[Row]:
+        """
+        Reads the rows of a sheet of the opened Excel file.
+
+        In the streaming mode, the rows of .xlsx files are read lazily from the read-only openpyxl workbook
+        that pandas has opened, so the sheet is never loaded as a whole. Otherwise, and for other formats,
+        the sheet is read into a DataFrame first.
+
+        :param workbook: The opened Excel file.
+        :param sheet: The name of the sheet.
+        :return: An iterator of tuples of the row index and the values of the row.
+        """
+        if self.stream and workbook.engine == "openpyxl":
+            return iter_worksheet_rows(workbook.book[sheet])
+        return iter_dataframe_rows(workbook.parse(sheet_name=sheet, dtype=str, header=None))
+
+    def get_conversion_index(self) -> Optional[ConversionIndex]:
+        """
+        Returns the index of the converted files, if the output of this conversion can be reused.
+
+        Only file outputs are reused: the ClickHouse output is loaded by the writer itself. The incremental mode
+        is never reused, as its output depends on the previous version of the file.
+
+        :return: The index or None.
+        """
+        if not self.dedup or self.incremental or self.output_format not in WRITERS:
+            return None
+        return ConversionIndex(DEDUP_INDEX_PATH, DEDUP_STORE_PATH, DEDUP_KEEP_ENTRIES)
+
+    def get_conversion_key(self) -> str:
+        """
+        Returns the key of the conversion in the index of the converted files.
+
+        The same content under the same name, converted with the same reference_dkp table, the same code
+        of the converter and the same output options, gives the same output. The output without the quarantined rows
+        is never reused by a conversion without `quarantine`, which has to fail on these rows.
+
+        :return: The key of the conversion.
+        """
+        return ConversionIndex.get_key(
+            get_file_hash(self.filename),
+            self.basename_filename,
+            references.get("REFERENCE_VERSION"),
+            get_converter_version(),
+            f"{self.output_format}:{self.compress}" + (":quarantine" if self.quarantine else "")
+            + (":strict_types" if self.strict_types else "")
+        )
+
+    def reuse_output(self, index: ConversionIndex, key: str) -> bool:
+        """
+        Puts the output of an earlier conversion of the same file into the output folder, if there is one.
+
+        :param index: The index of the converted files.
+        :param key: The key of the conversion.
+        :return: True if the output was reused and the file does not have to be converted, False otherwise.
+        """
+        output_path: str = self.get_writer().output_path
+        entry: Optional[dict] = index.reuse(key, output_path)
+        if entry is None:
+            return False
+        self.output_path = output_path
+        self.metrics.count("reused_output")
+        logger.info(
+            f"File - {self.basename_filename}. The same file was converted at "
+            f"{datetime.fromtimestamp(entry['converted_at'])}, its output is reused as {output_path} "
+            f"({entry['hits']} times so far)"
+        )
+        return True
 
     def main(self) -> None:
         """
         The main method of the class.
 
-        This method reads the Excel file given by the filename, extracts the needed sheet,
-        parses the sheet, and writes the extracted data to a JSON file.
+        This method opens the Excel file given by the filename once, finds the needed sheets by their names,
+        reads and parses only these sheets, and writes the extracted data to one output file.
+        With `dedup`, if the same file has already been converted (see ConversionIndex), its output is reused
+        instead, and the output of a new conversion is added to the index.
 
         If an error occurs during processing, it logs an error message,
         sends a message to Telegram with the error message,
         and exits with the error code 1.
         :return: None
         """
+        index: Optional[ConversionIndex] = self.get_conversion_index()
+        key: Optional[str] = None
+        if index is not None:
+            try:
+                with self.metrics.stage("dedup"):
+                    key = self.get_conversion_key()
+                    if self.reuse_output(index, key):
+                        return
+            except OSError as exception:
+                logger.warning(f"The index of the converted files is not available: {exception}")
+                index = None
         try:
-            sheets: list = pd.ExcelFile(self.filename).sheet_names
-            logger.info(f"Sheets is {sheets}")
-            needed_sheet: list = [sheet for sheet in sheets if sheet in SHEETS_NAME]
-            if len(needed_sheet) > 1:
-                raise ValueError(f"Нужных листов из SHEETS_NAME больше ОДНОГО: {needed_sheet}")
-            for sheet in needed_sheet:
-                df = pd.read_excel(self.filename, sheet_name=sheet, dtype=str, header=None)
-                df = df.dropna(how='all').replace({np.nan: None, "NaT": None})
-                self.parse_sheet(df)
+            with self.metrics.stage("open"):
+                workbook: pd.ExcelFile = self.open_workbook()
+            with workbook:
+                sheets: list = workbook.sheet_names
+                logger.info(f"Sheets is {sheets}")
+                needed_sheet: list = [sheet for sheet in sheets if sheet in references.get("SHEETS_NAME")]
+                if needed_sheet:
+                    self.convert_sheets(workbook, needed_sheet)
         except Exception as exception:
-            logger.error(f"Ошибка при чтении файла {self.basename_filename}: {exception}")
-            telegram(f'Error code 6: Ошибка при обработке файла! Файл: {self.basename_filename}! Ошибка: {exception}')
-            print("unknown", file=sys.stderr)
-            sys.exit(6)
+            self.send_file_error(exception)
+        if index is not None and self.output_path is not None:
+            try:
+                index.add(key, self.basename_filename, self.output_path)
+            except OSError as exception:
+                logger.warning(f"Failed to add {self.basename_filename} to the index of the converted files: {exception}")
+
+
+def validate_file(filename: str, notify: bool = True) -> dict:
+    """
+    Checks the structure of a file with DKP.validate.
+
+    :param filename: The path to the Excel file.
+    :param notify: Whether to send the errors to Telegram and by email, as a conversion would.
+    :return: The verdict.
+    """
+    verdict: dict = DKP(os.path.abspath(filename), "", notify=notify).validate()
+    logger.info(f"Verdict of the validation of {verdict['file']}: {json.dumps(verdict, ensure_ascii=False)}")
+    return verdict
+
+
+def parse_sheet_part(filename: str, sheet: str, parsed_on: str, part_path: str, options: dict) -> dict:
+    """
+    Parses one sheet of a workbook in a process of the pool of DKP.parse_sheets_in_parallel.
+
+    The records are written to `part_path` with SpoolWriter. The errors are reported by the process itself,
+    as in a conversion of a file, and its exit code is returned instead of exiting.
+
+    :param filename: The path to the Excel file.
+    :param sheet: The name of the sheet.
+    :param parsed_on: The time of parsing of the file, the same for all sheets.
+    :param part_path: The path to the temporary file for the records.
+    :param options: The options of DKP that affect parsing (stream, chunk_rows, collect_errors, strict_types,
+                    memory_budget_mb).
+    :return: A dictionary with the exit code, the path to the records, the metrics, the type violations
+             and the rows with errors collected with `collect_errors`.
+    """
+    converter: DKP = DKP(filename, os.path.dirname(part_path), **options)
+    converter.parsed_on = parsed_on
+    converter.current_sheet = sheet
+    reset_peak_rss()
+    writer: SpoolWriter = SpoolWriter(part_path)
+    exit_code: int = 0
+    try:
+        metadata: dict = converter.prepare_conversion()
+        with converter.metrics.stage("open"):
+            workbook: pd.ExcelFile = converter.open_workbook()
+        with workbook:
+            with converter.metrics.stage("read"):
+                rows: Iterator[Row] = converter.iter_sheet_rows(workbook, sheet)
+            converter.parse_sheet(converter.metrics.iterate("read", rows), metadata, writer, sheet)
+        writer.close()
+    except SystemExit as exception:
+        writer.abort()
+        exit_code = exception.code if isinstance(exception.code, int) else 1
+    finally:
+        stop_dispatcher()
+    converter.metrics.record_peak_rss()
+    return {
+        "exit_code": exit_code,
+        "path": part_path,
+        "metrics": converter.metrics.to_dict(exit_code),
+        "type_violations": converter.type_violations,
+        "type_violation_cells": converter.type_violation_cells,
+        "row_errors": converter.row_errors
+    }
+
+
+def convert_file(filename: str, folder: str, **kwargs) -> int:
+    """
+    Converts a single file in the current process and returns its exit code.
+
+    DKP reports errors by calling sys.exit with the error code, which is what the bash loop relies on.
+    This function catches that exit, so a long-running process can convert many files one after another
+    and still get the same exit code per file as `python3 scripts/dkp.py <file> <folder>` would return.
+    The time of every stage and the counts of the conversion are written to METRICS_PATH (see metrics.FileMetrics),
+    together with the peak memory of the conversion. The notifications of the file are sent before it returns
+    (see notifications.stop_dispatcher), as the processes of the pool of convert_files don't run atexit.
+
+    :param filename: The path to the Excel file.
+    :param folder: The folder to write the JSON file to.
+    :param kwargs: The output options of DKP (output_format, compress, ...).
+    :return: The exit code of the conversion (0 on success).
+    """
+    logger.info(f"{os.path.basename(filename)} has started processing")
+    converter: DKP = DKP(os.path.abspath(filename), folder, **kwargs)
+    exit_code: int = 0
+    reset_peak_rss()
+    try:
+        converter.main()
+    except SystemExit as exception:
+        if exception.code is not None:
+            exit_code = exception.code if isinstance(exception.code, int) else 1
+    finally:
+        stop_dispatcher()
+    converter.metrics.record_peak_rss()
+    try:
+        metrics: dict = converter.metrics.write(METRICS_PATH, exit_code, METRICS_KEEP_FILES)
+    except OSError as exception:
+        logger.error(f"Failed to write the metrics of {converter.basename_filename}: {exception}")
+        metrics = converter.metrics.to_dict(exit_code)
+    logger.info(
+        f"{converter.basename_filename} has finished processing with exit code {exit_code} "
+        f"in {metrics['seconds']:.2f} s, peak memory {metrics['counters']['peak_rss_bytes'] / 1024 / 1024:.0f} MB. "
+        f"Stages: {metrics['stages']}"
+    )
+    return exit_code
+
+
+def get_files_for_batch(paths: List[str]) -> List[str]:
+    """
+    Expands the given files and directories into a list of Excel files to convert.
+
+    Directories are scanned the same way as in `bash/dkp.sh`: only `*.xls*` files in the directory itself,
+    files with `error_` in the name are skipped.
+
+    :param paths: The paths to Excel files or directories with Excel files.
+    :return: A list of paths to Excel files.
+    """
+    files: list = []
+    for path in paths:
+        if not os.path.isdir(path):
+            files.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            file: str = os.path.join(path, name)
+            if fnmatch.fnmatch(name, "*.xls*") and "error_" not in name and os.path.isfile(file):
+                files.append(file)
+    return files
+
+
+def convert_files(filenames: List[str], folder: str, workers: Optional[int] = None, **kwargs) -> Dict[str, int]:
+    """
+    Converts many files in parallel, each of them in a separate process of a process pool.
+
+    Every file gets its own exit code, so a bad file is reported and the others are converted anyway.
+    If a worker process dies (e.g. it was killed by OOM), its file gets the error code 6.
+    The files are already converted in parallel, so every worker parses the sheets of its file itself.
+
+    :param filenames: The paths to the Excel files.
+    :param folder: The folder to write the JSON files to.
+    :param workers: The number of worker processes. Defaults to the number of CPUs.
+    :param kwargs: The output options of DKP (output_format, compress, ...).
+    :return: A dictionary where the keys are the paths to the files and the values are their exit codes.
+    """
+    statuses: Dict[str, int] = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=reset_clickhouse_client) as executor:
+        futures: Dict[Future, str] = {
+            executor.submit(convert_file, filename, folder, **dict(kwargs, sheet_workers=1)): filename
+            for filename in filenames
+        }
+        for future in as_completed(futures):
+            filename: str = futures[future]
+            try:
+                statuses[filename] = future.result()
+            except Exception as exception:
+                logger.error(f"Worker failed on file {os.path.basename(filename)}: {exception}")
+                statuses[filename] = 6
+            print(f"{statuses[filename]}\t{filename}", flush=True)
+    return statuses
+
+
+def add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the options of the output file to the parser.
+    :param parser: The parser of the command line arguments.
+    :return: None
+    """
+    parser.add_argument("--format", dest="output_format", choices=sorted(WRITERS) + ["clickhouse"], default="json",
+                        help="Output format: json (one indented array), ndjson (one record per line), "
+                             "parquet (typed columns, needs pyarrow) or clickhouse (insert into --clickhouse-table)")
+    parser.add_argument("--gzip", dest="compress", action="store_true", help="Compress the output file with gzip")
+    parser.add_argument("--stream", action="store_true",
+                        help="Read the rows of .xlsx files lazily instead of loading the whole sheet")
+    parser.add_argument("--clickhouse-table", default=os.environ.get("DKP_CLICKHOUSE_TABLE", "dkp"),
+                        help="The table for --format clickhouse, with a String column load_id")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Write only the records changed since the previous version of the file "
+                             "of the same department and year")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Reuse the output of an earlier conversion of the same file with the same reference_dkp, "
+                             "converter and output options instead of converting it again")
+    parser.add_argument("--memory-budget", dest="memory_budget_mb", type=float,
+                        default=os.environ.get("DKP_MEMORY_BUDGET_MB"),
+                        help="Memory of the conversion in MB: the sheet is read lazily (.xlsx) and fewer rows "
+                             "are converted at once while the process uses more")
+    parser.add_argument("--sheet-workers", type=int, default=None,
+                        help="Processes to parse the DKP sheets of one workbook in, defaults to the number of CPUs. "
+                             "With --batch every file is parsed in its own worker")
+    parser.add_argument("--collect-errors", action="store_true",
+                        help="Don't stop on the first row with an error: convert all rows, list every row with "
+                             "an error in a report in DKP_ERROR_REPORTS and then fail with the error code 5")
+    parser.add_argument("--quarantine", action="store_true",
+                        help="As --collect-errors, but write the other rows to the output and the rows with "
+                             "errors to a quarantine file next to the report")
+    parser.add_argument("--strict-types", action="store_true",
+                        help="Treat a row with a value that doesn't match the type of its column as a row "
+                             "with an error, instead of writing the value as empty")
+
+
+def get_output_options(arguments: argparse.Namespace) -> dict:
+    """
+    Returns the options of the output file from the parsed arguments, to be passed to DKP.
+    :param arguments: The parsed command line arguments.
+    :return: A dictionary of DKP keyword arguments.
+    """
+    return {
+        "output_format": arguments.output_format,
+        "compress": arguments.compress,
+        "clickhouse_table": arguments.clickhouse_table,
+        "stream": arguments.stream,
+        "dedup": arguments.dedup,
+        "incremental": arguments.incremental,
+        "sheet_workers": arguments.sheet_workers,
+        "memory_budget_mb": arguments.memory_budget_mb,
+        "collect_errors": arguments.collect_errors,
+        "quarantine": arguments.quarantine,
+        "strict_types": arguments.strict_types
+    }
+
+
+def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Converts DKP Excel files to JSON")
+    parser.add_argument("paths", nargs="+", help="The Excel file (or files and directories with --batch) "
+                                                 "followed by the output folder; only the file with --validate")
+    parser.add_argument("--batch", action="store_true", help="Convert many files in parallel")
+    parser.add_argument("--validate", action="store_true",
+                        help="Only check the name, the sheets and the header of the file, print the verdict as JSON "
+                             "and exit with the error code of the conversion")
+    parser.add_argument("--quiet", action="store_true", help="Don't send the errors of --validate to Telegram")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes for --batch")
+    add_output_arguments(parser)
+    arguments: argparse.Namespace = parser.parse_args(args)
+    if arguments.validate:
+        if len(arguments.paths) != 1:
+            parser.error("expected <file> with --validate")
+    elif len(arguments.paths) < 2 or (not arguments.batch and len(arguments.paths) != 2):
+        parser.error("expected <file> <folder>, or <paths...> <folder> with --batch")
+    return arguments
 
 
 if __name__ == "__main__":
-    logger.info(f"{os.path.basename(sys.argv[1])} has started processing")
-    dkp: DKP = DKP(os.path.abspath(sys.argv[1]), sys.argv[2])
-    dkp.main()
-    logger.info(f"{os.path.basename(sys.argv[1])} has finished processing")
+    arguments: argparse.Namespace = parse_args()
+    if arguments.validate:
+        file_verdict: dict = validate_file(arguments.paths[0], notify=not arguments.quiet)
+        print(json.dumps(file_verdict, ensure_ascii=False))
+        sys.exit(file_verdict["exit_code"])
+    *input_paths, output_folder = arguments.paths
+    if not arguments.batch:
+        sys.exit(convert_file(input_paths[0], output_folder, **get_output_options(arguments)))
+    batch_statuses: Dict[str, int] = convert_files(
+        get_files_for_batch(input_paths), output_folder, arguments.workers, **get_output_options(arguments)
+    )
+    sys.exit(0 if all(code == 0 for code in batch_statuses.values()) else 1)
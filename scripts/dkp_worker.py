@@ -0,0 +1,221 @@
+import time
+import signal
+import fnmatch
+import argparse
+import app_logger
+from dkp import convert_file, validate_file, add_output_arguments, get_output_options
+from file_watcher import IN_IGNORED, IN_Q_OVERFLOW, InotifyWatcher, open_watcher
+from __init__ import *
+from typing import List, Optional
+
+logger: app_logger = app_logger.get_logger(os.path.basename(__file__).replace(".py", ""))
+
+
+class DKPWorker(object):
+    """
+    A resident process that converts every workbook dropped into `${XL_IDP_PATH_DKP}/dkp`.
+
+    It does the same work as `bash/dkp.sh`, but in one process: the reference tables from `reference_dkp`
+    and the imported DKP machinery stay loaded between files, so every file pays only for its own parsing.
+    The reference tables are loaded again every DKP_REFERENCE_TTL seconds (see References), so the changes
+    of `reference_dkp` are seen without restarting the worker.
+
+    On Linux the directory is watched with inotify: a file is converted as soon as it is closed after writing
+    or moved into the directory, without waiting `min_age` seconds. The directory is still rescanned every
+    `rescan_interval` seconds and when the kernel drops events, for the files that were there before the worker
+    started. Where inotify is not available, the directory is scanned every `poll_interval` seconds.
+    """
+    def __init__(
+        self,
+        xls_path: str,
+        poll_interval: float = 1.0,
+        min_age: float = 30.0,
+        use_inotify: bool = True,
+        rescan_interval: float = 60.0,
+        validate: bool = True,
+        **kwargs
+    ):
+        self.xls_path: str = xls_path
+        self.options: dict = kwargs
+        self.done_path: str = os.path.join(xls_path, "done")
+        self.json_path: str = os.path.join(xls_path, "json")
+        self.poll_interval: float = poll_interval
+        self.min_age: float = min_age
+        self.use_inotify: bool = use_inotify
+        self.rescan_interval: float = rescan_interval
+        self.validate: bool = validate
+        self.is_running: bool = True
+        for path in [self.done_path, self.json_path]:
+            if not os.path.exists(path):
+                os.mkdir(path)
+
+    def stop(self, *args) -> None:
+        """
+        Stops the worker after the file that is currently being converted.
+
+        :param args: The arguments passed by the signal module, not used.
+        :return: None
+        """
+        logger.info("Worker is stopping")
+        self.is_running = False
+
+    @staticmethod
+    def is_input_file(name: str) -> bool:
+        """
+        Checks if a file in the directory should be converted: `*.xls*` files without `error_` in the name.
+
+        :param name: The name of the file.
+        :return: True if the file should be converted.
+        """
+        return fnmatch.fnmatch(name, "*.xls*") and "error_" not in name
+
+    def get_pending_files(self) -> List[str]:
+        """
+        Returns the files that are ready to be converted.
+
+        The same filter as in `bash/dkp.sh` is used: only `*.xls*` files in the directory itself,
+        skipping files with `error_` in the name and files modified less than `min_age` seconds ago
+        (they may still be being copied).
+
+        :return: A sorted list of paths to the files.
+        """
+        files: list = []
+        now: float = time.time()
+        for name in sorted(os.listdir(self.xls_path)):
+            file: str = os.path.join(self.xls_path, name)
+            if not self.is_input_file(name) or not os.path.isfile(file):
+                continue
+            if now - os.path.getmtime(file) >= self.min_age:
+                files.append(file)
+        return files
+
+    def process_file(self, file: str) -> int:
+        """
+        Converts one file and moves it the same way `bash/dkp.sh` does.
+
+        The file is validated first (see dkp.validate_file), so a file with a wrong name, sheets or header
+        is rejected with the same error code without a conversion. On success the file is moved to the done
+        folder, otherwise it is renamed to `error_<name>` in the source folder. An unexpected exception
+        (e.g. MissingReferenceSnapshot when the reference tables can't be loaded) fails the file with
+        the error code 6, as a crash of `dkp.py` fails it in `bash/dkp.sh`, and the worker goes on.
+
+        :param file: The path to the Excel file.
+        :return: The exit code of the conversion.
+        """
+        basename: str = os.path.basename(file)
+        try:
+            exit_code: int = validate_file(file)["exit_code"] if self.validate else 0
+            if exit_code == 0:
+                print(f"Will convert XLS* '{file}' to JSON '{self.json_path}'")
+                exit_code = convert_file(file, self.json_path, **self.options)
+        except Exception as exception:
+            logger.error(f"Failed to convert the file {basename}: {exception!r}", exc_info=True)
+            exit_code = 6
+        try:
+            if exit_code == 0:
+                os.replace(file, os.path.join(self.done_path, basename))
+            else:
+                print(f"ERROR during convertion {file} to json!")
+                os.replace(file, os.path.join(self.xls_path, f"error_{basename}"))
+        except OSError as exception:
+            logger.error(f"Failed to move the file {basename}: {exception}")
+        logger.info(f"File {basename} is processed with exit code {exit_code}")
+        return exit_code
+
+    def get_written_files(self, watcher: InotifyWatcher) -> Optional[List[str]]:
+        """
+        Waits up to `poll_interval` seconds for the files written into the directory.
+
+        :param watcher: The inotify watcher of the directory.
+        :return: A list of paths to the files, or None if the kernel has dropped events.
+        :raises OSError: If the directory is not watched any more (e.g. it was removed).
+        """
+        files: list = []
+        for mask, name in watcher.read_events(self.poll_interval):
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                raise OSError(f"The directory {self.xls_path} is not watched any more")
+            file: str = os.path.join(self.xls_path, name)
+            if self.is_input_file(name) and file not in files:
+                files.append(file)
+        return files
+
+    def run(self, once: bool = False) -> None:
+        """
+        Converts pending files until the worker is stopped.
+
+        :param once: If True, converts the files that are pending now and returns.
+        :return: None
+        """
+        watcher: Optional[InotifyWatcher] = open_watcher(self.xls_path) if self.use_inotify and not once else None
+        if watcher is None:
+            logger.info(f"Worker has started watching {self.xls_path}, scanning every {self.poll_interval} seconds")
+        else:
+            logger.info(f"Worker has started watching {self.xls_path} with inotify")
+        files: List[str] = self.get_pending_files()
+        rescan_at: float = time.time() + self.rescan_interval
+        while self.is_running:
+            for file in files:
+                if not self.is_running:
+                    break
+                if os.path.isfile(file):
+                    self.process_file(file)
+            if once:
+                break
+            if watcher is None:
+                time.sleep(self.poll_interval)
+                files = self.get_pending_files()
+                continue
+            try:
+                files = self.get_written_files(watcher)
+            except OSError as exception:
+                logger.warning(f"{exception}. The directory is scanned every {self.poll_interval} seconds")
+                watcher.close()
+                watcher = None
+                files = self.get_pending_files()
+                continue
+            if files is None:
+                logger.warning("Inotify events were lost, the directory is rescanned")
+                files = []
+                rescan_at = time.time()
+            if time.time() >= rescan_at:
+                files += [file for file in self.get_pending_files() if file not in files]
+                rescan_at = time.time() + self.rescan_interval
+        if watcher is not None:
+            watcher.close()
+        logger.info("Worker has stopped")
+
+
+def parse_args(args: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Converts DKP files from ${XL_IDP_PATH_DKP}/dkp in one process")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between directory scans")
+    parser.add_argument("--min-age", type=float, default=30.0, help="Seconds since the last file modification")
+    parser.add_argument(
+        "--no-inotify", dest="inotify", action="store_false", help="Scan the directory instead of using inotify"
+    )
+    parser.add_argument(
+        "--rescan-interval", type=float, default=60.0, help="Seconds between directory scans with inotify"
+    )
+    parser.add_argument(
+        "--no-validate", dest="validate", action="store_false", help="Convert the files without validating them first"
+    )
+    parser.add_argument("--once", action="store_true", help="Convert pending files and exit")
+    add_output_arguments(parser)
+    return parser.parse_args(args)
+
+
+if __name__ == "__main__":
+    arguments: argparse.Namespace = parse_args()
+    worker: DKPWorker = DKPWorker(
+        xls_path=f"{get_my_env_var('XL_IDP_PATH_DKP')}/dkp",
+        poll_interval=arguments.poll_interval,
+        min_age=arguments.min_age,
+        use_inotify=arguments.inotify,
+        rescan_interval=arguments.rescan_interval,
+        validate=arguments.validate,
+        **get_output_options(arguments)
+    )
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run(once=arguments.once)
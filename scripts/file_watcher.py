@@ -0,0 +1,79 @@
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from typing import List, Optional, Tuple
+
+IN_CLOSE_WRITE: int = 0x00000008
+IN_MOVED_TO: int = 0x00000080
+IN_Q_OVERFLOW: int = 0x00004000
+IN_IGNORED: int = 0x00008000
+IN_NONBLOCK: int = os.O_NONBLOCK
+IN_CLOEXEC: int = os.O_CLOEXEC
+
+# struct inotify_event: int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[len];
+EVENT_HEADER: struct.Struct = struct.Struct("iIII")
+READ_SIZE: int = 64 * 1024
+
+
+class InotifyWatcher(object):
+    """
+    Watches a directory with the Linux inotify API and reports the files that have been written completely.
+
+    A file is reported when the process writing it closes it (IN_CLOSE_WRITE) or when it is moved
+    into the directory (IN_MOVED_TO), so a file is never reported while it is still being copied.
+    The calls to libc are made with ctypes, no package is needed.
+    """
+    def __init__(self, path: str, mask: int = IN_CLOSE_WRITE | IN_MOVED_TO):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd: int = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask)) < 0:
+            error: int = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, os.strerror(error), path)
+
+    def read_events(self, timeout: float) -> List[Tuple[int, str]]:
+        """
+        Waits for events for at most `timeout` seconds and returns all events that have arrived.
+
+        :param timeout: The maximum time to wait in seconds.
+        :return: A list of tuples of the mask of the event and the name of the file.
+                 An event with IN_Q_OVERFLOW means some events were lost and the directory must be rescanned.
+        """
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        events: list = []
+        while True:
+            try:
+                data: bytes = os.read(self.fd, READ_SIZE)
+            except OSError as exception:
+                if exception.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return events
+                raise
+            offset: int = 0
+            while offset < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name: str = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((mask, name))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def open_watcher(path: str) -> Optional[InotifyWatcher]:
+    """
+    Starts watching a directory with inotify.
+
+    :param path: The path to the directory.
+    :return: The watcher, or None if inotify is not available (not Linux, no libc, the limit of watches reached).
+    """
+    try:
+        return InotifyWatcher(path)
+    except (OSError, AttributeError):
+        return None
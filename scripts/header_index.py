@@ -0,0 +1,77 @@
+from __init__ import *
+from typing import Dict, Tuple, Optional
+
+COLUMNS: str = "Наименования столбцов"
+BLOCKS: str = "Наименования блоков"
+
+
+class HeaderIndex(object):
+    """
+    An inverted index from a header text to the English columns it may stand for.
+
+    The index is built once from COLUMN_NAMES, BLOCK_NAMES and BLOCK_TABLE_COLUMNS. Each header text
+    is mapped to the groups it occurs in, and each group to the English names of the columns.
+    The groups are named as in the first column of reference_dkp: COLUMNS for COLUMN_NAMES,
+    BLOCKS for BLOCK_NAMES and the name of the block for the columns of its table.
+    """
+    def __init__(self, column_names: dict, block_names: dict, block_table_columns: dict):
+        self.index: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+        self._add_group(COLUMNS, column_names)
+        self._add_group(BLOCKS, block_names)
+        for block, columns in block_table_columns.items():
+            self._add_group(block, columns)
+
+    def _add_group(self, group: str, headers: dict) -> None:
+        """
+        Adds the headers of a group to the index.
+
+        :param group: The name of the group.
+        :param headers: A dictionary where the keys are the English names of the columns,
+                        and the values are tuples of strings that may appear in the row as the header.
+        :return: None
+        """
+        for eng_column, columns in headers.items():
+            for column in columns:
+                groups: Dict[str, Tuple[str, ...]] = self.index.setdefault(column, {})
+                if eng_column not in groups.get(group, ()):
+                    groups[group] = groups.get(group, ()) + (eng_column,)
+
+    def lookup(self, text: Optional[str], group: str) -> Tuple[str, ...]:
+        """
+        Returns the English names of the columns of the group that have the given header text.
+
+        :param text: The header text, already cleaned by DKP._remove_symbols_in_columns.
+        :param group: The name of the group.
+        :return: A tuple of English column names, empty if the text is not a header of the group.
+        """
+        return self.index.get(text, {}).get(group, ()) if isinstance(text, str) else ()
+
+    def is_column_name(self, text: Optional[str]) -> bool:
+        """
+        Checks if the given text is one of the names from COLUMN_NAMES.
+
+        :param text: The header text, already cleaned by DKP._remove_symbols_in_columns.
+        :return: True if the text is a column name, False otherwise.
+        """
+        return bool(self.lookup(text, COLUMNS))
+
+
+_header_index: Optional[HeaderIndex] = None
+
+
+_header_index_version: Optional[str] = None
+
+
+def get_header_index() -> HeaderIndex:
+    """
+    Returns the header index, building it on the first call and again when the version of reference_dkp changes.
+    :return: The header index.
+    """
+    global _header_index, _header_index_version
+    version: str = references.get("REFERENCE_VERSION")
+    if _header_index is None or _header_index_version != version:
+        _header_index = HeaderIndex(
+            references.get("COLUMN_NAMES"), references.get("BLOCK_NAMES"), references.get("BLOCK_TABLE_COLUMNS")
+        )
+        _header_index_version = version
+    return _header_index
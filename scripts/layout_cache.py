@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+class LayoutCache(object):
+    """
+    A cache of the layouts of the tables in the process, so the header of a known template is not resolved again.
+
+    A layout is the position of every block and every column of the table. It depends only on the positions
+    of the blocks, the texts of the header row and the reference_dkp table, so the fingerprint of a layout is
+    built from these three, and the layouts of an old version of reference_dkp are never found again.
+    The cache lives as long as the process: it helps the resident worker and the batch mode, which convert
+    many files of the same templates. It keeps the last `keep_entries` layouts that were used.
+    """
+    def __init__(self, keep_entries: int = 500):
+        self.keep_entries: int = keep_entries
+        self.entries: "OrderedDict[tuple, Dict[str, Optional[int]]]" = OrderedDict()
+
+    @staticmethod
+    def get_fingerprint(reference_version: str, dict_block_position: dict, header_row: list) -> tuple:
+        """
+        Returns the fingerprint of the layout of a table.
+
+        :param reference_version: The version of the reference_dkp table.
+        :param dict_block_position: The positions of the blocks found before the header.
+        :param header_row: The header row with the texts cleaned by DKP._remove_symbols_in_columns.
+        :return: A hashable tuple.
+        """
+        return reference_version, tuple(dict_block_position.items()), tuple(header_row)
+
+    def get(self, fingerprint: tuple) -> Optional[Dict[str, Optional[int]]]:
+        """
+        Returns the positions of the columns of a known layout.
+
+        :param fingerprint: The fingerprint from get_fingerprint.
+        :return: A dictionary where the keys are the English names of the columns and the values
+                 are their positions, in the order they were found; None if the layout is unknown.
+        """
+        columns: Optional[Dict[str, Optional[int]]] = self.entries.get(fingerprint)
+        if columns is not None:
+            self.entries.move_to_end(fingerprint)
+        return columns
+
+    def add(self, fingerprint: tuple, dict_columns_position: dict) -> None:
+        """
+        Adds a layout to the cache, removing the layouts that were not used for the longest time.
+
+        :param fingerprint: The fingerprint from get_fingerprint.
+        :param dict_columns_position: The positions of the columns resolved from the header.
+        :return: None
+        """
+        self.entries[fingerprint] = dict(dict_columns_position)
+        self.entries.move_to_end(fingerprint)
+        while len(self.entries) > self.keep_entries:
+            self.entries.popitem(last=False)
+
+
+_layout_cache: Optional[LayoutCache] = None
+
+
+def get_layout_cache(keep_entries: int) -> Optional[LayoutCache]:
+    """
+    Returns the layout cache of the process, creating it on the first call.
+
+    :param keep_entries: The number of the layouts to keep; 0 turns the cache off.
+    :return: The layout cache, or None if it is turned off.
+    """
+    global _layout_cache
+    if keep_entries <= 0:
+        return None
+    if _layout_cache is None:
+        _layout_cache = LayoutCache(keep_entries)
+    return _layout_cache
@@ -0,0 +1,250 @@
+import os
+import json
+import time
+import fcntl
+import resource
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List
+
+STAGES: tuple = ("dedup", "open", "read", "layout", "header", "convert", "write")
+COUNTERS: tuple = (
+    "sheet_rows", "header_rows", "table_rows", "records", "output_bytes", "reused_output",
+    "delta_inserted", "delta_updated", "delta_deleted", "delta_unchanged", "type_violations",
+    "layout_cache_hits", "peak_rss_bytes", "row_errors"
+)
+PROMETHEUS_FILE: str = "dkp.prom"
+STATE_FILE: str = "dkp_files.json"
+
+
+class FileMetrics(object):
+    """
+    Collects the time of every stage of the conversion of one file and the counts of what was processed.
+
+    The time of a stage does not include the time of the stages called from it: e.g. the rows of the sheet
+    are read while the layout stage iterates them, so this time is counted as `read` only.
+    """
+    def __init__(self, filename: str):
+        self.filename: str = filename
+        self.started_at: float = time.time()
+        self.stages: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.counters: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.running: List[str] = []
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """
+        Measures the code in the `with` block as the given stage.
+        :param stage: The name of the stage.
+        """
+        self.running.append(stage)
+        started_at: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds: float = time.perf_counter() - started_at
+            self.running.pop()
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            if self.running:
+                self.stages[self.running[-1]] -= seconds
+
+    def iterate(self, stage: str, iterator: Iterator) -> Iterator:
+        """
+        Yields the items of the iterator, measuring the time spent to produce them as the given stage.
+
+        :param stage: The name of the stage.
+        :param iterator: The iterator to measure.
+        :return: An iterator of the same items.
+        """
+        iterator = iter(iterator)
+        while True:
+            try:
+                with self.stage(stage):
+                    item: Any = next(iterator)
+            except StopIteration:
+                return
+            yield item
+
+    def count(self, counter: str, value: int = 1) -> None:
+        self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def merge(self, metrics: dict) -> None:
+        """
+        Adds the time of the stages and the counts of a part of the conversion done in another process.
+
+        :param metrics: The metrics of the part from FileMetrics.to_dict.
+        :return: None
+        """
+        for stage, seconds in metrics["stages"].items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        for counter, value in metrics["counters"].items():
+            self.count(counter, value)
+
+    def record_peak_rss(self) -> None:
+        """
+        Adds the peak RSS of this process since reset_peak_rss to `peak_rss_bytes`.
+
+        It is called once per process that took part in the conversion, so for the sheets parsed in parallel
+        the counter is the sum of the peaks of all processes.
+        :return: None
+        """
+        self.count("peak_rss_bytes", get_peak_rss_bytes())
+
+    def to_dict(self, exit_code: int) -> dict:
+        """
+        Returns the metrics as a dictionary.
+
+        :param exit_code: The exit code of the conversion.
+        :return: A dictionary with the file name, the exit code, the time and the counts.
+        """
+        return {
+            "file": self.filename,
+            "exit_code": exit_code,
+            "started_at": self.started_at,
+            "seconds": time.time() - self.started_at,
+            "stages": {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+            "counters": dict(self.counters)
+        }
+
+    def write(self, metrics_path: str, exit_code: int, keep_files: int = 200) -> dict:
+        """
+        Writes the metrics of the file to `<metrics_path>/<file>.json` and updates the Prometheus textfile.
+
+        :param metrics_path: The directory of the metrics.
+        :param exit_code: The exit code of the conversion.
+        :param keep_files: The number of the most recent files kept in the Prometheus textfile.
+        :return: The written metrics.
+        """
+        metrics: dict = self.to_dict(exit_code)
+        os.makedirs(metrics_path, exist_ok=True)
+        write_atomically(os.path.join(metrics_path, f"{self.filename}.json"), json.dumps(metrics, ensure_ascii=False))
+        update_prometheus_textfile(metrics_path, metrics, keep_files)
+        return metrics
+
+
+def get_rss_bytes() -> int:
+    """
+    Returns the current resident memory of the process.
+    :return: The RSS in bytes, or the peak RSS where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss_bytes()
+
+
+def reset_peak_rss() -> None:
+    """
+    Resets the peak RSS of the process (VmHWM), so the peak of the next file is measured separately.
+
+    Works on Linux only; elsewhere, or if it is not permitted, the peak is counted from the start of the process.
+    :return: None
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def get_peak_rss_bytes() -> int:
+    """
+    Returns the peak resident memory of the process since the start or the last reset_peak_rss.
+    :return: The peak RSS in bytes.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def write_atomically(path: str, text: str) -> None:
+    tmp_path: str = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus(files: List[dict]) -> str:
+    """
+    Renders the metrics of the files in the Prometheus text format, one series per file.
+
+    :param files: The metrics of the files from FileMetrics.to_dict.
+    :return: The text of the textfile.
+    """
+    series: Dict[str, List[str]] = {}
+
+    def add(name: str, labels: Dict[str, str], value: Any) -> None:
+        label_text: str = ",".join(f'{key}="{_escape_label(str(label))}"' for key, label in labels.items())
+        series.setdefault(name, []).append(f"{name}{{{label_text}}} {value}")
+
+    for metrics in files:
+        file_label: dict = {"file": metrics["file"]}
+        add("dkp_file_duration_seconds", file_label, f"{metrics['seconds']:.6f}")
+        add("dkp_file_exit_code", file_label, metrics["exit_code"])
+        add("dkp_file_last_run_timestamp_seconds", file_label, f"{metrics['started_at']:.3f}")
+        for stage, seconds in metrics["stages"].items():
+            add("dkp_file_stage_seconds", dict(file_label, stage=stage), f"{seconds:.6f}")
+        for counter, value in metrics["counters"].items():
+            add(f"dkp_file_{counter}", file_label, value)
+    descriptions: Dict[str, str] = {
+        "dkp_file_duration_seconds": "Wall time of the conversion of the file.",
+        "dkp_file_exit_code": "Exit code of the conversion of the file.",
+        "dkp_file_last_run_timestamp_seconds": "Time the conversion of the file started.",
+        "dkp_file_stage_seconds": "Wall time of a stage of the conversion of the file.",
+        "dkp_file_sheet_rows": "Non-empty rows read from the sheet.",
+        "dkp_file_header_rows": "Rows recognized as a header.",
+        "dkp_file_table_rows": "Rows of the table.",
+        "dkp_file_records": "Records written.",
+        "dkp_file_output_bytes": "Size of the output file.",
+        "dkp_file_reused_output": "1 if the output of an earlier conversion of the same file was reused.",
+        "dkp_file_delta_inserted": "Records new since the previous version of the file.",
+        "dkp_file_delta_updated": "Records changed since the previous version of the file.",
+        "dkp_file_delta_deleted": "Records of the previous version of the file that are gone.",
+        "dkp_file_delta_unchanged": "Records not changed since the previous version of the file.",
+        "dkp_file_type_violations": "Cells of the table that don't match the type of their column.",
+        "dkp_file_layout_cache_hits": "Headers whose layout was taken from the cache of known templates.",
+        "dkp_file_peak_rss_bytes": "Peak resident memory of the processes converting the file.",
+        "dkp_file_row_errors": "Rows of the table skipped because of an error, with --collect-errors."
+    }
+    lines: list = []
+    for name, values in series.items():
+        lines.append(f"# HELP {name} {descriptions.get(name, name)}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(values)
+    return "\n".join(lines) + "\n"
+
+
+def update_prometheus_textfile(metrics_path: str, metrics: dict, keep_files: int = 200) -> None:
+    """
+    Adds the metrics of a file to the Prometheus textfile of the node exporter's textfile collector.
+
+    The metrics of the last `keep_files` files are kept in `dkp_files.json`; the textfile `dkp.prom` is
+    rendered from them. Processes converting files in parallel take a lock, the textfile is replaced atomically.
+
+    :param metrics_path: The directory of the metrics.
+    :param metrics: The metrics of the file from FileMetrics.to_dict.
+    :param keep_files: The number of the most recent files to keep.
+    :return: None
+    """
+    with open(os.path.join(metrics_path, ".lock"), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state_path: str = os.path.join(metrics_path, STATE_FILE)
+        files: Dict[str, dict] = {}
+        try:
+            with open(state_path, encoding='utf-8') as f:
+                files = json.load(f)
+        except (OSError, ValueError):
+            pass
+        files[metrics["file"]] = metrics
+        files = dict(sorted(files.items(), key=lambda item: item[1]["started_at"])[-keep_files:])
+        write_atomically(state_path, json.dumps(files, ensure_ascii=False))
+        write_atomically(os.path.join(metrics_path, PROMETHEUS_FILE), render_prometheus(list(files.values())))
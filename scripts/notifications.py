@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+MAX_MESSAGE_LENGTH: int = 4000
+
+
+class NotificationDispatcher(object):
+    """
+    Sends notifications in a background thread, so a slow Telegram or SMTP server never stalls the conversion.
+
+    Every notification is first written to the outbox directory, one JSON file per message, and only then
+    the background thread is woken up through a bounded queue. The thread waits `coalesce_window` seconds
+    to collect a burst of messages, removes duplicates and sends them as one digest to every channel.
+    A channel that fails is retried with exponential backoff; the messages stay in the outbox until all
+    channels have accepted them, so they survive the exit of the process and are sent by the next dispatcher
+    started on the same outbox (e.g. by the worker or the next conversion).
+    """
+    def __init__(
+        self,
+        outbox_path: str,
+        senders: Dict[str, Callable[[str], None]],
+        coalesce_window: float = 2.0,
+        poll_interval: float = 5.0,
+        max_attempts: int = 8,
+        max_backoff: float = 300.0,
+        queue_size: int = 100
+    ):
+        self.outbox_path: str = outbox_path
+        self.senders: Dict[str, Callable[[str], None]] = senders
+        self.coalesce_window: float = coalesce_window
+        self.poll_interval: float = poll_interval
+        self.max_attempts: int = max_attempts
+        self.max_backoff: float = max_backoff
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.is_stopping: threading.Event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.next_attempt_at: float = 0.0
+        os.makedirs(outbox_path, exist_ok=True)
+
+    def start(self) -> "NotificationDispatcher":
+        """
+        Starts the background thread, if it is not running yet.
+        :return: The dispatcher itself.
+        """
+        if self.thread is None or not self.thread.is_alive():
+            self.is_stopping.clear()
+            self.thread = threading.Thread(target=self._run, name="notifications", daemon=True)
+            self.thread.start()
+        return self
+
+    def notify(self, message: str) -> None:
+        """
+        Puts a message into the outbox and wakes the background thread up. Never blocks on the network.
+
+        :param message: The text of the notification.
+        :return: None
+        """
+        name: str = f"{time.time():.6f}_{os.getpid()}_{threading.get_ident()}.json"
+        tmp_path: str = os.path.join(self.outbox_path, f".{name}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"text": message, "channels": list(self.senders), "attempts": 0}, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.outbox_path, name))
+        try:
+            self.queue.put_nowait(name)
+        except queue.Full:
+            pass  # The message is in the outbox anyway, it will be found by the next scan
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Sends what is in the outbox without waiting for the coalesce window and stops the thread.
+
+        Waits at most `timeout` seconds; the messages that could not be sent stay in the outbox.
+
+        :param timeout: The maximum number of seconds to wait.
+        :return: None
+        """
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.is_stopping.set()
+        try:
+            self.queue.put_nowait("")
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+
+    @staticmethod
+    def _is_claim_alive(name: str) -> bool:
+        """
+        Checks if the process that has claimed a message (`<name>.json.<pid>.sending`) is still running.
+        :param name: The name of the claimed file.
+        :return: True if the process is running, False otherwise.
+        """
+        try:
+            os.kill(int(name.split(".")[-2]), 0)
+        except ProcessLookupError:
+            return False
+        except (ValueError, OSError):
+            pass
+        return True
+
+    def _claim_messages(self) -> List[Tuple[str, dict]]:
+        """
+        Takes the messages from the outbox, renaming them so that other dispatchers skip them.
+
+        The messages claimed by processes that are no longer running are taken as well.
+
+        :return: A list of tuples of the path to the claimed file and the message.
+        """
+        claimed: list = []
+        for name in sorted(os.listdir(self.outbox_path)):
+            if name.startswith(".") or not (
+                name.endswith(".json") or (name.endswith(".sending") and not self._is_claim_alive(name))
+            ):
+                continue
+            path: str = os.path.join(self.outbox_path, name)
+            claimed_path: str = f"{path[:path.index('.json') + len('.json')]}.{os.getpid()}.sending"
+            try:
+                os.rename(path, claimed_path)
+                with open(claimed_path, encoding='utf-8') as f:
+                    claimed.append((claimed_path, json.load(f)))
+            except (OSError, ValueError):
+                continue
+        return claimed
+
+    def _release_messages(self, claimed: List[Tuple[str, dict]]) -> None:
+        """
+        Returns the claimed messages to the outbox or deletes them, if they are sent or out of attempts.
+        :param claimed: A list of tuples of the path to the claimed file and the message.
+        :return: None
+        """
+        for claimed_path, message in claimed:
+            path: str = claimed_path[:claimed_path.index(".json") + len(".json")]
+            if not message["channels"]:
+                os.remove(claimed_path)
+            elif message["attempts"] >= self.max_attempts:
+                print(f"Уведомление не отправлено после {message['attempts']} попыток: {message['text']}")
+                os.remove(claimed_path)
+            else:
+                with open(claimed_path, 'w', encoding='utf-8') as f:
+                    json.dump(message, f, ensure_ascii=False)
+                os.rename(claimed_path, path)
+
+    @staticmethod
+    def make_digest(messages: List[dict]) -> str:
+        """
+        Joins the messages into one text, counting the repeated ones.
+
+        :param messages: The messages to join.
+        :return: The text of the digest.
+        """
+        counts: Dict[str, int] = {}
+        for message in messages:
+            counts[message["text"]] = counts.get(message["text"], 0) + 1
+        if len(counts) == 1 and len(messages) == 1:
+            return messages[0]["text"]
+        digest: str = f"Сводка уведомлений ({len(messages)}):\n" + "\n".join(
+            f"- {text}" if count == 1 else f"- {text} (x{count})" for text, count in counts.items()
+        )
+        return digest if len(digest) <= MAX_MESSAGE_LENGTH else f"{digest[:MAX_MESSAGE_LENGTH]}…"
+
+    def _send(self, claimed: List[Tuple[str, dict]]) -> bool:
+        """
+        Sends the digest of the claimed messages to every channel they still have to be sent to.
+        :param claimed: A list of tuples of the path to the claimed file and the message.
+        :return: True if all channels have accepted the digest, False otherwise.
+        """
+        is_sent: bool = True
+        for channel, sender in self.senders.items():
+            messages: List[dict] = [message for _, message in claimed if channel in message["channels"]]
+            if not messages:
+                continue
+            try:
+                sender(self.make_digest(messages))
+            except Exception as exception:
+                print(f"Ошибка при отправке уведомления в {channel}: {exception}")
+                is_sent = False
+                continue
+            for message in messages:
+                message["channels"].remove(channel)
+        if not is_sent:
+            for _, message in claimed:
+                message["attempts"] += 1
+        return is_sent
+
+    def _run(self) -> None:
+        attempt: int = 0
+        while True:
+            try:
+                self.queue.get(timeout=self.poll_interval)
+                if not self.is_stopping.is_set():
+                    self.is_stopping.wait(self.coalesce_window)
+            except queue.Empty:
+                pass
+            if time.time() >= self.next_attempt_at or self.is_stopping.is_set():
+                try:
+                    if claimed := self._claim_messages():
+                        is_sent: bool = self._send(claimed)
+                        self._release_messages(claimed)
+                        attempt = 0 if is_sent else attempt + 1
+                        self.next_attempt_at = 0.0 if is_sent else time.time() + min(2 ** attempt, self.max_backoff)
+                except Exception as exception:
+                    print(f"Ошибка при обработке очереди уведомлений: {exception}")
+            if self.is_stopping.is_set():
+                break
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+
+
+def get_dispatcher(outbox_path: str, senders: Dict[str, Callable[[str], None]]) -> NotificationDispatcher:
+    """
+    Returns the dispatcher of the process, starting it on the first call.
+
+    The outbox is flushed when the process exits, waiting at most DKP_NOTIFY_EXIT_TIMEOUT seconds.
+
+    :param outbox_path: The path to the outbox directory.
+    :param senders: A dictionary where the keys are the names of the channels and the values are functions
+                    that send a text to the channel and raise an exception on failure.
+    :return: The dispatcher.
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = NotificationDispatcher(outbox_path, senders)
+        atexit.register(_dispatcher.stop, float(os.environ.get('DKP_NOTIFY_EXIT_TIMEOUT', 10)))
+    return _dispatcher.start()
+
+
+def stop_dispatcher(timeout: float = 10.0) -> None:
+    """
+    Sends what is in the outbox and stops the dispatcher of the process, if it has been started.
+
+    The processes of a process pool don't run the atexit handlers, so a task that may notify calls this
+    at its end. The next notification starts the dispatcher again.
+
+    :param timeout: The maximum number of seconds to wait.
+    :return: None
+    """
+    if _dispatcher is not None:
+        _dispatcher.stop(timeout)
@@ -0,0 +1,44 @@
+import itertools
+import numpy as np
+from typing import Any, Dict, Iterator, List, Sequence
+
+
+class RecordBatch(object):
+    """
+    A batch of records stored column by column.
+
+    The fields that are the same for every record of the file (the department, the year, the name of the file,
+    the time of parsing) are stored once in `constants`, the other fields as one array per field.
+    The records are expanded to dictionaries only when the batch is iterated, one record at a time,
+    so a writer that serializes them never holds more than one dictionary per batch.
+    """
+    __slots__ = ("fields", "columns", "constants", "length")
+
+    def __init__(self, fields: List[str], columns: Dict[str, Sequence], constants: Dict[str, Any]):
+        self.fields: List[str] = fields
+        self.columns: Dict[str, Sequence] = columns
+        self.constants: Dict[str, Any] = constants
+        self.length: int = len(next(iter(columns.values()))) if columns else 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def column(self, field: str) -> list:
+        """
+        Returns the values of a field for every record.
+
+        :param field: The name of the field.
+        :return: A list of values.
+        """
+        if field in self.columns:
+            values: Sequence = self.columns[field]
+            return values.tolist() if isinstance(values, np.ndarray) else list(values)
+        return [self.constants[field]] * self.length
+
+    def __iter__(self) -> Iterator[dict]:
+        values: list = [
+            self.column(field) if field in self.columns else itertools.repeat(self.constants[field])
+            for field in self.fields
+        ]
+        for record in zip(*values):
+            yield dict(zip(self.fields, record))
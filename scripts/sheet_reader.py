@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES
+from pandas._libs.parsers import STR_NA_VALUES
+from typing import Any, Iterator, Optional, Tuple
+
+Row = Tuple[int, tuple]
+
+
+def convert_cell(value: Any) -> Optional[str]:
+    """
+    Converts a value of an openpyxl cell to the string pandas would read with `dtype=str`.
+
+    Empty cells, error cells and the strings pandas treats as NaN become None, floats without
+    a fractional part are written as integers, everything else is converted with str().
+
+    :param value: The value of the cell.
+    :return: The value as a string or None.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return None if value in STR_NA_VALUES or value in ERROR_CODES or value == "NaT" else value
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def iter_dataframe_rows(df: pd.DataFrame) -> Iterator[Row]:
+    """
+    Yields the non-empty rows of a sheet read by pandas with `dtype=str` as plain tuples.
+
+    :param df: The DataFrame representing the sheet of the Excel file.
+    :return: An iterator of tuples of the row index and the values of the row.
+    """
+    df = df.dropna(how='all').replace({np.nan: None, "NaT": None})
+    for index, *row in df.itertuples(index=True, name=None):
+        yield index, tuple(row)
+
+
+def iter_worksheet_rows(worksheet: Any) -> Iterator[Row]:
+    """
+    Reads the non-empty rows of an openpyxl worksheet lazily, one row at a time.
+
+    The worksheet should be opened in read-only mode, then only the current row is kept in memory.
+    The values are converted by convert_cell, so the rows are the same as in iter_dataframe_rows.
+    As the width of the sheet is not known in advance, the rows are padded to the widest row seen so far
+    (pandas pads them to the widest row of the whole sheet).
+
+    :param worksheet: The openpyxl worksheet.
+    :return: An iterator of tuples of the row index and the values of the row.
+    """
+    if hasattr(worksheet, "reset_dimensions"):
+        # The dimensions stored in the file may be wrong, pandas resets them too
+        worksheet.reset_dimensions()
+    width: int = 0
+    for index, values in enumerate(worksheet.iter_rows(values_only=True)):
+        row: list = [convert_cell(value) for value in values]
+        while row and row[-1] is None:
+            row.pop()
+        if not row:
+            continue
+        width = max(width, len(row))
+        yield index, tuple(row) + (None,) * (width - len(row))
@@ -0,0 +1,305 @@
+import os
+import io
+import random
+import struct
+import zipfile
+import openpyxl
+from typing import Iterator, List, Optional, Tuple
+
+MONTH_NAMES: list = ["янв", "фев", "мар", "апр", "май", "июн", "июл", "авг", "сен", "окт", "ноя", "дек"]
+MONTH_KEYS: list = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+SHEET_NAME: str = "ДКП"
+DEPARTMENT: Tuple[str, str] = ("ОП", "Отдел продаж")
+
+GENERAL_COLUMNS: List[Tuple[str, str]] = [
+    ("client", "Клиент"),
+    ("description", "Описание"),
+    ("project", "Проект"),
+    ("cargo", "Груз"),
+    ("direction", "Направление"),
+    ("bay", "Бассейн"),
+    ("owner", "Собственник"),
+    ("container_size", "Размер контейнера")
+]
+
+RATE_COLUMNS: List[Tuple[str, str]] = [
+    ("marine", "Море"),
+    ("port", "Порт"),
+    ("terminal1", "Терминал 1"),
+    ("terminal2", "Терминал 2"),
+    ("other_terminal", "Другой терминал"),
+    ("avto1", "Авто 1"),
+    ("avto2", "Авто 2"),
+    ("avto3", "Авто 3"),
+    ("rzhd1", "РЖД 1"),
+    ("rzhd2", "РЖД 2"),
+    ("custom", "Таможня"),
+    ("demurrage", "Демередж"),
+    ("storage", "Хранение"),
+    ("other1", "Прочее 1"),
+    ("other2", "Прочее 2"),
+    ("separation", "Разделение"),
+    ("fee", "Вознаграждение"),
+    ("value_money", "Стоимость"),
+    ("tax", "НДС")
+]
+
+# The blocks in the order of the sheet: the English name, the name in the file and the prefix of the month columns
+BLOCKS: List[Tuple[str, str, Optional[str]]] = [
+    ("natural_indicators_ktk", "Натуральные показатели, ктк", "ktk"),
+    ("co_executor_rate_per_unite", "Ставка соисполнителя за единицу", None),
+    ("unit_margin_income", "Маржинальный доход за единицу", None),
+    ("service", "Услуга", None),
+    ("co_executor", "Соисполнитель", None),
+    ("reimbursable_sign_76", "Возмещаемые (76 счет)", None),
+    ("natural_indicators_teus", "Натуральные показатели, teu", "teu")
+]
+
+CLIENTS: int = 300
+PROJECTS: int = 40
+DIRECTIONS: list = ["Экспорт", "Импорт", "Каботаж", "Транзит"]
+BAYS: list = ["Балтийский", "Черноморский", "Дальневосточный"]
+OWNERS: list = ["Собственный", "Клиентский", "Арендованный"]
+
+FORMATS: tuple = ("xlsx", "xls", "xlsb")
+
+
+def get_reference_rows() -> List[Tuple[str, str, str, str]]:
+    """
+    Returns the rows of a `reference_dkp` table that describes the synthetic workbooks.
+
+    :return: A list of rows (category, subcategory, name in the file, English name).
+    """
+    rows: list = [
+        ("Наименования листов", "", SHEET_NAME, ""),
+        ("Наименования в файле", "", DEPARTMENT[0], DEPARTMENT[1])
+    ]
+    rows.extend(("Наименования столбцов", "", alias, column) for column, alias in GENERAL_COLUMNS)
+    rows.extend(("Наименования блоков", "", alias, block) for block, alias, _ in BLOCKS)
+    for block, _, prefix in BLOCKS:
+        if prefix:
+            rows.extend(
+                (block, "Столбцы таблиц в блоках", month, f"{prefix}_{key}") for month, key in zip(MONTH_NAMES, MONTH_KEYS)
+            )
+        else:
+            rows.extend((block, "Столбцы таблиц в блоках", alias, f"{block}_{column}") for column, alias in RATE_COLUMNS)
+    return rows
+
+
+def get_header_rows() -> Tuple[list, list]:
+    """
+    Returns the row with the names of the blocks and the row with the names of the columns.
+
+    :return: A tuple of the block row and the header row.
+    """
+    header: list = ["№"] + [alias for _, alias in GENERAL_COLUMNS]
+    blocks: list = [None] * len(header)
+    for _, alias, prefix in BLOCKS:
+        columns: list = MONTH_NAMES if prefix else [name for _, name in RATE_COLUMNS]
+        blocks += [alias] + [None] * (len(columns) - 1)
+        header += columns
+    return blocks, header
+
+
+def iter_sheet_rows(rows: int, preamble_rows: int = 5, seed: int = 0) -> Iterator[list]:
+    """
+    Yields the rows of a synthetic DKP sheet.
+
+    The sheet starts with `preamble_rows` rows of title and notes, then come the row with the names of the blocks,
+    the header row and `rows` rows of clients with twelve months of containers and TEU and the rates.
+    About a third of the descriptions are empty, like in the real files.
+
+    :param rows: The number of rows of the table.
+    :param preamble_rows: The number of rows before the block row.
+    :param seed: The seed of the random values, the same seed gives the same sheet.
+    :return: An iterator of the rows as lists of cell values.
+    """
+    rnd: random.Random = random.Random(seed)
+    yield ["Динамический клиентский план"]
+    for index in range(1, preamble_rows):
+        yield [None, f"Примечание {index}"] if index % 2 else [None]
+    yield from get_header_rows()
+    for index in range(rows):
+        row: list = [
+            index + 1,
+            f"Клиент {rnd.randrange(CLIENTS)}",
+            None if index % 3 else f"Комментарий к строке {index + 1}",
+            f"Проект {rnd.randrange(PROJECTS)}",
+            rnd.choice(["Генеральный", "Опасный", "Рефрижераторный"]),
+            rnd.choice(DIRECTIONS),
+            rnd.choice(BAYS),
+            rnd.choice(OWNERS),
+            rnd.choice([20, 40])
+        ]
+        for _, _, prefix in BLOCKS:
+            if prefix == "ktk":
+                containers: list = [rnd.randint(0, 60) for _ in MONTH_NAMES]
+                row += containers
+            elif prefix == "teu":
+                row += [count * (2 if row[8] == 40 else 1) for count in containers]
+            else:
+                row += [
+                    rnd.choice(["да", "нет"]) if column == "separation" else round(rnd.uniform(0, 150000), 2)
+                    for column, _ in RATE_COLUMNS
+                ]
+        yield row
+
+
+def write_xlsx(path: str, rows: Iterator[list]) -> None:
+    workbook: openpyxl.Workbook = openpyxl.Workbook(write_only=True)
+    workbook.create_sheet("Справочно").append(["Лист без данных ДКП"])
+    sheet = workbook.create_sheet(SHEET_NAME)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def write_xls(path: str, rows: Iterator[list]) -> None:
+    try:
+        import xlwt
+    except ImportError as exception:
+        raise RuntimeError(
+            "Writing .xls files needs the xlwt package from requirements-dev.txt "
+            "(pip install -r requirements-dev.txt); use the xlsx or xlsb format without it"
+        ) from exception
+    workbook = xlwt.Workbook(encoding='utf-8')
+    workbook.add_sheet("Справочно").write(0, 0, "Лист без данных ДКП")
+    sheet = workbook.add_sheet(SHEET_NAME)
+    for index, row in enumerate(rows):
+        for column, value in enumerate(row):
+            if value is not None:
+                sheet.write(index, column, value)
+    workbook.save(path)
+
+
+def _record(record_id: int, data: bytes = b"") -> bytes:
+    """
+    Encodes a BIFF12 record: the id as is in 1-2 bytes and the length as a 7-bit varint.
+    """
+    header: bytearray = bytearray(record_id.to_bytes(2 if record_id > 0x7F else 1, "little"))
+    length: int = len(data)
+    while True:
+        header.append((length & 0x7F) | (0x80 if length > 0x7F else 0))
+        length >>= 7
+        if not length:
+            break
+    return bytes(header) + data
+
+
+def _wide_string(value: str) -> bytes:
+    return struct.pack("<I", len(value)) + value.encode("utf-16-le")
+
+
+def write_xlsb(path: str, rows: Iterator[list]) -> None:
+    """
+    Writes the rows to a minimal .xlsb file.
+
+    There is no Python library that writes the binary format, so only the parts pyxlsb (used by pandas) reads
+    are written: the list of sheets, the shared strings and the cells of the sheets.
+    Numbers are written as doubles, strings as shared strings.
+    """
+    strings: dict = {}
+    sheet_data: io.BytesIO = io.BytesIO()
+    rows_count: int = 0
+    width: int = 0
+    for index, row in enumerate(rows):
+        sheet_data.write(_record(0x0000, struct.pack("<IIH", index, 0, 300) + b"\x00\x00\x00\x00\x00\x00"))
+        for column, value in enumerate(row):
+            if value is None:
+                continue
+            if isinstance(value, str):
+                sheet_data.write(_record(0x0007, struct.pack("<III", column, 0, strings.setdefault(value, len(strings)))))
+            else:
+                sheet_data.write(_record(0x0005, struct.pack("<IId", column, 0, value)))
+        rows_count, width = index + 1, max(width, len(row))
+    sheets: List[Tuple[str, bytes]] = [
+        ("Справочно", _record(0x0000, struct.pack("<IIH", 0, 0, 300) + b"\x00" * 6) +
+         _record(0x0007, struct.pack("<III", 0, 0, strings.setdefault("Лист без данных ДКП", len(strings))))),
+        (SHEET_NAME, sheet_data.getvalue())
+    ]
+    dimensions: list = [(0, 0, 0, 0), (0, max(rows_count - 1, 0), 0, max(width - 1, 0))]
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="bin" ContentType="application/vnd.ms-excel.sheet.binary.macroEnabled.main"/>'
+            '</Types>'
+        ))
+        archive.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="xl/workbook.bin" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>'
+        ))
+        archive.writestr("xl/_rels/workbook.bin.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">' + "".join(
+                f'<Relationship Id="rId{number}" Target="worksheets/sheet{number}.bin" '
+                f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+                for number in range(1, len(sheets) + 1)
+            ) + f'<Relationship Id="rId{len(sheets) + 1}" Target="sharedStrings.bin" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"/>'
+            '</Relationships>'
+        ))
+        archive.writestr("xl/workbook.bin", b"".join([
+            _record(0x0183),
+            _record(0x018F),
+            *(
+                _record(0x019C, struct.pack("<II", 0, number) + _wide_string(f"rId{number}") + _wide_string(name))
+                for number, (name, _) in enumerate(sheets, start=1)
+            ),
+            _record(0x0190),
+            _record(0x0184)
+        ]))
+        for number, ((_, data), dimension) in enumerate(zip(sheets, dimensions), start=1):
+            archive.writestr(f"xl/worksheets/sheet{number}.bin", b"".join([
+                _record(0x0181),
+                _record(0x0194, struct.pack("<IIII", *dimension)),
+                _record(0x0191),
+                data,
+                _record(0x0192),
+                _record(0x0182)
+            ]))
+        archive.writestr("xl/sharedStrings.bin", b"".join([
+            _record(0x009F, struct.pack("<II", len(strings), len(strings))),
+            *(_record(0x0013, b"\x00" + _wide_string(value)) for value in strings),
+            _record(0x00A0)
+        ]))
+
+
+WRITERS: dict = {
+    "xlsx": write_xlsx,
+    "xls": write_xls,
+    "xlsb": write_xlsb
+}
+
+
+def generate_workbook(
+    folder: str,
+    rows: int,
+    file_format: str = "xlsx",
+    preamble_rows: int = 5,
+    seed: int = 0,
+    year: int = 2024
+) -> str:
+    """
+    Writes a synthetic DKP workbook with a sheet of `rows` rows of the table.
+
+    The name of the file contains the department and the year, like the real files, so DKP accepts it.
+
+    :param folder: The folder to write the workbook to.
+    :param rows: The number of rows of the table.
+    :param file_format: The format of the workbook: xlsx, xls or xlsb.
+    :param preamble_rows: The number of rows before the header.
+    :param seed: The seed of the random values.
+    :param year: The year in the name of the file.
+    :return: The path to the workbook.
+    """
+    path: str = os.path.join(folder, f"{DEPARTMENT[0]}_{year}_{rows}.{file_format}")
+    WRITERS[file_format](path, iter_sheet_rows(rows, preamble_rows, seed))
+    return path
+
@@ -0,0 +1,56 @@
+import numpy as np
+from typing import Dict, List, Optional
+
+
+def get_month_columns(block_columns: dict, month_names: List[str]) -> List[Optional[str]]:
+    """
+    Finds the column of every month in the table of a block.
+
+    :param block_columns: A dictionary where the keys are the English names of the columns of the block,
+                          and the values are tuples of strings that may appear in the row as the header.
+    :param month_names: The names of the months.
+    :return: For every month, the English name of the first column which has the month as a header, or None.
+    """
+    return [
+        next((key for key, val in block_columns.items() if month_string in val), None)
+        for month_string in month_names
+    ]
+
+
+def unpivot_months(
+    columns: Dict[str, np.ndarray],
+    static_columns: List[str],
+    month_columns: Dict[str, List[Optional[str]]],
+    month_names: List[str],
+    year: int
+) -> Dict[str, np.ndarray]:
+    """
+    Turns a table with one row per client into a table with one row per client and month.
+
+    The static columns are repeated for every month, the month columns (e.g. the number of containers
+    in January, February, ...) are stacked into one column. The rows of the result go month by month
+    for the first row of the table, then for the second one, and so on.
+
+    :param columns: The converted columns of the table, all of the same length.
+    :param static_columns: The names of the columns that are the same for every month.
+    :param month_columns: A dictionary where the keys are the names of the resulting columns,
+                          and the values are the names of the source columns for every month from get_month_columns.
+    :param month_names: The names of the months.
+    :param year: The year of the file, used for the `date` column.
+    :return: A dictionary with the columns of the resulting table, in the order of the record.
+    """
+    count_rows: int = len(next(iter(columns.values())))
+    count_months: int = len(month_names)
+    empty: np.ndarray = np.full(count_rows, None, dtype=object)
+    long_columns: Dict[str, np.ndarray] = {
+        column: np.repeat(columns[column], count_months) for column in static_columns
+    }
+    long_columns["month"] = np.tile(np.arange(1, count_months + 1), count_rows)
+    long_columns["month_string"] = np.tile(np.array(month_names, dtype=object), count_rows)
+    long_columns["date"] = np.tile(
+        np.array([f"{year}-{index_month:02d}-01" for index_month in range(1, count_months + 1)], dtype=object),
+        count_rows
+    )
+    for column, keys in month_columns.items():
+        long_columns[column] = np.stack([columns[key] if key else empty for key in keys], axis=1).ravel()
+    return long_columns
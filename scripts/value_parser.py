@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+from column_schema import AUTO, BOOLEAN, DATE, NUMERIC, TEXT
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+TRUE_VALUES: list = ["да", "yes"]
+FALSE_VALUES: list = ["нет", "no"]
+
+# The strings that int() and float() accept; a float must contain a dot.
+INTEGER_PATTERN: str = r"[+-]?\d(?:_?\d)*"
+FLOAT_PATTERN: str = r"[+-]?(?:\d(?:_?\d)*\.(?:\d(?:_?\d)*)?|\.\d(?:_?\d)*)(?:[eE][+-]?\d(?:_?\d)*)?"
+# A number with an exponent but without a dot: "1e5". parse_column keeps it as a string.
+EXPONENT_PATTERN: str = r"[+-]?\d+[eE][+-]?\d+"
+# A space or a no-break space between digits, as Excel writes the thousands: "1 000 000".
+THOUSANDS_SEPARATOR_PATTERN: str = r"(?<=\d)[ \u00a0](?=\d)"
+# A decimal comma: "12,5". A comma with a dot is not a decimal comma.
+DECIMAL_COMMA_PATTERN: str = r"[+-]?\d+,\d+"
+DATE_OUTPUT_FORMAT: str = "%Y-%m-%d"
+
+# The converted values and the mask of the cells that are present but don't match the type of the column
+Converted = Tuple[np.ndarray, np.ndarray]
+
+
+def to_object_array(values: Sequence) -> np.ndarray:
+    """
+    Creates a one-dimensional object array from the given values.
+
+    Unlike np.array, it never tries to treat the values themselves as sequences.
+
+    :param values: The values.
+    :return: An object array with the values.
+    """
+    result: np.ndarray = np.empty(len(values), dtype=object)
+    result[:] = values
+    return result
+
+
+def _strip(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Strips the cells of a column.
+
+    :param values: The column of cells as strings or None.
+    :return: The stripped cells and the mask of the non-empty cells.
+    :raises TypeError: If the column contains a value which is neither a string nor empty.
+    """
+    present: pd.Series = values.notna() & (values != "")
+    stripped: pd.Series = values.str.strip()
+    if (present & stripped.isna()).any():
+        raise TypeError(f"Column contains values that are not strings: {values[present & stripped.isna()].tolist()}")
+    return stripped, present
+
+
+def _to_numbers(result: np.ndarray, stripped: pd.Series, is_integer: pd.Series, is_float: pd.Series) -> None:
+    if is_integer.any():
+        integers: pd.Series = stripped[is_integer]
+        try:
+            result[is_integer.to_numpy()] = integers.to_numpy(dtype=object).astype(np.int64).tolist()
+        except OverflowError:
+            result[is_integer.to_numpy()] = [int(value) for value in integers]
+    if is_float.any():
+        result[is_float.to_numpy()] = stripped[is_float].to_numpy(dtype=object).astype(float).tolist()
+
+
+def _matches(values: pd.Series, pattern: str) -> pd.Series:
+    return values.str.fullmatch(pattern).fillna(False).astype(bool)
+
+
+def parse_column(values: pd.Series) -> np.ndarray:
+    """
+    Converts a whole column of cells the same way DKP converts a single cell.
+
+    Empty cells become None, "да"/"yes" and "нет"/"no" become booleans, integers and floats with a dot
+    become numbers, everything else is returned as the stripped string. Every step is a pandas string
+    operation over the column, only the numbers themselves are converted by numpy.
+
+    :param values: The column of cells as strings or None.
+    :return: An object array with the converted values.
+    :raises TypeError: If the column contains a value which is neither a string nor empty.
+    """
+    result: np.ndarray = np.full(len(values), None, dtype=object)
+    stripped, present = _strip(values)
+
+    lower: pd.Series = stripped.str.lower()
+    is_true: pd.Series = present & lower.isin(TRUE_VALUES)
+    is_false: pd.Series = present & lower.isin(FALSE_VALUES)
+    rest: pd.Series = present & ~is_true & ~is_false
+    is_integer: pd.Series = rest & _matches(stripped, INTEGER_PATTERN)
+    is_float: pd.Series = rest & _matches(stripped, FLOAT_PATTERN)
+    is_text: pd.Series = rest & ~is_integer & ~is_float
+
+    result[is_true.to_numpy()] = True
+    result[is_false.to_numpy()] = False
+    result[is_text.to_numpy()] = stripped[is_text].tolist()
+    _to_numbers(result, stripped, is_integer, is_float)
+    return result
+
+
+def parse_auto_column(values: pd.Series) -> Converted:
+    """
+    Converts a column of an unknown type with parse_column; no value is a violation.
+
+    :param values: The column of cells as strings or None.
+    :return: The converted values and the mask of the violations.
+    """
+    return parse_column(values), np.zeros(len(values), dtype=bool)
+
+
+def parse_text_column(values: pd.Series) -> Converted:
+    """
+    Converts a text column: the cells are stripped, empty cells become None.
+
+    :param values: The column of cells as strings or None.
+    :return: The converted values and the mask of the violations.
+    """
+    result: np.ndarray = np.full(len(values), None, dtype=object)
+    stripped, present = _strip(values)
+    result[present.to_numpy()] = stripped[present].tolist()
+    return result, np.zeros(len(values), dtype=bool)
+
+
+def parse_numeric_column(values: pd.Series) -> Converted:
+    """
+    Converts a numeric column: integers become int, numbers with a dot, a decimal comma or an exponent become float.
+
+    The spaces between the digits (the thousands separators) are removed. The cells that are not numbers
+    become None and are returned as violations.
+
+    :param values: The column of cells as strings or None.
+    :return: The converted values and the mask of the violations.
+    """
+    result: np.ndarray = np.full(len(values), None, dtype=object)
+    stripped, present = _strip(values)
+    present &= stripped != ""
+    numbers: pd.Series = stripped.str.replace(THOUSANDS_SEPARATOR_PATTERN, "", regex=True)
+    has_decimal_comma: pd.Series = _matches(numbers, DECIMAL_COMMA_PATTERN)
+    if has_decimal_comma.any():
+        numbers = numbers.where(~has_decimal_comma, numbers.str.replace(",", ".", regex=False))
+    is_integer: pd.Series = present & _matches(numbers, INTEGER_PATTERN)
+    is_float: pd.Series = present & ~is_integer & (
+        _matches(numbers, FLOAT_PATTERN) | _matches(numbers, EXPONENT_PATTERN)
+    )
+    _to_numbers(result, numbers, is_integer, is_float)
+    return result, (present & ~is_integer & ~is_float).to_numpy()
+
+
+def parse_boolean_column(values: pd.Series) -> Converted:
+    """
+    Converts a boolean column: "да"/"yes" become True, "нет"/"no" become False, anything else is a violation.
+
+    :param values: The column of cells as strings or None.
+    :return: The converted values and the mask of the violations.
+    """
+    result: np.ndarray = np.full(len(values), None, dtype=object)
+    stripped, present = _strip(values)
+    present &= stripped != ""
+    lower: pd.Series = stripped.str.lower()
+    is_true: pd.Series = present & lower.isin(TRUE_VALUES)
+    is_false: pd.Series = present & lower.isin(FALSE_VALUES)
+    result[is_true.to_numpy()] = True
+    result[is_false.to_numpy()] = False
+    return result, (present & ~is_true & ~is_false).to_numpy()
+
+
+def parse_date_column(values: pd.Series, date_formats: Sequence[str]) -> Converted:
+    """
+    Converts a date column to strings "YYYY-MM-DD", trying the formats in the given order.
+
+    :param values: The column of cells as strings or None.
+    :param date_formats: The formats of the dates for datetime.strptime.
+    :return: The converted values and the mask of the violations.
+    """
+    result: np.ndarray = np.full(len(values), None, dtype=object)
+    stripped, present = _strip(values)
+    present &= stripped != ""
+    dates: pd.Series = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for date_format in date_formats:
+        missing: pd.Series = present & dates.isna()
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(stripped[missing], format=date_format, errors="coerce")
+    is_date: pd.Series = present & dates.notna()
+    result[is_date.to_numpy()] = dates[is_date].dt.strftime(DATE_OUTPUT_FORMAT).tolist()
+    return result, (present & ~is_date).to_numpy()
+
+
+def get_converters(date_formats: Sequence[str]) -> Dict[str, Callable[[pd.Series], Converted]]:
+    """
+    Returns the converter of every type of column_schema.
+
+    :param date_formats: The formats of the dates for the `date` columns.
+    :return: A dictionary where the keys are the types and the values are the converters.
+    """
+    return {
+        TEXT: parse_text_column,
+        NUMERIC: parse_numeric_column,
+        BOOLEAN: parse_boolean_column,
+        DATE: lambda values: parse_date_column(values, date_formats),
+        AUTO: parse_auto_column
+    }
+
+
+class TableParser(object):
+    """
+    Converts the rows of a table column by column.
+
+    The layout of the table (the position of every English column) is resolved once,
+    then every mapped column of the rows is converted in one go by the converter of its type
+    (see column_schema); the columns without a type are converted with parse_column.
+    The cells that don't match the type of their column are None in the result and are listed in `violations`.
+    """
+    def __init__(
+        self,
+        dict_columns_position: Dict[str, Optional[int]],
+        column_types: Optional[Dict[str, str]] = None,
+        date_formats: Sequence[str] = ()
+    ):
+        self.dict_columns_position: Dict[str, Optional[int]] = dict(dict_columns_position)
+        self.column_types: Dict[str, str] = column_types or {}
+        self.converters: Dict[str, Callable[[pd.Series], Converted]] = get_converters(date_formats)
+        self.violations: Dict[str, List[Tuple[int, str]]] = {}
+
+    def parse(self, rows: List[list]) -> Dict[str, np.ndarray]:
+        """
+        Converts the given rows.
+
+        :param rows: The rows of the table, all of the same length.
+        :return: A dictionary where the keys are the English names of the columns and the values are
+                 arrays with the converted values, one per row. Columns without position are all None.
+        """
+        df: pd.DataFrame = pd.DataFrame(rows, dtype=object)
+        parsed_positions: Dict[Tuple[int, str], Converted] = {}
+        columns: Dict[str, np.ndarray] = {}
+        self.violations = {}
+        for column, position in self.dict_columns_position.items():
+            if position is None:
+                columns[column] = np.full(len(rows), None, dtype=object)
+                continue
+            column_type: str = self.column_types.get(column, AUTO)
+            if (position, column_type) not in parsed_positions:
+                parsed_positions[(position, column_type)] = self.converters[column_type](df[position])
+            columns[column], invalid = parsed_positions[(position, column_type)]
+            if invalid.any():
+                offsets: np.ndarray = np.flatnonzero(invalid)
+                self.violations[column] = list(zip(offsets.tolist(), df[position].iloc[offsets].tolist()))
+        return columns
@@ -0,0 +1,513 @@
+import os
+import re
+import gzip
+import json
+import uuid
+import pickle
+from abc import ABC, abstractmethod
+from datetime import datetime
+from record_batch import RecordBatch
+from column_schema import AUTO, BOOLEAN, DATE, NUMERIC, TEXT, get_column_types
+from typing import IO, Any, Dict, Iterable, List, Optional
+
+
+class JsonEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if hasattr(obj, '__dict__'):
+            return obj.__dict__
+        return json.JSONEncoder.default(self, obj)
+
+
+class RecordWriter(ABC):
+    """
+    Writes records to an output as they are produced.
+
+    Records are passed to write() in chunks, close() finishes the output, abort() discards what was written.
+    `count` is the number of records written so far.
+    """
+    count: int = 0
+
+    @abstractmethod
+    def write(self, records: Iterable[dict]) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> str:
+        pass
+
+    @abstractmethod
+    def abort(self) -> None:
+        pass
+
+
+class FileWriter(RecordWriter, ABC):
+    """
+    Writes records to a file as they are produced.
+
+    The records are written to a temporary file next to the output file, which is renamed to the output file
+    only in close(). So the output file either does not exist or is complete, even if the process is killed.
+    """
+    extension: str = ""
+
+    def __init__(self, folder: str, basename: str, compress: bool = False):
+        self.compress: bool = compress
+        self.output_path: str = os.path.join(folder, f"{basename}{self.extension}{'.gz' if compress else ''}")
+        self.tmp_path: str = os.path.join(folder, f".{os.path.basename(self.output_path)}.{os.getpid()}.tmp")
+        self.count: int = 0
+        self.file: Optional[IO] = None
+
+    def _open(self) -> IO:
+        if self.compress:
+            return gzip.open(self.tmp_path, 'wt', encoding='utf-8')
+        return open(self.tmp_path, 'w', encoding='utf-8')
+
+    def write(self, records: Iterable[dict]) -> None:
+        """
+        Writes the given records to the temporary file.
+
+        :param records: The records to write.
+        :return: None
+        """
+        if self.file is None:
+            self.file = self._open()
+        for record in records:
+            self._write_record(record)
+            self.count += 1
+
+    @abstractmethod
+    def _write_record(self, record: dict) -> None:
+        pass
+
+    def _finish(self) -> None:
+        pass
+
+    def close(self) -> str:
+        """
+        Finishes the file and renames it to the output file.
+        :return: The path to the output file.
+        """
+        if self.file is None:
+            self.file = self._open()
+        self._finish()
+        self.file.close()
+        self.file = None
+        os.replace(self.tmp_path, self.output_path)
+        return self.output_path
+
+    def abort(self) -> None:
+        """
+        Removes the temporary file, if the writer has not been closed.
+        :return: None
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.tmp_path)
+
+
+class JsonWriter(FileWriter):
+    """
+    Writes records as one JSON array with indent=4, byte for byte the same as json.dump(list_data, indent=4).
+    """
+    extension: str = ".json"
+
+    def _write_record(self, record: dict) -> None:
+        data: str = json.dumps(record, ensure_ascii=False, indent=4, cls=JsonEncoder).replace("\n", "\n    ")
+        self.file.write(f"{',' if self.count else '['}\n    {data}")
+
+    def _finish(self) -> None:
+        self.file.write("\n]" if self.count else "[]")
+
+
+class NdjsonWriter(FileWriter):
+    """
+    Writes records as newline-delimited JSON, one compact record per line.
+    """
+    extension: str = ".ndjson"
+
+    def _write_record(self, record: dict) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':'), cls=JsonEncoder))
+        self.file.write("\n")
+
+
+class ClickHouseWriter(RecordWriter):
+    """
+    Inserts records into a ClickHouse table in large column-oriented batches, through a staging table.
+
+    The batches are inserted into a staging table with the columns of the table (a plain MergeTree,
+    so a replicated table is not copied with its replication path). Only when the conversion has finished,
+    close() moves the rows to the table with one INSERT ... SELECT and then deletes the rows of the earlier
+    loads of the same file (the same `original_file_name` with another `load_id`), so a file converted again
+    replaces its previous load. Every load writes its own random `load_id` (a String column the table must have),
+    as two loads of a file may have the same `original_file_parsed_on`, which is precise to a second.
+    If the conversion fails, abort() drops the staging table and the last good load of the file stays.
+    Only the fields that are columns of the table are inserted, strings are converted to dates for the Date
+    and DateTime columns. The records are inserted every
+    `batch_size` records; with 0 every written batch is inserted as it is.
+
+    The name of the table must be a plain identifier of a table of the current database (ValueError otherwise),
+    it is quoted in the queries. The client only has to provide `query`, `command` and `insert`
+    like clickhouse_connect's Client, so the writer works with any stand-in that does.
+    """
+    TABLE_NAME_PATTERN: str = r"[A-Za-z_][A-Za-z0-9_]*"
+
+    def __init__(
+        self,
+        client: Any,
+        table: str,
+        original_file_name: str,
+        batch_size: int = 100000
+    ):
+        if not re.fullmatch(self.TABLE_NAME_PATTERN, table):
+            raise ValueError(f"Invalid name of the ClickHouse table: {table!r}")
+        self.client: Any = client
+        self.table: str = table
+        self.load_id: str = uuid.uuid4().hex
+        self.staging_table: str = f"{table}_load_{self.load_id[:12]}"
+        self.original_file_name: str = original_file_name
+        self.batch_size: int = batch_size
+        self.count: int = 0
+        self.column_types: Optional[Dict[str, str]] = None
+        self.columns: Dict[str, List[Any]] = {}
+        self.is_started: bool = False
+        self.is_closed: bool = False
+
+    def _get_column_types(self) -> Dict[str, str]:
+        return dict(self.client.query(
+            "SELECT name, type FROM system.columns WHERE database = currentDatabase() AND table = %(table)s",
+            parameters={'table': self.table}
+        ).result_rows)
+
+    def _create_staging_table(self) -> None:
+        self.client.command(
+            f"CREATE TABLE `{self.staging_table}` AS `{self.table}` ENGINE = MergeTree ORDER BY tuple()"
+        )
+
+    def _drop_staging_table(self) -> None:
+        self.client.command(f"DROP TABLE IF EXISTS `{self.staging_table}`")
+
+    def _replace_file_rows(self) -> None:
+        columns: str = ", ".join(f"`{column}`" for column in [*self.columns, "load_id"])
+        self.client.command(
+            f"INSERT INTO `{self.table}` ({columns}) SELECT {columns} FROM `{self.staging_table}`",
+            settings={'insert_deduplicate': 0}
+        )
+        self.client.command(
+            f"ALTER TABLE `{self.table}` DELETE "
+            f"WHERE original_file_name = %(original_file_name)s AND load_id != %(load_id)s",
+            parameters={'original_file_name': self.original_file_name, 'load_id': self.load_id},
+            settings={'mutations_sync': 2}
+        )
+
+    @staticmethod
+    def _convert_value(value: Any, column_type: str) -> Any:
+        if isinstance(value, str) and "Date" in column_type:
+            for date_format in ["%Y-%m-%d %H:%M:%S", "%Y-%m-%d"]:
+                try:
+                    parsed: datetime = datetime.strptime(value, date_format)
+                    return parsed if "DateTime" in column_type else parsed.date()
+                except ValueError:
+                    continue
+        return value
+
+    def _flush(self) -> None:
+        if not self.columns or not next(iter(self.columns.values())):
+            return
+        if not self.is_started:
+            self._create_staging_table()
+            self.is_started = True
+        self.client.insert(
+            self.staging_table,
+            data=[
+                [self._convert_value(value, self.column_types[column]) for value in values]
+                for column, values in self.columns.items()
+            ] + [[self.load_id] * len(next(iter(self.columns.values())))],
+            column_names=[*self.columns, "load_id"],
+            column_oriented=True
+        )
+        self.columns = {column: [] for column in self.columns}
+
+    def write(self, records: Iterable[dict]) -> None:
+        """
+        Adds the given records to the current batch and inserts the batch once it is full.
+        A RecordBatch is added column by column.
+
+        :param records: The records to insert.
+        :return: None
+        :raises ValueError: If the table has no `original_file_name` or `load_id` column.
+        """
+        if self.column_types is None:
+            self.column_types = self._get_column_types()
+            missing: set = {"original_file_name", "load_id"} - set(self.column_types)
+            if missing:
+                raise ValueError(f"The ClickHouse table {self.table} has no columns {sorted(missing)}")
+            # The load id is written by the writer itself, not taken from the records
+            del self.column_types["load_id"]
+        if isinstance(records, RecordBatch):
+            # The batch is already stored by columns, so the records are never expanded
+            if not self.columns:
+                self.columns = {column: [] for column in records.fields if column in self.column_types}
+            for column, values in self.columns.items():
+                values.extend(records.column(column))
+            self.count += len(records)
+            if len(next(iter(self.columns.values()), [])) >= self.batch_size:
+                self._flush()
+            return
+        for record in records:
+            if not self.columns:
+                self.columns = {column: [] for column in record if column in self.column_types}
+            for column, values in self.columns.items():
+                values.append(record.get(column))
+            self.count += 1
+            if len(next(iter(self.columns.values()), [])) >= self.batch_size:
+                self._flush()
+
+    def close(self) -> str:
+        """
+        Inserts the last batch and replaces the earlier loads of the file with the rows of the staging table.
+        :return: A description of the output.
+        """
+        self._flush()
+        if self.is_started:
+            self._replace_file_rows()
+            self._drop_staging_table()
+        self.is_closed = True
+        return f"clickhouse:{self.table}"
+
+    def abort(self) -> None:
+        """
+        Drops the staging table, if the writer has not been closed; the table itself is not changed.
+        :return: None
+        """
+        if self.is_started and not self.is_closed:
+            self._drop_staging_table()
+        self.is_closed = True
+
+
+class SpoolWriter(RecordWriter):
+    """
+    Writes the batches of records to a temporary file as they are, to be read back with read_spool.
+
+    It is used to pass the records of a sheet parsed in another process to the writer of the output:
+    the batches are pickled one by one, so neither process holds all the records of the sheet.
+    """
+    def __init__(self, path: str):
+        self.output_path: str = path
+        self.count: int = 0
+        self.file: Optional[IO] = None
+
+    def write(self, records: Iterable[dict]) -> None:
+        if self.file is None:
+            self.file = open(self.output_path, 'wb')
+        batch: Any = records if isinstance(records, RecordBatch) else list(records)
+        pickle.dump(batch, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.count += len(batch)
+
+    def close(self) -> str:
+        if self.file is None:
+            self.file = open(self.output_path, 'wb')
+        self.file.close()
+        self.file = None
+        return self.output_path
+
+    def abort(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.output_path)
+
+
+def read_spool(path: str) -> Iterable[Any]:
+    """
+    Reads the batches written by SpoolWriter.
+
+    :param path: The path to the file of SpoolWriter.
+    :return: An iterator of the batches of records.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+class ParquetWriter(RecordWriter):
+    """
+    Writes records to a Parquet file with an explicit schema, one row group per written batch.
+
+    The type of a field is taken from the type of its column (see column_schema): text columns
+    and the other repeated strings (the department, the name of the file, ...) are dictionary-encoded,
+    numeric columns are float64, boolean columns are bool and dates are date32. The columns of the `auto` type
+    may hold both numbers and text. Those that mostly hold one type (container_size, *_separation, *_tax, see
+    MIXED_FIELDS) are written with that type, and the values of another type (e.g. "40HC" or "без НДС") go as strings
+    to the column `<field>_text` next to them; the other `auto` columns are written as strings. The schema is built
+    from the fields of the first written records. With `compress` the file is compressed with zstd instead of snappy.
+
+    Needs the pyarrow package, which is imported only when the writer is created.
+    """
+    extension: str = ".parquet"
+    # The fields added to the columns of the table (see DKP.get_content_in_rows and delta.DeltaWriter)
+    DICTIONARY_FIELDS: tuple = ("department", "month_string", "original_file_name", "sheet_name", "operation")
+    INTEGER_FIELDS: tuple = ("year", "month", "occurrence")
+    NUMERIC_FIELDS: tuple = ("container_count", "teu")
+    DATE_FIELDS: tuple = ("date",)
+    TIMESTAMP_FIELDS: tuple = ("original_file_parsed_on",)
+    # The ends of the names of the `auto` fields with a usual type, and the type
+    MIXED_FIELDS: tuple = (("container_size", NUMERIC), ("_separation", BOOLEAN), ("_tax", NUMERIC))
+
+    def __init__(self, folder: str, basename: str, compress: bool = False, column_types: Optional[dict] = None):
+        try:
+            import pyarrow
+            import pyarrow.compute
+            import pyarrow.parquet
+        except ImportError as exception:
+            raise RuntimeError("The parquet format needs the pyarrow package (pip install pyarrow)") from exception
+        self.pa: Any = pyarrow
+        self.pq: Any = pyarrow.parquet
+        self.compression: str = "zstd" if compress else "snappy"
+        self.column_types: Dict[str, str] = column_types or get_column_types()
+        self.output_path: str = os.path.join(folder, f"{basename}{self.extension}")
+        self.tmp_path: str = os.path.join(folder, f".{os.path.basename(self.output_path)}.{os.getpid()}.tmp")
+        self.count: int = 0
+        self.fields: List[str] = []
+        self.schema: Any = None
+        self.file: Any = None
+
+    def get_mixed_type(self, field: str) -> Optional[str]:
+        """
+        Returns the usual type of an `auto` field that holds values of different types.
+        :param field: The name of the field.
+        :return: NUMERIC or BOOLEAN, or None if the field is not one of MIXED_FIELDS or has a type in reference_dkp.
+        """
+        if self.column_types.get(field, AUTO) != AUTO:
+            return None
+        return next((column_type for end, column_type in self.MIXED_FIELDS if field.endswith(end)), None)
+
+    def get_field_type(self, field: str) -> Any:
+        """
+        Returns the Arrow type of a field.
+        :param field: The name of the field.
+        :return: The Arrow data type.
+        """
+        pa: Any = self.pa
+        column_type: Optional[str] = self.column_types.get(field)
+        if field in self.DICTIONARY_FIELDS or column_type == TEXT:
+            return pa.dictionary(pa.int32(), pa.string())
+        if field in self.INTEGER_FIELDS:
+            return pa.int32()
+        if field in self.NUMERIC_FIELDS or column_type == NUMERIC or self.get_mixed_type(field) == NUMERIC:
+            return pa.float64()
+        if column_type == BOOLEAN or self.get_mixed_type(field) == BOOLEAN:
+            return pa.bool_()
+        if field in self.DATE_FIELDS or column_type == DATE:
+            return pa.date32()
+        if field in self.TIMESTAMP_FIELDS:
+            return pa.timestamp("s")
+        return pa.string()
+
+    def _to_array(self, values: list, arrow_type: Any) -> Any:
+        pa: Any = self.pa
+        if pa.types.is_dictionary(arrow_type):
+            return pa.array(self._to_strings(values), pa.string()).dictionary_encode().cast(arrow_type)
+        if pa.types.is_date32(arrow_type) or pa.types.is_timestamp(arrow_type):
+            date_format: str = "%Y-%m-%d" if pa.types.is_date32(arrow_type) else "%Y-%m-%d %H:%M:%S"
+            strings: Any = pa.array(self._to_strings(values), pa.string())
+            return pa.compute.strptime(strings, format=date_format, unit="s", error_is_null=True).cast(arrow_type)
+        if pa.types.is_string(arrow_type):
+            return pa.array(self._to_strings(values), arrow_type)
+        return pa.array(values, arrow_type)
+
+    def _to_arrays(self, field: str, values: list, arrow_type: Any) -> list:
+        """
+        Converts the values of a field to its Arrow array and, for a mixed field, the array of its `<field>_text`.
+        """
+        mixed_type: Optional[str] = self.get_mixed_type(field)
+        if mixed_type is None:
+            return [self._to_array(values, arrow_type)]
+        expected: tuple = (bool,) if mixed_type == BOOLEAN else (int, float)
+        is_typed: list = [
+            value is None or (isinstance(value, expected) and (mixed_type == BOOLEAN or not isinstance(value, bool)))
+            for value in values
+        ]
+        return [
+            self._to_array([value if typed else None for value, typed in zip(values, is_typed)], arrow_type),
+            self._to_array([None if typed else value for value, typed in zip(values, is_typed)], self.pa.string())
+        ]
+
+    @staticmethod
+    def _to_strings(values: list) -> list:
+        return [
+            value if value is None or isinstance(value, str) else json.dumps(value, cls=JsonEncoder)
+            for value in values
+        ]
+
+    def write(self, records: Iterable[dict]) -> None:
+        """
+        Writes the given records as a row group, opening the file with the schema of the first records.
+
+        :param records: The records to write, a RecordBatch is written column by column.
+        :return: None
+        """
+        if isinstance(records, RecordBatch):
+            fields: List[str] = records.fields
+            columns: Dict[str, list] = {field: records.column(field) for field in fields}
+            length: int = len(records)
+        else:
+            records = list(records)
+            fields = list(dict.fromkeys(field for record in records for field in record))
+            columns = {field: [record.get(field) for record in records] for field in fields}
+            length = len(records)
+        if not length:
+            return
+        if self.schema is None:
+            self.fields = fields
+            self.schema = self.pa.schema([
+                (name, arrow_type)
+                for field in fields
+                for name, arrow_type in [(field, self.get_field_type(field))] + (
+                    [(f"{field}_text", self.pa.string())] if self.get_mixed_type(field) else []
+                )
+            ])
+            self.file = self.pq.ParquetWriter(self.tmp_path, self.schema, compression=self.compression)
+        self.file.write_table(self.pa.Table.from_arrays(
+            [
+                array
+                for field in self.fields
+                for array in self._to_arrays(
+                    field, columns.get(field, [None] * length), self.schema.field(field).type
+                )
+            ],
+            schema=self.schema
+        ))
+        self.count += length
+
+    def close(self) -> str:
+        """
+        Finishes the file and renames it to the output file.
+        :return: The path to the output file.
+        """
+        if self.file is None:
+            self.schema = self.pa.schema([])
+            self.file = self.pq.ParquetWriter(self.tmp_path, self.schema, compression=self.compression)
+        self.file.close()
+        self.file = None
+        os.replace(self.tmp_path, self.output_path)
+        return self.output_path
+
+    def abort(self) -> None:
+        """
+        Removes the temporary file, if the writer has not been closed.
+        :return: None
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            os.remove(self.tmp_path)
+
+
+WRITERS: dict = {
+    "json": JsonWriter,
+    "ndjson": NdjsonWriter,
+    "parquet": ParquetWriter
+}
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import time
+import pytest
+import openpyxl
+import subprocess
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+SCRIPTS: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+sys.path.insert(0, SCRIPTS)
+import synthetic_workbook  # noqa: E402
+
+# The second sheet name lets a workbook carry several DKP sheets
+SECOND_SHEET_NAME: str = f"{synthetic_workbook.SHEET_NAME} 2"
+# The rows before the block row and the header row in the synthetic sheets
+PREAMBLE_ROWS: int = 5
+
+
+def get_column_index(column: str, block: Optional[str] = None) -> int:
+    """
+    Returns the position of a column of the synthetic sheet, e.g. ("tax", "service") for service_tax.
+    """
+    blocks, header = synthetic_workbook.get_header_rows()
+    if block is None:
+        return header.index(dict(synthetic_workbook.GENERAL_COLUMNS)[column])
+    block_name: str = next(name for key, name, _ in synthetic_workbook.BLOCKS if key == block)
+    return header.index(dict(synthetic_workbook.RATE_COLUMNS)[column], blocks.index(block_name))
+
+
+@pytest.fixture(scope="session")
+def reference_cache(tmp_path_factory) -> str:
+    path: str = str(tmp_path_factory.mktemp("reference") / "reference_dkp.json")
+    rows: list = synthetic_workbook.get_reference_rows() + [("Наименования листов", "", SECOND_SHEET_NAME, "")]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": [0, 0], "saved_at": time.time(), "rows": rows}, f, ensure_ascii=False)
+    return path
+
+
+@pytest.fixture
+def write_workbook(tmp_path) -> Callable[..., str]:
+    """
+    Returns a function that writes a synthetic workbook with some cells of the table replaced.
+
+    The cells are given as {(row of the table, column, block): value}, the block is None for the general columns.
+    """
+    def write(
+        rows: int = 3,
+        cells: Optional[Dict[Tuple[int, str, Optional[str]], object]] = None,
+        sheets: Sequence[str] = (synthetic_workbook.SHEET_NAME,),
+        name: Optional[str] = None,
+        seed: int = 1
+    ) -> str:
+        sheet_rows: list = list(synthetic_workbook.iter_sheet_rows(rows, PREAMBLE_ROWS, seed))
+        for (row, column, block), value in (cells or {}).items():
+            sheet_rows[PREAMBLE_ROWS + 2 + row][get_column_index(column, block)] = value
+        workbook: openpyxl.Workbook = openpyxl.Workbook(write_only=True)
+        workbook.create_sheet("Справочно").append(["Лист без данных ДКП"])
+        for sheet_name in sheets:
+            sheet = workbook.create_sheet(sheet_name)
+            for sheet_row in sheet_rows:
+                sheet.append(sheet_row)
+        path: str = str(tmp_path / (name or f"{synthetic_workbook.DEPARTMENT[0]}_2024_{rows}.xlsx"))
+        workbook.save(path)
+        return path
+    return write
+
+
+@pytest.fixture
+def run_dkp(reference_cache: str, tmp_path) -> Callable[..., subprocess.CompletedProcess]:
+    """
+    Returns a function that runs dkp.py offline with the given arguments in the temporary folder of the test.
+    """
+    def run(*arguments: str, **environment: str) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [sys.executable, os.path.join(SCRIPTS, "dkp.py"), *arguments],
+            cwd=tmp_path,
+            env=dict(os.environ, DKP_OFFLINE="1", DKP_REFERENCE_CACHE=reference_cache, **environment),
+            capture_output=True,
+            text=True,
+            timeout=300
+        )
+    return run
+
@@ -0,0 +1,45 @@
+import os
+import glob
+import logging
+import multiprocessing
+from app_logger import SharedRotatingFileHandler
+
+LINES: int = 300
+
+
+def write_lines(path: str, process: int) -> None:
+    handler: SharedRotatingFileHandler = SharedRotatingFileHandler(path, 2000, 100, encoding="utf-8")
+    for index in range(LINES):
+        handler.handle(logging.makeLogRecord({"msg": f"process {process} line {index}"}))
+    handler.close()
+
+
+def test_file_is_rotated_by_size_while_several_processes_write_it(tmp_path):
+    path: str = str(tmp_path / "dkp.log")
+    processes: list = [multiprocessing.Process(target=write_lines, args=(path, index)) for index in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+    files: list = glob.glob(f"{path}*")
+    assert len(files) > 5
+    lines: list = []
+    for file in files:
+        if file.endswith(".lock"):
+            continue
+        assert os.path.getsize(file) < 2100
+        with open(file, encoding="utf-8") as f:
+            lines.extend(f.read().splitlines())
+    assert sorted(lines) == sorted(f"process {process} line {index}" for process in range(3) for index in range(LINES))
+
+
+def test_oldest_files_are_dropped(tmp_path):
+    path: str = str(tmp_path / "dkp.log")
+    handler: SharedRotatingFileHandler = SharedRotatingFileHandler(path, 100, 2, encoding="utf-8")
+    for index in range(50):
+        handler.handle(logging.makeLogRecord({"msg": f"line {index}"}))
+    handler.close()
+    assert sorted(os.listdir(tmp_path)) == ["dkp.log", "dkp.log.1", "dkp.log.2", "dkp.log.lock"]
+    with open(path, encoding="utf-8") as f:
+        assert f.read().splitlines()[-1] == "line 49"
@@ -0,0 +1,43 @@
+import os
+import json
+import gzip
+import pytest
+import subprocess
+
+# The output of the converter before the performance work (the baseline commit) for the workbook
+# synthetic_workbook.generate_workbook(folder, 3, seed=1), with original_file_parsed_on set to null.
+EXPECTED_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "baseline_3_rows.json")
+
+
+def read_records(path: str) -> list:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            return json.load(f)
+        return [json.loads(line) for line in f]
+
+
+def typed(records: list) -> list:
+    return [[(type(value).__name__, value) for value in record] for record in records]
+
+
+@pytest.mark.parametrize("options", [
+    [], ["--stream"], ["--format", "ndjson", "--gzip"], ["--memory-budget", "64"], ["--collect-errors"]
+])
+def test_output_is_the_same_as_the_baseline(write_workbook, run_dkp, options: list, tmp_path):
+    output_folder: str = str(tmp_path / "output")
+    os.makedirs(output_folder)
+    process: subprocess.CompletedProcess = run_dkp(write_workbook(3, seed=1), output_folder, *options)
+    assert process.returncode == 0, process.stderr
+    [output] = os.listdir(output_folder)
+    records: list = read_records(os.path.join(output_folder, output))
+    with open(EXPECTED_PATH, encoding="utf-8") as f:
+        expected: dict = json.load(f)
+    assert all(list(record) == expected["fields"] for record in records)
+    assert all(isinstance(record.pop("original_file_parsed_on"), str) for record in records)
+    fields: list = [field for field in expected["fields"] if field != "original_file_parsed_on"]
+    expected_records: list = [
+        [value for field, value in zip(expected["fields"], values) if field != "original_file_parsed_on"]
+        for values in expected["records"]
+    ]
+    assert typed([[record[field] for field in fields] for record in records]) == typed(expected_records)
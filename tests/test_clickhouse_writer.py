@@ -0,0 +1,144 @@
+import re
+import pytest
+from datetime import date, datetime
+from record_batch import RecordBatch
+from writers import ClickHouseWriter
+
+COLUMNS: dict = {
+    "client": "String",
+    "month": "UInt8",
+    "date": "Date",
+    "original_file_name": "String",
+    "original_file_parsed_on": "DateTime",
+    "load_id": "String"
+}
+
+
+class Result(object):
+    def __init__(self, rows: list):
+        self.result_rows = rows
+
+
+class FakeClient(object):
+    """
+    A stand-in for clickhouse_connect's Client that keeps the tables as lists of dictionaries
+    and understands only the statements of ClickHouseWriter.
+    """
+    def __init__(self, rows: list = ()):
+        self.tables: dict = {"dkp": list(rows)}
+        self.statements: list = []
+        self.inserts: list = []
+
+    def query(self, query: str, parameters: dict = None):
+        return Result(list(COLUMNS.items()) if parameters["table"] in self.tables else [])
+
+    def command(self, command: str, parameters: dict = None, settings: dict = None):
+        self.statements.append(command)
+        if match := re.fullmatch(r"CREATE TABLE `(\w+)` AS `(\w+)` ENGINE = MergeTree ORDER BY tuple\(\)", command):
+            self.tables[match.group(1)] = []
+        elif match := re.fullmatch(r"DROP TABLE IF EXISTS `(\w+)`", command):
+            self.tables.pop(match.group(1), None)
+        elif match := re.fullmatch(r"INSERT INTO `(\w+)` \((.+)\) SELECT .+ FROM `(\w+)`", command):
+            columns: list = re.findall(r"`(\w+)`", match.group(2))
+            self.tables[match.group(1)] += [
+                {column: row[column] for column in columns} for row in self.tables[match.group(3)]
+            ]
+        elif match := re.match(r"ALTER TABLE `(\w+)` DELETE", command):
+            self.tables[match.group(1)] = [
+                row for row in self.tables[match.group(1)]
+                if row["original_file_name"] != parameters["original_file_name"]
+                or row["load_id"] == parameters["load_id"]
+            ]
+        else:
+            raise AssertionError(f"Unexpected statement: {command}")
+
+    def insert(self, table: str, data: list, column_names: list, column_oriented: bool):
+        assert column_oriented
+        self.inserts.append((table, len(data[0])))
+        self.tables[table] += [dict(zip(column_names, values)) for values in zip(*data)]
+
+
+def get_batch(clients: list, parsed_on: str, file_name: str = "ОП_2024.xlsx") -> RecordBatch:
+    return RecordBatch(
+        ["client", "month", "date", "unknown", "original_file_name", "original_file_parsed_on"],
+        {"client": clients, "month": [1] * len(clients), "date": ["2024-01-01"] * len(clients)},
+        {"unknown": "not a column", "original_file_name": file_name, "original_file_parsed_on": parsed_on}
+    )
+
+
+def load(client: FakeClient, clients: list, parsed_on: str, file_name: str = "ОП_2024.xlsx") -> ClickHouseWriter:
+    writer: ClickHouseWriter = ClickHouseWriter(client, "dkp", file_name)
+    writer.write(get_batch(clients, parsed_on, file_name))
+    writer.close()
+    return writer
+
+
+def test_load_replaces_earlier_load_of_the_same_file():
+    client: FakeClient = FakeClient()
+    load(client, ["other"], "2024-01-01 00:00:00", "ОП_2023.xlsx")
+    load(client, ["a", "b"], "2024-02-01 00:00:00")
+    load(client, ["c"], "2024-03-01 00:00:00")
+    assert sorted(row["client"] for row in client.tables["dkp"]) == ["c", "other"]
+    assert set(client.tables) == {"dkp"}
+
+
+def test_loads_in_the_same_second_replace_each_other():
+    client: FakeClient = FakeClient()
+    load(client, ["a", "b"], "2024-02-01 00:00:00")
+    writer: ClickHouseWriter = load(client, ["c"], "2024-02-01 00:00:00")
+    assert [(row["client"], row["load_id"]) for row in client.tables["dkp"]] == [("c", writer.load_id)]
+
+
+def test_values_are_converted_to_the_types_of_the_columns():
+    client: FakeClient = FakeClient()
+    writer: ClickHouseWriter = load(client, ["a"], "2024-02-01 10:20:30")
+    assert client.tables["dkp"] == [{
+        "client": "a",
+        "month": 1,
+        "date": date(2024, 1, 1),
+        "original_file_name": "ОП_2024.xlsx",
+        "original_file_parsed_on": datetime(2024, 2, 1, 10, 20, 30),
+        "load_id": writer.load_id
+    }]
+
+
+def test_failed_load_keeps_the_last_good_load():
+    client: FakeClient = FakeClient()
+    load(client, ["a", "b"], "2024-02-01 00:00:00")
+    writer: ClickHouseWriter = ClickHouseWriter(client, "dkp", "ОП_2024.xlsx", batch_size=1)
+    writer.write(get_batch(["c", "d"], "2024-03-01 00:00:00"))
+    writer.abort()
+    assert [row["client"] for row in client.tables["dkp"]] == ["a", "b"]
+    assert set(client.tables) == {"dkp"}
+
+
+def test_abort_before_the_first_insert_does_nothing():
+    client: FakeClient = FakeClient()
+    writer: ClickHouseWriter = ClickHouseWriter(client, "dkp", "ОП_2024.xlsx")
+    writer.write(get_batch(["c"], "2024-03-01 00:00:00"))
+    writer.abort()
+    assert client.statements == []
+
+
+@pytest.mark.parametrize("batch_size, inserts", [(100000, [2 * 3]), (4, [4, 2]), (0, [2, 2, 2])])
+def test_batch_size(batch_size: int, inserts: list):
+    client: FakeClient = FakeClient()
+    writer: ClickHouseWriter = ClickHouseWriter(client, "dkp", "ОП_2024.xlsx", batch_size)
+    for _ in range(3):
+        writer.write(get_batch(["a", "b"], "2024-03-01 00:00:00"))
+    writer.close()
+    assert [count for _, count in client.inserts] == inserts
+    assert len(client.tables["dkp"]) == 6
+
+
+@pytest.mark.parametrize("table", ["dkp; DROP TABLE dkp", "db.dkp", "`dkp`", ""])
+def test_invalid_table_name(table: str):
+    with pytest.raises(ValueError):
+        ClickHouseWriter(FakeClient(), table, "ОП_2024.xlsx")
+
+
+def test_table_without_load_id():
+    client: FakeClient = FakeClient()
+    client.query = lambda query, parameters: Result([item for item in COLUMNS.items() if item[0] != "load_id"])
+    with pytest.raises(ValueError, match="load_id"):
+        ClickHouseWriter(client, "dkp", "ОП_2024.xlsx").write(get_batch(["a"], "2024-03-01 00:00:00"))
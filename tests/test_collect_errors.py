@@ -0,0 +1,64 @@
+import os
+import json
+import pytest
+import subprocess
+
+# The second row of the table has a text in a numeric column
+CELLS: dict = {(1, "marine", "service"): "договорная"}
+FILENAME: str = "ОП_2024_3.xlsx"
+
+
+def convert(write_workbook, run_dkp, tmp_path, *options: str) -> subprocess.CompletedProcess:
+    output_folder: str = str(tmp_path / "output")
+    os.makedirs(output_folder, exist_ok=True)
+    return run_dkp(write_workbook(3, CELLS), output_folder, *options)
+
+
+def read_json(path) -> object:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize("options", [[], ["--collect-errors"], ["--quarantine"]])
+def test_type_violations_are_written_as_empty(write_workbook, run_dkp, tmp_path, options: list):
+    process: subprocess.CompletedProcess = convert(write_workbook, run_dkp, tmp_path, *options)
+    assert process.returncode == 0, process.stderr
+    records: list = read_json(tmp_path / "output" / f"{FILENAME}.json")
+    assert len(records) == 36
+    assert {record["service_marine"] for record in records[12:24]} == {None}
+    assert all(isinstance(record["service_marine"], float) for record in records[:12] + records[24:])
+    report: dict = read_json(tmp_path / "errors" / f"{FILENAME}.errors.json")
+    assert report["count_rows"] == 0
+    assert report["count_type_violations"] == {"service_marine": 1}
+    assert [(cell["column"], cell["value"]) for cell in report["type_violations"]] == [("service_marine", "договорная")]
+    assert not os.path.exists(tmp_path / "errors" / f"{FILENAME}.quarantine.json")
+
+
+def test_strict_types_fail_on_the_first_row_with_a_type_violation(write_workbook, run_dkp, tmp_path):
+    process: subprocess.CompletedProcess = convert(write_workbook, run_dkp, tmp_path, "--strict-types")
+    assert process.returncode == 5
+    assert os.listdir(tmp_path / "output") == []
+
+
+def test_strict_types_collect_the_rows_with_type_violations(write_workbook, run_dkp, tmp_path):
+    process: subprocess.CompletedProcess = convert(
+        write_workbook, run_dkp, tmp_path, "--strict-types", "--collect-errors"
+    )
+    assert process.returncode == 5
+    assert "5_in_rows_1" in process.stderr
+    assert os.listdir(tmp_path / "output") == []
+    report: dict = read_json(tmp_path / "errors" / f"{FILENAME}.errors.json")
+    assert report["count_rows"] == 1
+    assert report["errors"][0]["error"] == "TypeViolation"
+    assert not os.path.exists(tmp_path / "errors" / f"{FILENAME}.quarantine.json")
+
+
+def test_strict_types_quarantine_only_the_rows_with_type_violations(write_workbook, run_dkp, tmp_path):
+    process: subprocess.CompletedProcess = convert(write_workbook, run_dkp, tmp_path, "--strict-types", "--quarantine")
+    assert process.returncode == 0, process.stderr
+    records: list = read_json(tmp_path / "output" / f"{FILENAME}.json")
+    assert len(records) == 24
+    assert all(isinstance(record["service_marine"], float) for record in records)
+    quarantine: list = read_json(tmp_path / "errors" / f"{FILENAME}.quarantine.json")
+    assert len(quarantine) == 1
+    assert "договорная" in quarantine[0]["values"]
@@ -0,0 +1,120 @@
+import os
+import pytest
+from writers import RecordWriter
+from delta import KEY_FIELDS, DeltaWriter, get_record_hash, get_snapshot_path
+
+CONSTANTS: dict = {"department": "Отдел продаж", "year": 2024}
+
+
+class ListWriter(RecordWriter):
+    def __init__(self):
+        self.records: list = []
+        self.is_closed: bool = False
+        self.is_aborted: bool = False
+
+    def write(self, records) -> None:
+        self.records.extend(records)
+
+    def close(self) -> str:
+        self.is_closed = True
+        return "output"
+
+    def abort(self) -> None:
+        self.is_aborted = True
+
+
+def get_record(client: str, month: int = 1, teu: int = 0, parsed_on: str = "2024-01-01 00:00:00") -> dict:
+    return {
+        **CONSTANTS,
+        **dict.fromkeys(KEY_FIELDS),
+        "client": client,
+        "month": month,
+        "teu": teu,
+        "original_file_name": "ОП_2024.xlsx",
+        "original_file_parsed_on": parsed_on
+    }
+
+
+def convert(snapshot_path: str, records: list, chunk_rows: int = 2) -> DeltaWriter:
+    writer: DeltaWriter = DeltaWriter(ListWriter(), snapshot_path, CONSTANTS)
+    for start in range(0, len(records), chunk_rows):
+        writer.write(records[start:start + chunk_rows])
+    assert writer.close() == "output"
+    return writer
+
+
+def get_changes(writer: DeltaWriter) -> list:
+    return [(record["operation"], record["client"], record["occurrence"]) for record in writer.writer.records]
+
+
+@pytest.fixture
+def snapshot_path(tmp_path) -> str:
+    return get_snapshot_path(str(tmp_path / "snapshots"), "ОП", 2024)
+
+
+def test_first_version_is_inserted(snapshot_path: str):
+    writer: DeltaWriter = convert(snapshot_path, [get_record("a"), get_record("b"), get_record("c")])
+    assert get_changes(writer) == [("insert", "a", 0), ("insert", "b", 0), ("insert", "c", 0)]
+    assert writer.stats == {"inserted": 3, "updated": 0, "deleted": 0, "unchanged": 0}
+    assert os.path.exists(snapshot_path)
+
+
+def test_same_version_writes_nothing(snapshot_path: str):
+    convert(snapshot_path, [get_record("a"), get_record("b")])
+    writer: DeltaWriter = convert(snapshot_path, [get_record("a"), get_record("b", parsed_on="2024-02-01 00:00:00")])
+    assert writer.writer.records == []
+    assert writer.stats == {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 2}
+
+
+def test_insert_update_and_delete(snapshot_path: str):
+    convert(snapshot_path, [get_record("a"), get_record("b"), get_record("c")])
+    writer: DeltaWriter = convert(snapshot_path, [get_record("a", teu=10), get_record("c"), get_record("d")])
+    assert get_changes(writer) == [("update", "a", 0), ("insert", "d", 0), ("delete", "b", 0)]
+    assert writer.writer.records[0]["teu"] == 10
+    assert writer.writer.records[-1] == {
+        **CONSTANTS, **dict.fromkeys(KEY_FIELDS), "client": "b", "month": 1, "occurrence": 0, "operation": "delete"
+    }
+    assert writer.stats == {"inserted": 1, "updated": 1, "deleted": 1, "unchanged": 1}
+
+
+def test_repeated_keys_are_told_apart_by_their_occurrence(snapshot_path: str):
+    convert(snapshot_path, [get_record("a", teu=1), get_record("a", teu=2), get_record("a", month=2)])
+    writer: DeltaWriter = convert(snapshot_path, [get_record("a", teu=1), get_record("a", teu=3)])
+    assert get_changes(writer) == [("update", "a", 1), ("delete", "a", 0)]
+    assert [record["month"] for record in writer.writer.records] == [1, 2]
+    assert writer.writer.records[0]["teu"] == 3
+    writer = convert(snapshot_path, [get_record("a", teu=1), get_record("a", teu=3), get_record("a", teu=4)])
+    assert get_changes(writer) == [("insert", "a", 2)]
+
+
+def test_removed_repeated_record_is_deleted_by_its_occurrence(snapshot_path: str):
+    convert(snapshot_path, [get_record("a", teu=1), get_record("a", teu=2)])
+    writer: DeltaWriter = convert(snapshot_path, [get_record("a", teu=1)])
+    assert get_changes(writer) == [("delete", "a", 1)]
+
+
+def test_chunks_do_not_change_the_delta(snapshot_path: str, tmp_path):
+    first: list = [get_record(client, teu=index) for index, client in enumerate("abcabc")]
+    second: list = [get_record(client, teu=index % 3) for index, client in enumerate("abcab")]
+    other_path: str = str(tmp_path / "other.ndjson.gz")
+    convert(snapshot_path, first, chunk_rows=1)
+    convert(other_path, first, chunk_rows=100)
+    assert get_changes(convert(snapshot_path, second, chunk_rows=1)) == \
+        get_changes(convert(other_path, second, chunk_rows=100))
+
+
+def test_abort_keeps_the_previous_snapshot(snapshot_path: str):
+    convert(snapshot_path, [get_record("a")])
+    writer: DeltaWriter = DeltaWriter(ListWriter(), snapshot_path, CONSTANTS)
+    writer.write([get_record("b")])
+    writer.abort()
+    assert writer.writer.is_aborted
+    assert sorted(os.listdir(os.path.dirname(snapshot_path))) == [
+        os.path.basename(snapshot_path), f"{os.path.basename(snapshot_path)}.lock"
+    ]
+    assert get_changes(convert(snapshot_path, [get_record("a")])) == []
+
+
+def test_record_hash_ignores_the_volatile_fields():
+    assert get_record_hash(get_record("a")) == get_record_hash(get_record("a", parsed_on="2025-01-01 00:00:00"))
+    assert get_record_hash(get_record("a")) != get_record_hash(get_record("a", teu=1))
@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import shutil
+import signal
+import pytest
+import subprocess
+from conftest import SCRIPTS
+from file_watcher import open_watcher
+
+WORKER_PATH: str = os.path.join(SCRIPTS, "dkp_worker.py")
+
+
+@pytest.fixture
+def xls_path(tmp_path) -> str:
+    path: str = str(tmp_path / "dkp")
+    os.makedirs(path)
+    return path
+
+
+def get_environment(reference_cache: str, tmp_path) -> dict:
+    return dict(os.environ, DKP_OFFLINE="1", DKP_REFERENCE_CACHE=reference_cache, XL_IDP_PATH_DKP=str(tmp_path))
+
+
+def read_log(tmp_path) -> str:
+    try:
+        with open(tmp_path / "logging" / "dkp_worker.log", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return ""
+
+
+def run_once(environment: dict, tmp_path) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, WORKER_PATH, "--once", "--min-age", "0"],
+        cwd=tmp_path, env=environment, capture_output=True, text=True, timeout=300
+    )
+
+
+def test_worker_moves_the_files_by_their_exit_codes(write_workbook, reference_cache, xls_path, tmp_path):
+    shutil.move(write_workbook(3), xls_path)
+    shutil.move(write_workbook(3, name="Отчет.xlsx"), xls_path)
+    process: subprocess.CompletedProcess = run_once(get_environment(reference_cache, tmp_path), tmp_path)
+    assert process.returncode == 0, process.stderr
+    assert sorted(os.listdir(xls_path)) == ["done", "error_Отчет.xlsx", "json"]
+    assert os.listdir(os.path.join(xls_path, "done")) == ["ОП_2024_3.xlsx"]
+    assert os.listdir(os.path.join(xls_path, "json")) == ["ОП_2024_3.xlsx.json"]
+
+
+def test_worker_goes_on_after_an_unexpected_exception(write_workbook, reference_cache, xls_path, tmp_path):
+    for index in range(2):
+        shutil.move(write_workbook(3, name=f"ОП_2024_{index}.xlsx"), xls_path)
+    environment: dict = dict(
+        get_environment(reference_cache, tmp_path), DKP_REFERENCE_CACHE=str(tmp_path / "missing.json")
+    )
+    process: subprocess.CompletedProcess = run_once(environment, tmp_path)
+    assert process.returncode == 0, process.stderr
+    assert sorted(os.listdir(xls_path)) == ["done", "error_ОП_2024_0.xlsx", "error_ОП_2024_1.xlsx", "json"]
+    log: str = read_log(tmp_path)
+    assert log.count("MissingReferenceSnapshot") >= 2
+    assert log.count("is processed with exit code 6") == 2
+
+
+def test_worker_converts_the_files_written_into_the_watched_directory(
+    write_workbook, reference_cache, xls_path, tmp_path
+):
+    watcher = open_watcher(xls_path)
+    if watcher is None:
+        pytest.skip("inotify is not available")
+    watcher.close()
+    path: str = write_workbook(3)
+    worker: subprocess.Popen = subprocess.Popen(
+        [sys.executable, WORKER_PATH, "--poll-interval", "0.1", "--min-age", "3600"],
+        cwd=tmp_path, env=get_environment(reference_cache, tmp_path), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    try:
+        done_path: str = os.path.join(xls_path, "done", os.path.basename(path))
+        deadline: float = time.time() + 60
+        while "with inotify" not in read_log(tmp_path) and time.time() < deadline:
+            time.sleep(0.1)
+        # The worker is told about the file when it is closed after writing, long before `min_age`
+        shutil.copyfile(path, os.path.join(xls_path, os.path.basename(path)))
+        deadline = time.time() + 60
+        while not os.path.exists(done_path) and time.time() < deadline:
+            time.sleep(0.1)
+        assert os.path.exists(done_path)
+        assert os.listdir(os.path.join(xls_path, "json")) == ["ОП_2024_3.xlsx.json"]
+    finally:
+        worker.send_signal(signal.SIGTERM)
+        worker.communicate(timeout=60)
+    assert worker.returncode == 0
@@ -0,0 +1,81 @@
+import os
+import pytest
+import importlib
+from types import SimpleNamespace
+from header_index import BLOCKS, COLUMNS, HeaderIndex
+
+COLUMN_NAMES: dict = {
+    "client": ("Клиент", "Контрагент"),
+    "project": ("Проект",),
+    "description": ("Описание", "Комментарий"),
+    "comment": ("Комментарий",)
+}
+BLOCK_NAMES: dict = {"natural_indicators_ktk": ("Натуральные показатели, ктк",)}
+BLOCK_TABLE_COLUMNS: dict = {"natural_indicators_ktk": {"ktk_jan": ("янв",), "ktk_feb": ("фев",)}}
+
+
+@pytest.fixture
+def index() -> HeaderIndex:
+    return HeaderIndex(COLUMN_NAMES, BLOCK_NAMES, BLOCK_TABLE_COLUMNS)
+
+
+@pytest.fixture(scope="module")
+def dkp(tmp_path_factory):
+    # The logs of the module go to the working directory
+    cwd: str = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("dkp"))
+    try:
+        return importlib.import_module("dkp")
+    finally:
+        os.chdir(cwd)
+
+
+def get_columns_position(dkp, index: HeaderIndex, row: list, block_position: list, group: str) -> dict:
+    converter = SimpleNamespace(header_index=index, _remove_symbols_in_columns=dkp.DKP._remove_symbols_in_columns)
+    dict_columns_position: dict = dict.fromkeys(["client", "project", "description", "comment"])
+    dkp.DKP.get_columns_position(converter, row, block_position, group, dict_columns_position)
+    return dict_columns_position
+
+
+def test_lookup(index: HeaderIndex):
+    assert index.lookup("Контрагент", COLUMNS) == ("client",)
+    assert index.lookup("Натуральные показатели, ктк", BLOCKS) == ("natural_indicators_ktk",)
+    assert index.lookup("фев", "natural_indicators_ktk") == ("ktk_feb",)
+
+
+def test_lookup_of_a_text_of_several_columns(index: HeaderIndex):
+    assert index.lookup("Комментарий", COLUMNS) == ("description", "comment")
+
+
+@pytest.mark.parametrize("text", ["Неизвестно", None, 1.0, ""])
+def test_lookup_of_unknown_text(index: HeaderIndex, text):
+    assert index.lookup(text, COLUMNS) == ()
+    assert not index.is_column_name(text)
+
+
+def test_groups_are_separate(index: HeaderIndex):
+    assert index.lookup("янв", COLUMNS) == ()
+    assert index.lookup("Клиент", "natural_indicators_ktk") == ()
+    assert index.is_column_name("Проект")
+    assert not index.is_column_name("янв")
+
+
+def test_last_matching_column_wins(dkp, index: HeaderIndex):
+    row: list = ["Клиент", "Проект", "Контрагент", "  Клиент\n", "Описание"]
+    assert get_columns_position(dkp, index, row, [0, len(row)], COLUMNS) == {
+        "client": 3, "project": 1, "description": 4, "comment": None
+    }
+
+
+def test_text_of_several_columns_sets_all_of_them(dkp, index: HeaderIndex):
+    row: list = ["Описание", "Комментарий"]
+    assert get_columns_position(dkp, index, row, [0, len(row)], COLUMNS) == {
+        "client": None, "project": None, "description": 1, "comment": 1
+    }
+
+
+def test_only_the_block_is_searched(dkp, index: HeaderIndex):
+    row: list = ["Клиент", "Проект", "Клиент", "Проект"]
+    assert get_columns_position(dkp, index, row, [1, 3], COLUMNS) == {
+        "client": 2, "project": 1, "description": None, "comment": None
+    }
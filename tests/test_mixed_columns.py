@@ -0,0 +1,67 @@
+import os
+import json
+import pytest
+import subprocess
+from record_batch import RecordBatch
+
+# container_size, *_tax and *_separation hold both numbers and text in the real files
+CELLS: dict = {
+    (0, "container_size", None): "40HC",
+    (1, "tax", "service"): "без НДС",
+    (2, "separation", "co_executor"): "частично"
+}
+
+
+def test_text_in_mixed_columns_is_kept(write_workbook, run_dkp, tmp_path):
+    output_folder: str = str(tmp_path / "output")
+    os.makedirs(output_folder)
+    process: subprocess.CompletedProcess = run_dkp(write_workbook(3, CELLS), output_folder)
+    assert process.returncode == 0, process.stderr
+    with open(os.path.join(output_folder, "ОП_2024_3.xlsx.json"), encoding="utf-8") as f:
+        records: list = json.load(f)
+    assert len(records) == 36
+    assert {record["container_size"] for record in records[:12]} == {"40HC"}
+    assert all(isinstance(record["container_size"], int) for record in records[12:])
+    assert {record["service_tax"] for record in records[12:24]} == {"без НДС"}
+    assert all(isinstance(record["service_tax"], float) for record in records[:12] + records[24:])
+    assert {record["co_executor_separation"] for record in records[24:]} == {"частично"}
+    assert all(isinstance(record["co_executor_separation"], bool) for record in records[:24])
+    assert not os.path.exists(tmp_path / "errors")
+
+
+def test_parquet_writes_text_of_mixed_columns_next_to_them(tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet", exc_type=ImportError)
+    from writers import ParquetWriter
+    writer: ParquetWriter = ParquetWriter(str(tmp_path), "ОП_2024.xlsx")
+    writer.write(RecordBatch(
+        ["client", "container_size", "service_separation", "service_tax", "service_fee"],
+        {
+            "client": ["a", "b", "c"],
+            "container_size": [40, "40HC", None],
+            "service_separation": [True, "частично", False],
+            "service_tax": [1.5, "без НДС", 3],
+            "service_fee": [1.0, 2.0, None]
+        },
+        {}
+    ))
+    table = pyarrow_parquet.read_table(writer.close())
+    assert [(field.name, str(field.type)) for field in table.schema] == [
+        ("client", "dictionary<values=string, indices=int32, ordered=0>"),
+        ("container_size", "double"),
+        ("container_size_text", "string"),
+        ("service_separation", "bool"),
+        ("service_separation_text", "string"),
+        ("service_tax", "double"),
+        ("service_tax_text", "string"),
+        ("service_fee", "double")
+    ]
+    assert table.to_pydict() == {
+        "client": ["a", "b", "c"],
+        "container_size": [40.0, None, None],
+        "container_size_text": [None, "40HC", None],
+        "service_separation": [True, None, False],
+        "service_separation_text": [None, "частично", None],
+        "service_tax": [1.5, None, 3.0],
+        "service_tax_text": [None, "без НДС", None],
+        "service_fee": [1.0, 2.0, None]
+    }
@@ -0,0 +1,328 @@
+import os
+import ssl
+import json
+import time
+import base64
+import shutil
+import pytest
+import threading
+import subprocess
+import socketserver
+import email.policy
+import __init__ as settings
+from email import message_from_bytes
+from typing import Callable, Dict, List
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from notifications import NotificationDispatcher
+
+ENVIRONMENT: Dict[str, str] = {
+    "TOKEN_TELEGRAM": "token",
+    "CHAT_ID": "chat",
+    "TOPIC": "topic",
+    "ID": "1",
+    "EMAIL_USER": "dkp@example.com",
+    "EMAIL_PASSWORD": "password",
+    "RECIPIENT_EMAIL": "team@example.com",
+    "NO_PROXY": "127.0.0.1"
+}
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests.append({"path": url.path, "params": parse_qs(url.query), "at": time.monotonic()})
+        status: int = self.server.statuses.pop(0) if self.server.statuses else 200
+        body: bytes = json.dumps({"ok": status == 200}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """
+    Understands just enough of SMTP for smtplib: EHLO, STARTTLS, AUTH PLAIN, MAIL, RCPT, DATA and QUIT.
+    """
+    def reply(self, *lines: str) -> None:
+        self.wfile.write("".join(f"{line}\r\n" for line in lines).encode())
+
+    def handle(self):
+        is_tls: bool = False
+        self.reply("220 stub ESMTP")
+        while line := self.rfile.readline():
+            verb, _, argument = line.decode().strip().partition(" ")
+            verb = verb.upper()
+            if verb == "EHLO":
+                self.reply("250-stub", *([] if is_tls else ["250-STARTTLS"]), "250 AUTH PLAIN")
+            elif verb == "STARTTLS":
+                self.reply("220 ready")
+                self.connection = self.server.context.wrap_socket(self.connection, server_side=True)
+                self.rfile = self.connection.makefile("rb")
+                self.wfile = self.connection.makefile("wb", buffering=0)
+                is_tls = True
+            elif verb == "AUTH":
+                self.server.logins.append(base64.b64decode(argument.split(" ")[1]).split(b"\0")[1:])
+                self.reply("235 ok")
+            elif verb in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 ok")
+            elif verb == "DATA":
+                self.reply("354 go on")
+                data: List[bytes] = []
+                while (line := self.rfile.readline()) != b".\r\n":
+                    data.append(line[1:] if line.startswith(b".") else line)
+                message = message_from_bytes(b"".join(data), policy=email.policy.default)
+                self.server.messages.append({"is_tls": is_tls, "message": message})
+                self.reply("250 queued")
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class SMTPStubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(server: socketserver.BaseServer):
+    thread: threading.Thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_for(condition: Callable[[], bool], timeout: float = 10.0) -> None:
+    deadline: float = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.02)
+
+
+@pytest.fixture(scope="session")
+def certificate(tmp_path_factory) -> str:
+    if shutil.which("openssl") is None:
+        pytest.skip("The SMTP stub needs openssl to make a certificate for STARTTLS")
+    folder = tmp_path_factory.mktemp("smtp")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+            "-keyout", str(folder / "stub.pem"), "-out", str(folder / "stub.pem")
+        ],
+        check=True,
+        capture_output=True
+    )
+    return str(folder / "stub.pem")
+
+
+@pytest.fixture
+def telegram_stub():
+    server: ThreadingHTTPServer = ThreadingHTTPServer(("127.0.0.1", 0), TelegramStubHandler)
+    server.requests = []
+    server.statuses = []
+    serve(server)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def smtp_stub(certificate: str):
+    server: SMTPStubServer = SMTPStubServer(("127.0.0.1", 0), SMTPStubHandler)
+    server.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server.context.load_cert_chain(certificate)
+    server.logins = []
+    server.messages = []
+    serve(server)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def senders(monkeypatch, telegram_stub, smtp_stub) -> Dict[str, Callable[[str], None]]:
+    for name, value in ENVIRONMENT.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(settings, "TELEGRAM_API_URL", f"http://127.0.0.1:{telegram_stub.server_port}")
+    monkeypatch.setattr(settings, "EMAIL_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "EMAIL_PORT", smtp_stub.server_address[1])
+    monkeypatch.setattr(settings, "NOTIFY_TIMEOUT", 5.0)
+    return {"telegram": settings.send_telegram, "email": settings.send_email_notifiers}
+
+
+@pytest.fixture
+def outbox(tmp_path) -> str:
+    return str(tmp_path / "outbox")
+
+
+def get_texts(telegram_stub) -> List[str]:
+    return [request["params"]["text"][0] for request in telegram_stub.requests]
+
+
+def get_email_texts(smtp_stub) -> List[str]:
+    return [item["message"].get_content().replace("\r\n", "\n").strip() for item in smtp_stub.messages]
+
+
+def read_outbox(outbox: str) -> List[dict]:
+    messages: list = []
+    for name in sorted(os.listdir(outbox)):
+        with open(os.path.join(outbox, name), encoding="utf-8") as f:
+            messages.append(json.load(f))
+    return messages
+
+
+def test_send_telegram(senders: dict, telegram_stub):
+    assert senders["telegram"]("Файл не обработан") == 200
+    assert telegram_stub.requests[0]["path"] == "/bottoken/sendMessage"
+    assert telegram_stub.requests[0]["params"] == {
+        "chat_id": ["chat/topic"], "text": ["Файл не обработан"], "reply_to_message_id": ["1"]
+    }
+
+
+def test_send_telegram_raises_when_it_is_not_accepted(senders: dict, telegram_stub):
+    telegram_stub.statuses.append(500)
+    with pytest.raises(settings.requests.HTTPError):
+        senders["telegram"]("Файл не обработан")
+
+
+def test_send_email(senders: dict, smtp_stub):
+    senders["email"]("Файл не обработан")
+    assert smtp_stub.logins == [[b"dkp@example.com", b"password"]]
+    assert len(smtp_stub.messages) == 1
+    assert smtp_stub.messages[0]["is_tls"]
+    message = smtp_stub.messages[0]["message"]
+    assert (message["From"], message["To"]) == ("dkp@example.com", "team@example.com")
+    assert get_email_texts(smtp_stub) == ["Файл не обработан"]
+
+
+def test_burst_is_sent_as_one_digest(senders: dict, telegram_stub, smtp_stub, outbox: str):
+    dispatcher: NotificationDispatcher = NotificationDispatcher(outbox, senders, coalesce_window=0.5).start()
+    for message in ["Ошибка в строке 1", "Пустой файл", "Ошибка в строке 1"]:
+        dispatcher.notify(message)
+    wait_for(lambda: telegram_stub.requests and smtp_stub.messages)
+    dispatcher.stop()
+    digest: str = "Сводка уведомлений (3):\n- Ошибка в строке 1 (x2)\n- Пустой файл"
+    assert get_texts(telegram_stub) == [digest]
+    assert get_email_texts(smtp_stub) == [digest]
+    assert os.listdir(outbox) == []
+
+
+def test_single_message_is_sent_as_is(senders: dict, telegram_stub, outbox: str):
+    dispatcher: NotificationDispatcher = NotificationDispatcher(outbox, senders, coalesce_window=0.1).start()
+    dispatcher.notify("Пустой файл")
+    dispatcher.stop()
+    assert get_texts(telegram_stub) == ["Пустой файл"]
+
+
+def test_failed_channel_is_retried_with_backoff(senders: dict, telegram_stub, smtp_stub, outbox: str):
+    telegram_stub.statuses += [500, 500]
+    dispatcher: NotificationDispatcher = NotificationDispatcher(
+        outbox, senders, coalesce_window=0, poll_interval=0.05, max_backoff=0.3
+    ).start()
+    dispatcher.notify("Пустой файл")
+    wait_for(lambda: len(telegram_stub.requests) == 3 and not os.listdir(outbox))
+    dispatcher.stop()
+    assert get_texts(telegram_stub) == ["Пустой файл"] * 3
+    times: List[float] = [request["at"] for request in telegram_stub.requests]
+    assert times[1] - times[0] >= 0.3 and times[2] - times[1] >= 0.3
+    assert len(smtp_stub.messages) == 1
+
+
+def test_message_is_dropped_after_max_attempts(senders: dict, telegram_stub, outbox: str):
+    telegram_stub.statuses += [500] * 10
+    dispatcher: NotificationDispatcher = NotificationDispatcher(
+        outbox, senders, coalesce_window=0, poll_interval=0.05, max_attempts=2, max_backoff=0.05
+    ).start()
+    dispatcher.notify("Пустой файл")
+    wait_for(lambda: len(telegram_stub.requests) == 2 and not os.listdir(outbox))
+    time.sleep(0.3)
+    dispatcher.stop()
+    assert len(telegram_stub.requests) == 2
+
+
+def test_outbox_survives_restart(senders: dict, telegram_stub, smtp_stub, outbox: str):
+    telegram_stub.statuses += [500] * 10
+    first: NotificationDispatcher = NotificationDispatcher(outbox, senders, coalesce_window=0).start()
+    first.notify("Пустой файл")
+    first.stop()
+    [message] = read_outbox(outbox)
+    assert (message["text"], message["channels"]) == ("Пустой файл", ["telegram"])
+    telegram_stub.statuses.clear()
+    second: NotificationDispatcher = NotificationDispatcher(outbox, senders, poll_interval=0.05).start()
+    wait_for(lambda: not os.listdir(outbox))
+    second.stop()
+    assert telegram_stub.requests[-1]["params"]["text"] == ["Пустой файл"]
+    assert len(telegram_stub.requests) == message["attempts"] + 1
+    assert len(smtp_stub.messages) == 1
+
+
+def test_notify_without_a_running_dispatcher_is_sent_later(senders: dict, telegram_stub, outbox: str):
+    NotificationDispatcher(outbox, senders).notify("Пустой файл")
+    assert read_outbox(outbox) == [{"text": "Пустой файл", "channels": ["telegram", "email"], "attempts": 0}]
+    dispatcher: NotificationDispatcher = NotificationDispatcher(outbox, senders, poll_interval=0.05).start()
+    wait_for(lambda: not os.listdir(outbox))
+    dispatcher.stop()
+    assert get_texts(telegram_stub) == ["Пустой файл"]
+
+
+def write_claim(outbox: str, name: str, pid: int) -> str:
+    os.makedirs(outbox, exist_ok=True)
+    path: str = os.path.join(outbox, f"{name}.json.{pid}.sending")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"text": name, "channels": ["telegram"], "attempts": 0}, f)
+    return path
+
+
+def get_finished_pid() -> int:
+    process: subprocess.Popen = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+
+def test_claims_of_running_processes_are_skipped(senders: dict, telegram_stub, outbox: str):
+    path: str = write_claim(outbox, "claimed", os.getpid())
+    dispatcher: NotificationDispatcher = NotificationDispatcher(outbox, senders, poll_interval=0.05).start()
+    time.sleep(0.3)
+    dispatcher.stop()
+    assert telegram_stub.requests == []
+    assert os.listdir(outbox) == [os.path.basename(path)]
+
+
+def test_claims_of_finished_processes_are_taken_over(senders: dict, telegram_stub, outbox: str):
+    write_claim(outbox, "orphaned", get_finished_pid())
+    dispatcher: NotificationDispatcher = NotificationDispatcher(outbox, senders, poll_interval=0.05).start()
+    wait_for(lambda: not os.listdir(outbox))
+    dispatcher.stop()
+    assert get_texts(telegram_stub) == ["orphaned"]
+
+
+def test_claimed_message_is_taken_by_one_dispatcher_only(senders: dict, outbox: str):
+    first: NotificationDispatcher = NotificationDispatcher(outbox, senders)
+    second: NotificationDispatcher = NotificationDispatcher(outbox, senders)
+    first.notify("Пустой файл")
+    claimed: list = first._claim_messages()
+    assert [message["text"] for _, message in claimed] == ["Пустой файл"]
+    assert claimed[0][0].endswith(f".json.{os.getpid()}.sending")
+    assert second._claim_messages() == []
+    first._release_messages(claimed)
+    assert [message["text"] for _, message in second._claim_messages()] == ["Пустой файл"]
+
+
+def test_notifications_of_batch_workers_are_sent(telegram_stub, smtp_stub, write_workbook, run_dkp, tmp_path):
+    paths: list = [write_workbook(3, name=f"Отчет_{index}.xlsx") for index in range(2)]
+    process: subprocess.CompletedProcess = run_dkp(
+        *paths, str(tmp_path), "--batch", "--workers", "2",
+        TELEGRAM_API_URL=f"http://127.0.0.1:{telegram_stub.server_port}",
+        EMAIL_HOST="127.0.0.1",
+        EMAIL_PORT=str(smtp_stub.server_address[1]),
+        **ENVIRONMENT
+    )
+    assert process.returncode == 1
+    assert os.listdir(tmp_path / "outbox") == []
+    texts: List[str] = get_texts(telegram_stub)
+    assert texts and all(os.path.basename(path) in "".join(texts) for path in paths)
+    assert "".join(get_email_texts(smtp_stub)) == "".join(texts)
@@ -0,0 +1,51 @@
+import os
+import json
+import subprocess
+from conftest import SECOND_SHEET_NAME
+from synthetic_workbook import SHEET_NAME
+
+SHEETS: tuple = (SHEET_NAME, SECOND_SHEET_NAME)
+
+
+def read_records(path) -> list:
+    with open(path, encoding="utf-8") as f:
+        records: list = json.load(f)
+    for record in records:
+        record.pop("original_file_parsed_on")
+    return records
+
+
+def read_log(tmp_path) -> str:
+    with open(tmp_path / "logging" / "dkp.log", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_sheets_parsed_in_parallel_are_the_same_as_parsed_one_by_one(write_workbook, run_dkp, tmp_path):
+    path: str = write_workbook(3, sheets=SHEETS)
+    outputs: list = []
+    for workers in ("1", "2"):
+        output_folder: str = str(tmp_path / f"output_{workers}")
+        os.makedirs(output_folder)
+        process: subprocess.CompletedProcess = run_dkp(path, output_folder, "--sheet-workers", workers)
+        assert process.returncode == 0, process.stderr
+        outputs.append(read_records(os.path.join(output_folder, f"{os.path.basename(path)}.json")))
+    sequential, parallel = outputs
+    assert len(sequential) == 72
+    assert [record["sheet_name"] for record in sequential] == [SHEET_NAME] * 36 + [SECOND_SHEET_NAME] * 36
+    assert parallel == sequential
+    assert "Parsing 2 sheets in 2 processes" in read_log(tmp_path)
+
+
+def test_batch_workers_parse_the_sheets_themselves(write_workbook, run_dkp, tmp_path):
+    paths: list = [write_workbook(3, sheets=SHEETS, name=f"ОП_2024_{index}.xlsx") for index in range(2)]
+    output_folder: str = str(tmp_path / "output")
+    os.makedirs(output_folder)
+    process: subprocess.CompletedProcess = run_dkp(
+        *paths, output_folder, "--batch", "--workers", "2", "--sheet-workers", "2"
+    )
+    assert process.returncode == 0, process.stderr
+    first, second = (read_records(os.path.join(output_folder, f"{os.path.basename(path)}.json")) for path in paths)
+    assert len(first) == 72
+    assert [dict(record, original_file_name=None) for record in second] == \
+        [dict(record, original_file_name=None) for record in first]
+    assert "Parsing 2 sheets" not in read_log(tmp_path)
@@ -0,0 +1,78 @@
+import numpy as np
+from unpivot import get_month_columns, unpivot_months
+
+MONTH_NAMES: list = ["янв", "фев", "мар"]
+BLOCK_COLUMNS: dict = {
+    "ktk_jan": ("янв",),
+    "ktk_jan_total": ("янв", "итого"),
+    "ktk_mar": ("мар",)
+}
+
+
+def array(*values) -> np.ndarray:
+    result: np.ndarray = np.empty(len(values), dtype=object)
+    result[:] = values
+    return result
+
+
+def test_get_month_columns_takes_the_first_column_of_the_month():
+    assert get_month_columns(BLOCK_COLUMNS, MONTH_NAMES) == ["ktk_jan", None, "ktk_mar"]
+
+
+def test_unpivot_months():
+    columns: dict = {
+        "client": array("Клиент 1", "Клиент 2"),
+        "rate": array(10.5, None),
+        "ktk_jan": array(1, 4),
+        "ktk_mar": array(3, None),
+        "teu_jan": array(2, 8),
+        "teu_feb": array(None, 10),
+        "teu_mar": array(6, 12)
+    }
+    long_columns: dict = unpivot_months(
+        columns,
+        ["client", "rate"],
+        {"container_count": ["ktk_jan", None, "ktk_mar"], "teu": ["teu_jan", "teu_feb", "teu_mar"]},
+        MONTH_NAMES,
+        2024
+    )
+    assert list(long_columns) == ["client", "rate", "month", "month_string", "date", "container_count", "teu"]
+    assert {column: values.tolist() for column, values in long_columns.items()} == {
+        "client": ["Клиент 1"] * 3 + ["Клиент 2"] * 3,
+        "rate": [10.5] * 3 + [None] * 3,
+        "month": [1, 2, 3] * 2,
+        "month_string": MONTH_NAMES * 2,
+        "date": ["2024-01-01", "2024-02-01", "2024-03-01"] * 2,
+        "container_count": [1, None, 3, 4, None, None],
+        "teu": [2, None, 6, 8, 10, 12]
+    }
+
+
+def test_unpivot_months_is_the_same_as_the_loop_over_rows_and_months():
+    rng: np.random.Generator = np.random.default_rng(0)
+    month_names: list = [f"m{index}" for index in range(1, 13)]
+    columns: dict = {"client": array(*(f"Клиент {index}" for index in range(5)))}
+    for index, month in enumerate(month_names):
+        columns[month] = array(*rng.integers(0, 60, 5).tolist())
+    month_columns: dict = {"container_count": [month if index % 4 else None for index, month in enumerate(month_names)]}
+    long_columns: dict = unpivot_months(columns, ["client"], month_columns, month_names, 2023)
+    records: list = [
+        {
+            "client": columns["client"][row],
+            "month": index_month,
+            "month_string": month_string,
+            "date": f"2023-{index_month:02d}-01",
+            "container_count": columns[key][row] if (key := month_columns["container_count"][index_month - 1]) else None
+        }
+        for row in range(5)
+        for index_month, month_string in enumerate(month_names, 1)
+    ]
+    assert [dict(zip(long_columns, values)) for values in zip(*(v.tolist() for v in long_columns.values()))] == records
+
+
+def test_unpivot_months_of_an_empty_table():
+    long_columns: dict = unpivot_months(
+        {"client": array(), "ktk_jan": array()}, ["client"], {"container_count": ["ktk_jan", None, None]},
+        MONTH_NAMES, 2024
+    )
+    assert all(len(values) == 0 for values in long_columns.values())
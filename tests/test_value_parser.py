@@ -0,0 +1,130 @@
+import re
+import pytest
+import numpy as np
+import pandas as pd
+from column_schema import AUTO, BOOLEAN, DATE, NUMERIC, TEXT
+from value_parser import (
+    TableParser, parse_boolean_column, parse_column, parse_date_column, parse_numeric_column, parse_text_column
+)
+
+# The cells of the quirks of the per-cell conversion that parse_column keeps
+CELLS: list = [
+    None, "", "   ", " abc ", "Да", "NO", "yes ", "нет", "0", "42", "-7", "+5", " 12 ", "007", "1_000",
+    "12.5", "-0.5", ".5", "5.", "1.5e3", "1 000", "1\u00a0000", "1e5", "12,5", "1,234.5", "nan", "inf",
+    "1.2.3", "9" * 25, "12 abc"
+]
+
+
+def parse_value(value):
+    """
+    The conversion of a single cell before the columns were converted at once (DKP.get_content_in_table).
+    """
+    if not value:
+        return None
+    stripped_value: str = value.strip()
+    lower_value: str = stripped_value.lower()
+    if lower_value in {"да", "yes"}:
+        return True
+    elif lower_value in {"нет", "no"}:
+        return False
+    try:
+        float(re.sub(r'(?<=\d) (?=\d)', '', stripped_value))
+    except ValueError:
+        return stripped_value
+    try:
+        return float(stripped_value) if '.' in stripped_value else int(stripped_value)
+    except (ValueError, TypeError):
+        return stripped_value
+
+
+def typed(values) -> list:
+    return [(type(value), value) for value in values]
+
+
+def column(*values) -> pd.Series:
+    return pd.Series(list(values), dtype=object)
+
+
+def test_parse_column_is_the_same_as_the_conversion_of_single_cells():
+    assert typed(parse_column(column(*CELLS))) == typed(parse_value(cell) for cell in CELLS)
+
+
+@pytest.mark.parametrize("cell", ["1 000", "1e5", "12,5"])
+def test_parse_column_keeps_the_numbers_the_cell_conversion_does_not_accept(cell: str):
+    assert typed(parse_column(column(cell))) == [(str, cell)]
+
+
+def test_parse_column_raises_on_values_that_are_not_strings():
+    with pytest.raises(TypeError):
+        parse_column(column("1", 2))
+
+
+def test_parse_numeric_column():
+    values, violations = parse_numeric_column(column(
+        "1 000", "1\u00a01 000 000", "1e5", "12,5", "-3", " 4.25 ", "1_000", None, "", "  "
+    ))
+    assert typed(values) == typed([1000, 11000000, 100000.0, 12.5, -3, 4.25, 1000, None, None, None])
+    assert not violations.any()
+
+
+@pytest.mark.parametrize("cell", ["abc", "1,234.5", "12,5,0", "1 000,", "да", "1 e5"])
+def test_parse_numeric_column_violations(cell: str):
+    values, violations = parse_numeric_column(column("1", cell))
+    assert typed(values) == [(int, 1), (type(None), None)]
+    assert violations.tolist() == [False, True]
+
+
+def test_parse_numeric_column_of_a_huge_integer():
+    values, violations = parse_numeric_column(column("9" * 25, "1"))
+    assert typed(values) == [(int, int("9" * 25)), (int, 1)]
+    assert not violations.any()
+
+
+def test_parse_boolean_column():
+    values, violations = parse_boolean_column(column("Да", " no ", "YES", "нет", "", None, "1", "может быть"))
+    assert typed(values) == typed([True, False, True, False, None, None, None, None])
+    assert violations.tolist() == [False] * 6 + [True] * 2
+
+
+def test_parse_text_column():
+    values, violations = parse_text_column(column(" Клиент ", "", None, "12"))
+    assert values.tolist() == ["Клиент", None, None, "12"]
+    assert not violations.any()
+
+
+def test_parse_date_column_tries_the_formats_in_order():
+    values, violations = parse_date_column(
+        column("31.01.2024", "2024-02-01", "02/03/24", "32.01.2024", None), ["%d.%m.%Y", "%Y-%m-%d", "%m/%d/%y"]
+    )
+    assert values.tolist() == ["2024-01-31", "2024-02-01", "2024-02-03", None, None]
+    assert violations.tolist() == [False, False, False, True, False]
+
+
+def test_table_parser():
+    parser: TableParser = TableParser(
+        {"client": 0, "container_size": 1, "separation": 2, "teu": 1, "missing": None, "comment": 3},
+        {"client": TEXT, "container_size": NUMERIC, "separation": BOOLEAN, "teu": NUMERIC, "comment": AUTO}
+    )
+    columns: dict = parser.parse([
+        [" Клиент 1", "40", "да", "12,5"],
+        ["Клиент 2", "сорок", "нет", "1 000"],
+        ["Клиент 3", "20", "возможно", None]
+    ])
+    assert list(columns) == ["client", "container_size", "separation", "teu", "missing", "comment"]
+    assert columns["client"].tolist() == ["Клиент 1", "Клиент 2", "Клиент 3"]
+    assert columns["container_size"].tolist() == [40, None, 20]
+    assert columns["separation"].tolist() == [True, False, None]
+    assert columns["teu"] is columns["container_size"]
+    assert columns["missing"].tolist() == [None] * 3
+    assert typed(columns["comment"]) == [(str, "12,5"), (str, "1 000"), (type(None), None)]
+    assert parser.violations == {
+        "container_size": [(1, "сорок")], "teu": [(1, "сорок")], "separation": [(2, "возможно")]
+    }
+
+
+def test_table_parser_dates():
+    parser: TableParser = TableParser({"date": 0}, {"date": DATE}, ["%d.%m.%Y"])
+    assert parser.parse([["01.02.2024"], ["2024"]])["date"].tolist() == ["2024-02-01", None]
+    assert parser.violations == {"date": [(1, "2024")]}
+    assert isinstance(parser.parse([["01.02.2024"]])["date"], np.ndarray)
+    assert parser.violations == {}